@@ -0,0 +1,397 @@
+"""
+Async (ASGI) entry point for examinator.
+
+The quiz flow (/quiz, /quiz/save, /quiz/sync, /exam_summary and the submit) is served
+natively on the event loop: session reads and writes, attempt-store updates and
+grading run in worker threads, so a candidate waiting on slow storage does not
+hold a worker. Any other path is handed to the Flask app through a streaming
+WSGI bridge, so every existing route keeps working.
+
+Run it with any ASGI server, e.g.:
+
+    uvicorn asgi:app --workers 4
+
+The deadlines of the attempts in progress and the housekeeper start with the
+server's lifespan startup event.
+"""
+# Base imports
+import asyncio
+import concurrent.futures
+import io
+import json
+import sys
+import threading
+from http.cookies import SimpleCookie
+from typing import List, Dict, Any, Tuple, Optional
+from urllib.parse import parse_qs
+
+# custom imports
+import examinator
+from examinator import check_deadline, save_answers, sync_answers, page_context, process_exam_results, attempt_questions
+from examinator import PREFETCH_HEADER
+from examinator import generate_quiz_html, generate_summary_html
+from events import bus, format_sse
+from tenants import tenant_for_host, use_tenant
+from compression import compress_asgi
+
+flask_app = examinator.app
+
+# ---------------------| Sessions |------------------
+
+def _session_id(scope) -> Optional[str]:
+    cookie_name = flask_app.config['SESSION_COOKIE_NAME']
+    for name, value in scope['headers']:
+        if name == b'cookie':
+            cookie = SimpleCookie(value.decode('latin-1'))
+            if cookie_name in cookie:
+                return cookie[cookie_name].value
+    return None
+
+
+async def load_session(scope) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """
+    Read the session of the request from the same store the Flask app uses.
+    """
+    sid = _session_id(scope)
+    if not sid:
+        return None, None
+    interface = flask_app.session_interface
+    data = await asyncio.to_thread(interface.cache.get, interface.key_prefix + sid)
+    return sid, data
+
+
+async def store_session(sid: str, data: Dict[str, Any]):
+    interface = flask_app.session_interface
+    await asyncio.to_thread(interface.cache.set, interface.key_prefix + sid, dict(data),
+                            int(flask_app.permanent_session_lifetime.total_seconds()))
+
+# ---------------------| Responses |------------------
+
+async def send_response(send, status: int, body: bytes = b'', headers: List[Tuple[bytes, bytes]] = None):
+    headers = list(headers or [])
+    headers.append((b'content-length', str(len(body)).encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_html(send, html: str):
+    await send_response(send, 200, html.encode('utf-8'), [(b'content-type', b'text/html; charset=utf-8')])
+
+
+async def send_json(send, payload: Any, status: int = 200):
+    await send_response(send, status, json.dumps(payload).encode('utf-8'), [(b'content-type', b'application/json')])
+
+
+async def send_redirect(send, location: str):
+    await send_response(send, 302, b'', [(b'location', location.encode('utf-8'))])
+
+
+async def send_stream(send, chunks):
+    """
+    Stream an HTML page chunk by chunk; the chunks are produced in a worker thread.
+    """
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'text/html; charset=utf-8')]})
+    chunks = iter(chunks)
+    while True:
+        chunk = await asyncio.to_thread(next, chunks, None)
+        if chunk is None:
+            break
+        await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def send_page(send, page):
+    # Les funcions compartides retornen HTML, una pàgina en streaming o bé una redirecció de werkzeug
+    if isinstance(page, str):
+        await send_html(send, page)
+    elif hasattr(page, 'location'):
+        await send_redirect(send, page.location)
+    else:
+        await send_stream(send, page)
+
+
+async def read_body(receive) -> bytes:
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def read_form(receive) -> Dict[str, List[str]]:
+    return parse_qs((await read_body(receive)).decode('utf-8'), keep_blank_values=True)
+
+# ---------------------| Quiz flow |------------------
+
+async def quiz(scope, receive, send, sid, data):
+    expired = await asyncio.to_thread(check_deadline, data)
+    if expired:
+        await store_session(sid, data)
+        return await send_page(send, expired)
+    if 'exam' not in data:
+        return await send_redirect(send, '/')
+
+    if scope['method'] == 'POST':
+        form = await read_form(receive)
+        await asyncio.to_thread(save_answers, data, form)
+        await store_session(sid, data)
+
+        if form.get('action', [''])[0] == 'Finish Exam':
+            return await send_redirect(send, '/exam_summary')
+        navigation = form.get('navigation', [''])[0]
+        current_page = int(form.get('current_page', ['1'])[0])
+        if navigation in ('Previous', 'prev'):
+            current_page -= 1
+        elif navigation in ('Next', 'next'):
+            current_page += 1
+        return await send_redirect(send, f'/quiz?page={current_page}')
+
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    current_page = int(query.get('page', ['1'])[0])
+    prefetch = PREFETCH_HEADER.lower().encode() in dict(scope['headers'])
+    # Les preguntes poden venir del disc (mapar el banc i descodificar-les): fora del bucle
+    page_questions, saved_answers = await asyncio.to_thread(page_context, data, current_page, publish=not prefetch)
+    html = await asyncio.to_thread(generate_quiz_html, page_questions, current_page, data['exam']['count'],
+                                   saved_answers, data.get('deadline'), data.get('attempt_id'),
+                                   max(data.get('answer_seqs', {}).values(), default=0))
+    await send_html(send, html)
+
+
+async def quiz_save(scope, receive, send, sid, data):
+    form = await read_form(receive)
+    expired = await asyncio.to_thread(check_deadline, data)
+    if expired or 'exam' not in data:
+        if expired:
+            await store_session(sid, data)
+        return await send_response(send, 409)
+    await asyncio.to_thread(save_answers, data, form)
+    await store_session(sid, data)
+    await send_response(send, 204)
+
+
+async def quiz_sync(scope, receive, send, sid, data):
+    try:
+        batch = json.loads(await read_body(receive))
+    except ValueError:
+        batch = None
+    if not isinstance(batch, dict):
+        return await send_json(send, {'error': 'expected a JSON object'}, 400)
+    expired = await asyncio.to_thread(check_deadline, data)
+    if expired or 'exam' not in data or batch.get('attempt') != data.get('attempt_id'):
+        if expired:
+            await store_session(sid, data)
+        return await send_json(send, {'error': 'no attempt in progress'}, 409)
+    seqs = data.get('answer_seqs')
+    acks = await asyncio.to_thread(sync_answers, data, batch)
+    # Un lot que ja s'havia aplicat no toca la sessió
+    if data.get('answer_seqs') is not seqs:
+        await store_session(sid, data)
+    await send_json(send, {'acks': acks})
+
+
+async def exam_summary(scope, receive, send, sid, data):
+    expired = await asyncio.to_thread(check_deadline, data)
+    if expired:
+        await store_session(sid, data)
+        return await send_page(send, expired)
+    if 'exam' not in data or 'user_answers' not in data:
+        return await send_redirect(send, '/')
+
+    if scope['method'] == 'POST':
+        form = await read_form(receive)
+        if form.get('action', [''])[0] != 'Submit Exam':
+            return await send_redirect(send, '/quiz')
+        html = await asyncio.to_thread(process_exam_results, data)
+        await store_session(sid, data)
+        return await send_page(send, html)
+
+    questions = await asyncio.to_thread(attempt_questions, data)
+    await send_html(send, generate_summary_html(questions, data['user_answers']))
+
+
+# ---------------------| Proctor |------------------
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def proctor_stream(scope, receive, send):
+    """
+    Server-sent events for the proctor dashboard, without holding a thread per watcher.
+
+    The bus is only read from memory, so polling it costs nothing to the candidates.
+    """
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]})
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        seq, states = bus.snapshot()
+        await send({'type': 'http.response.body', 'body': format_sse('snapshot', states).encode(), 'more_body': True})
+        idle = 0
+        while not disconnected.done():
+            await asyncio.sleep(0.5)
+            seq, events, lost = bus.events_since(seq)
+            chunk = ''
+            if lost:
+                seq, states = bus.snapshot()
+                chunk += format_sse('snapshot', states)
+            chunk += ''.join(format_sse('progress', state) for state in events)
+            idle = 0 if chunk else idle + 1
+            if idle >= 30:
+                chunk, idle = ': keepalive\n\n', 0
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+    finally:
+        disconnected.cancel()
+
+
+STREAMS = {
+    '/admin/proctor/stream': proctor_stream,
+}
+
+ROUTES = {
+    ('/quiz', 'GET'): quiz,
+    ('/quiz', 'POST'): quiz,
+    ('/quiz/save', 'POST'): quiz_save,
+    ('/quiz/sync', 'POST'): quiz_sync,
+    ('/exam_summary', 'GET'): exam_summary,
+    ('/exam_summary', 'POST'): exam_summary,
+}
+
+# ---------------------| WSGI bridge |------------------
+
+def build_environ(scope, body: bytes) -> Dict[str, Any]:
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    # El cos ja és sencer en memòria (també per a peticions chunked)
+    environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+class ClientGone(Exception):
+    """
+    The client of a bridged request went away: the WSGI app stops producing its response.
+    """
+
+
+async def call_wsgi(scope, receive, send):
+    """
+    Run the Flask app in a worker thread and stream its response chunk by chunk.
+
+    If sending fails (the client disconnected), the worker stops at its next
+    chunk instead of waiting forever for room in the queue.
+    """
+    environ = build_environ(scope, await read_body(receive))
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=16)
+    closed = threading.Event()
+
+    def put(item):
+        if closed.is_set():
+            raise ClientGone()
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                return future.result(timeout=1)
+            except concurrent.futures.TimeoutError:
+                if closed.is_set():
+                    future.cancel()
+                    raise ClientGone()
+
+    def run():
+        def start_response(status, headers, exc_info=None):
+            put(('start', int(status.split(' ', 1)[0]),
+                 [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]))
+        result = None
+        try:
+            result = flask_app.wsgi_app(environ, start_response)
+            for chunk in result:
+                if chunk:
+                    put(('body', chunk))
+        except ClientGone:
+            pass
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+            try:
+                put(('end', None))
+            except ClientGone:
+                pass
+
+    worker = loop.run_in_executor(None, run)
+    started = False
+    try:
+        while True:
+            kind, *payload = await queue.get()
+            if kind == 'start':
+                started = True
+                await send({'type': 'http.response.start', 'status': payload[0], 'headers': payload[1]})
+            elif kind == 'body':
+                await send({'type': 'http.response.body', 'body': payload[0], 'more_body': True})
+            else:
+                # L'aplicació ha fallat abans de donar capçaleres
+                if not started:
+                    await send_response(send, 500, b'Internal Server Error', [(b'content-type', b'text/plain')])
+                else:
+                    await send({'type': 'http.response.body', 'body': b''})
+                break
+    finally:
+        closed.set()
+    await worker
+
+# ---------------------| App |------------------
+
+async def dispatch(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                examinator.start_background_tasks()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    if scope['path'] in STREAMS:
+        return await STREAMS[scope['path']](scope, receive, send)
+    handler = ROUTES.get((scope['path'], scope['method']))
+    if handler is None:
+        return await call_wsgi(scope, receive, send)
+    # Els fils de treball hereten el context, i amb ell l'organització
+    host = dict(scope['headers']).get(b'host', b'').decode('latin-1')
+    use_tenant(tenant_for_host(host))
+    sid, data = await load_session(scope)
+    if data is None:
+        return await send_redirect(send, '/')
+    await handler(scope, receive, send, sid, data)
+
+# Les respostes de Flask ja arriben comprimides pel pont WSGI i no es toquen
+app = compress_asgi(dispatch)
@@ -0,0 +1,191 @@
+# Base imports
+import hashlib
+import html
+import os
+import re
+import shutil
+import threading
+import uuid
+from typing import Dict, Optional, Tuple
+
+# external imports
+from PIL import Image, UnidentifiedImageError
+
+# custom imports
+from config import ASSETS_FOLDER
+from config import VAULT_FOLDER
+from tenants import current_tenant
+
+# Adjunts de les preguntes (![[...]] d'Obsidian). Es resolen a la volta en
+# compilar el banc (vegeu markup.py), es guarden per hash del contingut i les variants
+# redimensionades es generen una sola vegada; les peticions només serveixen fitxers.
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp')
+
+# Amplada màxima de cada variant
+VARIANTS = {
+    'thumb': 240,
+    'medium': 800,
+    'full': 1600,
+}
+DIGEST_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+
+_lock = threading.Lock()
+# Un índex per arrel: cada organització té la seva volta. Es refà a cada compilació, no a cada adjunt que no hi és
+_vault_index: Dict[str, Dict[str, str]] = {}
+
+
+def _vault_root() -> str:
+    return VAULT_FOLDER or current_tenant().exams_folder
+
+
+def _build_index(vault: str) -> Dict[str, str]:
+    # Obsidian resol els adjunts pel nom del fitxer, sigui on sigui de la volta
+    index = {}
+    for root, _, names in os.walk(vault):
+        for name in names:
+            index.setdefault(name.lower(), os.path.join(root, name))
+    return index
+
+
+def refresh_vault():
+    """
+    Forget the vault indexes, so attachments added since are found. Called before compiling banks.
+    """
+    with _lock:
+        _vault_index.clear()
+
+
+def resolve_attachment(name: str) -> Optional[str]:
+    """
+    Path of an attachment of the vault by its name, None if it doesn't exist.
+
+    The vault is indexed on the first lookup after refresh_vault; names that
+    aren't found don't walk it again.
+    """
+    vault = _vault_root()
+    key = os.path.basename(name.strip()).lower()
+    with _lock:
+        index = _vault_index.get(vault)
+    if index is None:
+        # Fora del bloqueig: recórrer la volta no atura les altres organitzacions
+        index = _build_index(vault)
+        with _lock:
+            index = _vault_index.setdefault(vault, index)
+    path = index.get(key)
+    if path is None or not os.path.exists(path):
+        return None
+    return path
+
+
+def asset_dir(digest: str) -> str:
+    return os.path.join(ASSETS_FOLDER, digest[:2], digest)
+
+
+def asset_path(digest: str, variant: str) -> Optional[str]:
+    """
+    File of a variant of an asset (or its original), None if it doesn't exist.
+    """
+    if not DIGEST_PATTERN.match(digest) or (variant not in VARIANTS and variant != 'original'):
+        return None
+    folder = asset_dir(digest)
+    if not os.path.isdir(folder):
+        return None
+    for name in os.listdir(folder):
+        if os.path.splitext(name)[0] == variant:
+            return os.path.join(folder, name)
+    return None
+
+
+def _render_variants(source: str, folder: str) -> Tuple[int, int]:
+    with Image.open(source) as image:
+        size = image.size
+        image = image.convert('RGBA') if image.mode in ('P', 'LA', 'RGBA') else image.convert('RGB')
+        for variant, width in VARIANTS.items():
+            copy = image.copy()
+            copy.thumbnail((width, width * 4))
+            copy.save(os.path.join(folder, f"{variant}.webp"), 'WEBP', quality=85, method=4)
+    return size
+
+
+def ingest(path: str) -> Dict[str, object]:
+    """
+    Store an attachment in the asset cache, with its resized variants if it is an image.
+
+    The work is done once per content: if the asset is already in the cache it is
+    only hashed.
+
+    Returns:
+    The digest of the content, whether it is an image, and its original size
+    """
+    digest_object = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest_object.update(block)
+    digest = digest_object.hexdigest()
+    folder = asset_dir(digest)
+    extension = os.path.splitext(path)[1].lower()
+    is_image = extension in IMAGE_EXTENSIONS
+    size_file = os.path.join(folder, 'size')
+    if os.path.exists(size_file):
+        with open(size_file, 'r', encoding='utf-8') as f:
+            width, height = (int(value) for value in f.read().split())
+        return {'digest': digest, 'image': is_image and width > 0, 'size': (width, height)}
+
+    # Es prepara en una carpeta temporal i es publica amb un rename atòmic
+    tmp_folder = f"{folder}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(tmp_folder)
+    try:
+        shutil.copyfile(path, os.path.join(tmp_folder, f"original{extension}"))
+        size = (0, 0)
+        if is_image:
+            try:
+                size = _render_variants(path, tmp_folder)
+            except (UnidentifiedImageError, OSError) as e:
+                print(f"Error processing image {path}: {str(e)}")
+                is_image = False
+        with open(os.path.join(tmp_folder, 'size'), 'w', encoding='utf-8') as f:
+            f.write(f"{size[0]} {size[1]}")
+        try:
+            os.rename(tmp_folder, folder)
+        except OSError:
+            # Un altre procés l'ha publicat abans
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+        raise
+    return {'digest': digest, 'image': is_image, 'size': size}
+
+
+def embed_html(name: str, spec: Optional[str] = None) -> str:
+    """
+    HTML for an Obsidian embed: a responsive image, or a link for other attachments.
+
+    Args:
+    name -- Name of the attachment in the vault
+    spec -- What follows the '|' in the embed: a width in pixels or an alternative text
+    """
+    path = resolve_attachment(name)
+    label = html.escape(name.strip())
+    if path is None:
+        print(f"Attachment not found in the vault: {name}")
+        return f'<span class="missing-asset">[{label}]</span>'
+    asset = ingest(path)
+    base = f"/assets/{asset['digest']}"
+    if not asset['image']:
+        return f'<a class="question-attachment" href="{base}/original" target="_blank">{label}</a>'
+
+    width, height = asset['size']
+    alt = label
+    style = ''
+    if spec and spec.strip().isdigit():
+        style = f' style="max-width:{int(spec)}px"'
+    elif spec:
+        alt = html.escape(spec.strip())
+    srcset = ', '.join(f"{base}/{variant} {min(max_width, width)}w" for variant, max_width in VARIANTS.items())
+    return (f'<a class="question-image" href="{base}/full" target="_blank">'
+            f'<img src="{base}/medium" srcset="{srcset}" sizes="(max-width: 800px) 100vw, 800px" '
+            f'width="{min(width, VARIANTS["medium"])}" '
+            f'height="{round(height * min(width, VARIANTS["medium"]) / width) if width else 0}" '
+            f'alt="{alt}" loading="lazy"{style}></a>')
+
@@ -0,0 +1,347 @@
+# Base imports
+import hashlib
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Dict, Any, Iterator, Optional
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# custom imports
+from config import ATTEMPTS_FOLDER
+
+# Magatzem d'intents: cada intent finalitzat es guarda com un fitxer JSON que
+# referencia les preguntes pel seu identificador, amb un índex pregunta -> intents.
+
+
+def question_id(question: Dict[str, Any]) -> str:
+    """
+    Stable identifier of a question: hash of its text and its (unordered) answers.
+
+    The correct markers are not part of the identifier, so fixing an answer key
+    keeps the same id.
+    """
+    digest = hashlib.sha1(question['question'].strip().encode('utf-8'))
+    for answer in sorted(question['answers']):
+        digest.update(b'\x00' + answer.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def _path(*parts: str) -> str:
+    return os.path.join(ATTEMPTS_FOLDER, *parts)
+
+
+def attempt_path(attempt_id: str) -> str:
+    """
+    Finished attempts are sharded by the first two characters of their id.
+    """
+    return _path(attempt_id[:2], f"{attempt_id}.json")
+
+
+def attempt_exists(attempt_id: str) -> bool:
+    return os.path.exists(attempt_path(attempt_id)) or os.path.exists(_path(f"{attempt_id}.json"))
+
+
+def iter_attempt_paths() -> Iterator[str]:
+    if not os.path.isdir(ATTEMPTS_FOLDER):
+        return
+    for entry in os.scandir(ATTEMPTS_FOLDER):
+        if entry.is_dir() and len(entry.name) == 2:
+            for item in os.scandir(entry.path):
+                if item.name.endswith('.json'):
+                    yield item.path
+        elif entry.name.endswith('.json'):
+            # Disposició antiga, sense subdirectoris
+            yield entry.path
+
+
+def _write_json(path: str, data: Any):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+_local_lock = threading.Lock()
+
+
+@contextmanager
+def _file_lock(path: str):
+    # Bloqueig exclusiu entre processos sobre un fitxer .lock; produeix el seu camí
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as f:
+        if fcntl is None:
+            # Sense flock (Windows) només se serialitza dins del procés
+            with _local_lock:
+                yield path
+        else:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield path
+
+
+def save_attempt(course: str, files: List[str], questions: List[Dict[str, Any]],
+                 user_answers: Dict[str, Any], score: float, scheme: str, attempt_id: str = None,
+                 bank_version: str = None, practice: bool = False) -> str:
+    """
+    Persist a finished attempt and index it by question id.
+
+    Practice sittings are stored too (their results page reads them back) but
+    left out of the index: they don't count for the difficulty of a question nor for regrades.
+
+    Args:
+    course -- The course name
+    files -- Exam files the questions were drawn from
+    questions -- Questions in the order they were shown
+    user_answers -- Dictionary question number (1-based, as string) -> bitmask of option ids (or answer text)
+    score -- The score obtained
+    scheme -- Grading scheme used
+    attempt_id -- Id to use (for attempts that were already active), a new one by default
+    bank_version -- Version of the bank the attempt was drawn from
+    practice -- Whether it is a practice sitting
+
+    Returns:
+    The id of the new attempt
+    """
+    attempt_id = attempt_id or uuid.uuid4().hex
+    attempt = {
+        'id': attempt_id,
+        'course': course,
+        'files': files,
+        'submitted': datetime.now().isoformat(timespec='seconds'),
+        'scheme': scheme,
+        'score': score,
+        'total': len(questions),
+        'bank_version': bank_version,
+        'practice': practice,
+        'questions': [{
+            'id': question.get('id') or question_id(question),
+            'question': question['question'],
+            'answers': list(question['answers']),
+            'option_ids': list(question.get('option_ids') or range(len(question['answers']))),
+            'correct': list(question['correct']),
+            'user_answer': user_answers.get(str(i), []),
+        } for i, question in enumerate(questions, 1)]
+    }
+    _write_json(attempt_path(attempt_id), attempt)
+    if practice:
+        return attempt_id
+
+    os.makedirs(_path('index'), exist_ok=True)
+    for question in attempt['questions']:
+        with open(_path('index', question['id']), 'a', encoding='utf-8') as f:
+            f.write(attempt_id + '\n')
+    return attempt_id
+
+
+def load_attempt(attempt_id: str) -> Optional[Dict[str, Any]]:
+    for path in (attempt_path(attempt_id), _path(f"{attempt_id}.json")):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+    return None
+
+
+def attempt_user_answers(attempt: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Rebuild the user_answers dictionary (question number -> answers) of a stored attempt.
+    """
+    return {str(i): question['user_answer'] for i, question in enumerate(attempt['questions'], 1)}
+
+
+def update_attempt(attempt: Dict[str, Any]):
+    _write_json(attempt_path(attempt['id']), attempt)
+
+
+def attempts_for_question(qid: str) -> List[str]:
+    """
+    Ids of the attempts that included a question.
+    """
+    try:
+        with open(_path('index', qid), 'r', encoding='utf-8') as f:
+            return list(dict.fromkeys(line.strip() for line in f if line.strip()))
+    except FileNotFoundError:
+        return []
+
+
+def start_active(sid: str, course: str, files: List[str], exam: Dict[str, Any], deadline: float) -> str:
+    """
+    Register an attempt in progress, so it can be submitted when its deadline expires.
+
+    Args:
+    sid -- Id of the session that holds the attempt
+    course -- The course name
+    files -- Exam files the questions were drawn from
+    exam -- Descriptor of the attempt (bank version, seed and number of questions)
+    deadline -- Epoch time at which the attempt is submitted automatically
+
+    Returns:
+    The id of the attempt
+    """
+    attempt_id = uuid.uuid4().hex
+    _write_json(_path('active', f"{attempt_id}.json"), {
+        'id': attempt_id,
+        'sid': sid,
+        'course': course,
+        'files': files,
+        'deadline': deadline,
+        'exam': exam,
+        'user_answers': {},
+    })
+    return attempt_id
+
+
+def load_active(attempt_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_path('active', f"{attempt_id}.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _active_lock(attempt_id: str):
+    """
+    Hold the lock of an active attempt: the writers of its record, in any process, go one at a time.
+    """
+    return _file_lock(_path('active', f"{attempt_id}.lock"))
+
+
+def _remove_lock(path: str):
+    # Cal tenir el bloqueig: l'intent ja no és actiu i ningú més no l'escriurà
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def update_active(attempt_id: str, user_answers: Dict[str, Any], answer_seqs: Optional[Dict[str, int]] = None):
+    """
+    Store the answers of an active attempt, in a single write of its record.
+
+    Args:
+    attempt_id -- The id of the attempt
+    user_answers -- Answers by question number
+    answer_seqs -- Sequence number of the last change applied to each question, for answers
+                   synced by the client. An answer the record holds from a newer change is kept,
+                   so batches applied out of order by different workers don't undo each other:
+                   the read and the write of the record happen under the lock of the attempt.
+    """
+    with _active_lock(attempt_id) as lock_path:
+        record = load_active(attempt_id)
+        if record is None:
+            _remove_lock(lock_path)
+            return
+        if answer_seqs is not None:
+            user_answers, answer_seqs = dict(user_answers), dict(answer_seqs)
+            stored_answers = record['user_answers']
+            for key, seq in record.get('answer_seqs', {}).items():
+                if seq > answer_seqs.get(key, 0) and key in stored_answers:
+                    user_answers[key], answer_seqs[key] = stored_answers[key], seq
+            record['answer_seqs'] = answer_seqs
+        record['user_answers'] = user_answers
+        _write_json(_path('active', f"{attempt_id}.json"), record)
+
+
+def claim_active(attempt_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Take an active attempt out of the store to submit it.
+
+    Only one caller (the candidate or the deadline scheduler) gets the record,
+    the other one gets None. An update in flight finishes first, so it can't write
+    the record back once claimed.
+    """
+    path = _path('active', f"{attempt_id}.json")
+    claimed_path = f"{path}.{uuid.uuid4().hex}.claimed"
+    with _active_lock(attempt_id) as lock_path:
+        try:
+            os.rename(path, claimed_path)
+        except FileNotFoundError:
+            return None
+        finally:
+            _remove_lock(lock_path)
+    with open(claimed_path, 'r', encoding='utf-8') as f:
+        record = json.load(f)
+    os.remove(claimed_path)
+    return record
+
+
+def iter_active() -> Iterator[Dict[str, Any]]:
+    folder = _path('active')
+    if not os.path.isdir(folder):
+        return
+    for name in os.listdir(folder):
+        if name.endswith('.json'):
+            record = load_active(name[:-5])
+            if record:
+                yield record
+
+
+def compile_bank(questions: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+    """
+    Compile a parsed bank file to the form we keep as snapshot: question id -> sorted correct answers.
+    """
+    return {question.get('id') or question_id(question): sorted(question['correct']) for question in questions}
+
+
+def load_bank_snapshot(course: str, file_name: str) -> Dict[str, List[str]]:
+    try:
+        with open(_path('banks', course, f"{file_name}.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_bank_snapshot(course: str, file_name: str, snapshot: Dict[str, List[str]]):
+    _write_json(_path('banks', course, f"{file_name}.json"), snapshot)
+
+
+def _bank_lock(course: str, file_name: str):
+    # Els processos que carreguen el mateix fitxer i la recorrecció llegeixen i reescriuen la mateixa instantània
+    return _file_lock(_path('banks', course, f"{file_name}.lock"))
+
+
+def record_bank(course: str, file_name: str, questions: List[Dict[str, Any]]):
+    """
+    Remember the answer key attempts are graded against.
+
+    Only questions never seen before are added: keys that changed in the file are
+    left untouched so the re-grade job can still diff them.
+    """
+    compiled = compile_bank(questions)
+    with _bank_lock(course, file_name):
+        snapshot = load_bank_snapshot(course, file_name)
+        new_entries = {qid: correct for qid, correct in compiled.items() if qid not in snapshot}
+        if new_entries:
+            snapshot.update(new_entries)
+            save_bank_snapshot(course, file_name, snapshot)
+
+
+def update_bank_snapshot(course: str, file_name: str, entries: Dict[str, List[str]]):
+    """
+    Set answer keys in the snapshot of a bank file, keeping the entries other processes added meanwhile.
+    """
+    with _bank_lock(course, file_name):
+        snapshot = load_bank_snapshot(course, file_name)
+        snapshot.update(entries)
+        save_bank_snapshot(course, file_name, snapshot)
+
+
+def diff_banks(old: Dict[str, List[str]], new: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """
+    Compare two compiled banks.
+
+    Returns:
+    A dictionary with the 'changed', 'added' and 'removed' question ids
+    """
+    return {
+        'changed': sorted(qid for qid in old.keys() & new.keys() if old[qid] != new[qid]),
+        'added': sorted(new.keys() - old.keys()),
+        'removed': sorted(old.keys() - new.keys()),
+    }
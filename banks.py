@@ -0,0 +1,740 @@
+# Base imports
+import hashlib
+import json
+import mmap
+import os
+import secrets
+import shutil
+import struct
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Callable, Sequence
+
+# custom imports
+from config import BANK_CACHE_FOLDER
+from config import BANK_MIRROR_FOLDER
+from prng import permute_index, shuffled_order
+from questions import Question
+from tenants import DEFAULT_TENANT, get_tenant
+
+# Bancs de preguntes compilats i versionats. Un intent es descriu només amb
+# (versió del banc, llavor, nombre de preguntes): qualsevol pàgina es pot
+# reconstruir a partir d'aquí, en qualsevol procés.
+#
+# Cada versió es publica una sola vegada com a instantània immutable que els
+# processos mapen en memòria: tots els treballadors d'un node comparteixen les
+# mateixes pàgines i qualsevol node pot servir qualsevol intent.
+#
+# Les preguntes es guarden per contingut: una instantània és un índex de
+# (hash, segment, posició) i els segments (<versió>.objects) només contenen les
+# preguntes que cada versió ha introduït. Una versió nova apunta als segments
+# de l'anterior per a les preguntes que no han canviat, de manera que no es
+# tornen a escriure ni a carregar en memòria.
+
+SNAPSHOT_MAGIC = b'EXBANK2\n'
+# Format d'abans de l'emmagatzematge per contingut: totes les preguntes dins del fitxer
+SNAPSHOT_MAGIC_V1 = b'EXBANK1\n'
+_COUNT = struct.Struct('<Q')
+_SPAN = struct.Struct('<2Q')
+_ENTRY = struct.Struct('<8sI2Q')
+_SEGMENT_NAME = 32
+# question_blob escriu primer l'id: es pot llegir sense descodificar la pregunta
+_ID_PREFIX = b'{"id":"'
+
+
+def question_blob(question: Question) -> bytes:
+    return json.dumps(question.to_dict(), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def question_digest(blob: bytes) -> bytes:
+    """
+    Content address of a stored question: the hash of its serialized form.
+    """
+    return hashlib.sha1(blob).digest()[:8]
+
+
+_segments_lock = threading.Lock()
+# Segments mapats en aquest procés, compartits per totes les versions que els fan servir.
+# Referències febles: quan cap banc de la memòria cau no fa servir un segment, es desmapa
+_segment_maps: 'weakref.WeakValueDictionary[str, mmap.mmap]' = weakref.WeakValueDictionary()
+
+
+def _map_segment(path: str) -> mmap.mmap:
+    with _segments_lock:
+        segment = _segment_maps.get(path)
+        if segment is None:
+            with open(path, 'rb') as f:
+                segment = _segment_maps[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return segment
+
+
+def question_size(question: Question) -> int:
+    """
+    Rough memory footprint of a decoded question: its text plus a fixed overhead per question and answer.
+    """
+    # Les respostes són internades: només compta la referència
+    return 200 + len(question.question) * 2 + 8 * len(question.answers)
+
+
+class QuestionCache:
+    """
+    Decoded questions of the banks of one tenant, by content hash, least recently used first out.
+
+    Every version of a bank gets the same object for a question that didn't
+    change. The cache belongs to the BankCache of the tenant, which charges its
+    bytes to the tenant quota and leaves it whatever the mapped banks don't use.
+    """
+    def __init__(self, limit_bytes: int):
+        self.limit_bytes = limit_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._questions: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: bytes, blob) -> Question:
+        with self._lock:
+            cached = self._questions.get(digest)
+            if cached is not None:
+                self._questions.move_to_end(digest)
+                self.hits += 1
+                return cached[0]
+        question = Question.from_dict(json.loads(blob))
+        size = question_size(question)
+        with self._lock:
+            self.misses += 1
+            cached = self._questions.get(digest)
+            if cached is not None:
+                return cached[0]
+            if size <= self.limit_bytes:
+                self._questions[digest] = (question, size)
+                self.bytes += size
+                self._trim()
+        return question
+
+    def resize(self, limit_bytes: int):
+        with self._lock:
+            self.limit_bytes = limit_bytes
+            self._trim()
+
+    def _trim(self):
+        # Cal tenir _lock
+        while self.bytes > self.limit_bytes and self._questions:
+            _, (_, size) = self._questions.popitem(last=False)
+            self.bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'questions': len(self._questions), 'bytes': self.bytes, 'limit_bytes': self.limit_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+class MappedQuestions:
+    """
+    Read-only sequence of the questions of a bank snapshot, decoded on access from memory maps.
+
+    Layout: magic, question count, segment count, the segment names (fixed
+    width, NUL padded) and one entry per question: its content hash, the index
+    of the segment that holds it and its span there. Segments are files of
+    UTF-8 JSON questions, one after the other.
+
+    Snapshots in the old layout (magic, count, count + 1 offsets and the
+    questions themselves) are read as a snapshot with a single segment: itself.
+    """
+    __slots__ = ('path', '_map', '_count', '_names', '_segments', '_entries', '_decoded')
+
+    def __init__(self, path: str, resolve: Callable[[str], str] = None, decoded: Optional[QuestionCache] = None):
+        self.path = path
+        self._decoded = decoded
+        self._map = _map_segment(path)
+        magic = self._map[:len(SNAPSHOT_MAGIC)]
+        if magic == SNAPSHOT_MAGIC_V1:
+            (self._count,) = _COUNT.unpack_from(self._map, len(SNAPSHOT_MAGIC))
+            self._names = [os.path.basename(path)]
+            self._segments = [self._map]
+            self._entries = None
+        elif magic == SNAPSHOT_MAGIC:
+            self._count, n_segments = _SPAN.unpack_from(self._map, len(SNAPSHOT_MAGIC))
+            offset = len(SNAPSHOT_MAGIC) + _SPAN.size
+            resolve = resolve or (lambda name: os.path.join(os.path.dirname(path), name))
+            self._names = [self._map[offset + i * _SEGMENT_NAME:offset + (i + 1) * _SEGMENT_NAME].rstrip(b'\0').decode()
+                           for i in range(n_segments)]
+            self._segments = [_map_segment(resolve(name)) for name in self._names]
+            self._entries = offset + n_segments * _SEGMENT_NAME
+        else:
+            raise ValueError(f"Not a bank snapshot: {path}")
+
+    def __len__(self):
+        return self._count
+
+    def entry(self, index: int):
+        """
+        Content hash of a question and where it is stored: (digest, segment index, start, end).
+        """
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        if self._entries is None:
+            start, end = _SPAN.unpack_from(self._map, len(SNAPSHOT_MAGIC) + _COUNT.size + index * 8)
+            return question_digest(self._map[start:end]), 0, start, end
+        return _ENTRY.unpack_from(self._map, self._entries + index * _ENTRY.size)
+
+    def segment_names(self) -> List[str]:
+        """
+        Files (in the snapshot folder) that hold the questions of this snapshot.
+        """
+        return list(self._names)
+
+    def mapped_bytes(self) -> int:
+        """
+        Size of the index and of every segment this snapshot maps.
+        """
+        return len(self._map) + sum(len(segment) for segment in self._segments if segment is not self._map)
+
+    def __getitem__(self, index: int) -> Question:
+        digest, segment, start, end = self.entry(index)
+        blob = self._segments[segment][start:end]
+        if self._decoded is None:
+            return Question.from_dict(json.loads(blob))
+        return self._decoded.get(digest, blob)
+
+    def question_id(self, index: int) -> Optional[str]:
+        """
+        Id of a question, read from its stored form without decoding the question.
+        """
+        _, segment, start, end = self.entry(index)
+        data = self._segments[segment]
+        if data[start:start + len(_ID_PREFIX)] == _ID_PREFIX:
+            quote = data.find(b'"', start + len(_ID_PREFIX), end)
+            if quote > 0:
+                raw = data[start + len(_ID_PREFIX):quote]
+                if b'\\' not in raw:
+                    return raw.decode('utf-8')
+        # Sense id, o amb caràcters escapats: es descodifica
+        return self[index].id
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+
+def write_snapshot(path: str, questions: List[Question], parent: Optional[MappedQuestions] = None):
+    """
+    Publish the snapshot of a bank atomically; an existing snapshot is never rewritten.
+
+    Args:
+    path -- Path of the snapshot, <version>.bank
+    questions -- The questions of the bank
+    parent -- Snapshot of the previous version of the same bank: the questions it already
+              holds are referenced, and only the new ones go to the segment of this version
+    """
+    if os.path.exists(path):
+        return
+    known = {}
+    segments = []
+    if parent is not None:
+        segments = parent.segment_names()
+        for index in range(len(parent)):
+            digest, segment, start, end = parent.entry(index)
+            known.setdefault(digest, (segment, start, end))
+
+    own_name = os.path.basename(path)[:-len('.bank')] + '.objects'
+    own_blobs = []
+    own_offset = 0
+    entries = []
+    for question in questions:
+        blob = question_blob(question)
+        digest = question_digest(blob)
+        if digest not in known:
+            if own_name not in segments:
+                segments.append(own_name)
+            known[digest] = (segments.index(own_name), own_offset, own_offset + len(blob))
+            own_blobs.append(blob)
+            own_offset += len(blob)
+        entries.append((digest,) + known[digest])
+
+    # Primer el segment i després l'índex: qui veu l'índex ja pot llegir les preguntes
+    if own_blobs:
+        _write_atomic(os.path.join(os.path.dirname(path), own_name), own_blobs)
+    header = [SNAPSHOT_MAGIC, _SPAN.pack(len(entries), len(segments))]
+    header += [name.encode().ljust(_SEGMENT_NAME, b'\0') for name in segments]
+    _write_atomic(path, header + [_ENTRY.pack(*entry) for entry in entries])
+
+
+def _write_atomic(path: str, parts: List[bytes]):
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for part in parts:
+            f.write(part)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Un altre procés l'ha publicat abans i ja el té mapat
+        os.remove(tmp_path)
+        if not os.path.exists(path):
+            raise
+
+
+class Bank:
+    """
+    A compiled, immutable question bank: unique questions with their answers in file order.
+    """
+    __slots__ = ('version', 'tenant', 'questions', 'size', '_positions')
+
+    def __init__(self, version: str, questions: Sequence[Question], tenant: str = DEFAULT_TENANT):
+        self.version = version
+        self.tenant = tenant
+        self.questions = questions
+        self.size = bank_size(questions)
+        self._positions = None
+
+    def __len__(self):
+        return len(self.questions)
+
+    def question_id(self, index: int) -> Optional[str]:
+        """
+        Id of the question at an index; a mapped bank reads it without decoding the question.
+        """
+        if isinstance(self.questions, MappedQuestions):
+            return self.questions.question_id(index)
+        return self.questions[index].id
+
+    def position(self, qid: str) -> Optional[int]:
+        """
+        Position of a question in the bank by its id, None if it isn't in it.
+        """
+        if self._positions is None:
+            self._positions = {self.question_id(index): index for index in range(len(self.questions))}
+        return self._positions.get(qid)
+
+
+def bank_size(questions: Sequence[Question]) -> int:
+    """
+    Rough memory footprint of a bank, in bytes: its text plus a fixed overhead per question and answer.
+
+    A mapped bank counts the files it maps, whole, even when they are shared with
+    other versions. Its decoded questions are charged by the QuestionCache of the tenant.
+    """
+    if isinstance(questions, MappedQuestions):
+        return 200 + len(questions) * 16 + questions.mapped_bytes()
+    return sum(question_size(question) for question in questions)
+
+
+class BankCache:
+    """
+    Compiled banks of one tenant, least recently used first out when over the memory quota.
+
+    Evicted banks are only unmapped: their snapshot stays on disk and get_bank
+    maps them again when needed. The questions decoded from the banks share the
+    same quota: they get what the banks leave.
+    """
+    def __init__(self, quota_bytes: int):
+        self.quota_bytes = quota_bytes
+        self.total_bytes = 0
+        self.evictions = 0
+        self.questions = QuestionCache(quota_bytes)
+        self._banks: OrderedDict = OrderedDict()
+        self._by_source: Dict[Any, str] = {}
+        # Per llinatge, la clau d'origen de la seva última versió: les anteriors ja no tornaran
+        self._lineage_sources: Dict[str, Any] = {}
+
+    def get(self, version: str) -> Optional[Bank]:
+        bank = self._banks.get(version)
+        if bank is not None:
+            self._banks.move_to_end(version)
+        return bank
+
+    def put(self, bank: Bank) -> Bank:
+        current = self.get(bank.version)
+        if current is not None:
+            return current
+        self._banks[bank.version] = bank
+        self.total_bytes += bank.size
+        # El banc que s'acaba d'afegir es queda encara que sol ja passi de la quota
+        while self.total_bytes > self.quota_bytes and len(self._banks) > 1:
+            _, evicted = self._banks.popitem(last=False)
+            self.total_bytes -= evicted.size
+            self.evictions += 1
+        self.questions.resize(max(0, self.quota_bytes - self.total_bytes))
+        return bank
+
+    def stats(self) -> Dict[str, Any]:
+        questions = self.questions.stats()
+        return {
+            'banks': len(self._banks),
+            'bytes': self.total_bytes + questions['bytes'],
+            'bank_bytes': self.total_bytes,
+            'decoded_questions': questions,
+            'quota_bytes': self.quota_bytes,
+            'evictions': self.evictions,
+        }
+
+
+_lock = threading.Lock()
+_caches: Dict[str, BankCache] = {}
+
+
+def _cache(tenant: str) -> BankCache:
+    # Cal tenir _lock
+    cache = _caches.get(tenant)
+    if cache is None:
+        cache = _caches[tenant] = BankCache(get_tenant(tenant).bank_cache_bytes)
+    return cache
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Memory use of the bank cache of each tenant.
+    """
+    with _lock:
+        return {tenant: cache.stats() for tenant, cache in _caches.items()}
+
+
+def bank_version(questions: Sequence[Question]) -> str:
+    """
+    Content hash of a compiled bank: any change to a question, an answer or a key changes it.
+    """
+    digest = hashlib.sha1()
+    for question in questions:
+        digest.update(json.dumps([question.question, list(question.answers), question.correct],
+                                 ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def _snapshot_folder(tenant: str) -> str:
+    # Els de la instància per defecte es queden a l'arrel, com abans de tenir-ne diverses
+    if tenant == DEFAULT_TENANT:
+        return BANK_CACHE_FOLDER
+    return os.path.join(BANK_CACHE_FOLDER, 'tenants', tenant)
+
+
+def _snapshot_path(version: str, tenant: str, extension: str = 'bank') -> str:
+    return os.path.join(_snapshot_folder(tenant), f"{version}.{extension}")
+
+
+def _mirrored(path: str) -> str:
+    """
+    Local copy of a shared snapshot file with BANK_MIRROR_FOLDER; the files are immutable,
+    so a copy never has to be checked again.
+    """
+    if not BANK_MIRROR_FOLDER:
+        return path
+    local_path = os.path.join(BANK_MIRROR_FOLDER, os.path.relpath(path, BANK_CACHE_FOLDER))
+    if not os.path.exists(local_path):
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        tmp_path = f"{local_path}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, local_path)
+    return local_path
+
+
+def _open_snapshot(version: str, tenant: str) -> Optional[MappedQuestions]:
+    """
+    Map the snapshot of a bank version and its segments, None if no node has published it.
+    """
+    path = _snapshot_path(version, tenant)
+    if not os.path.exists(path):
+        # Instantània d'abans del format mapat: es converteix una sola vegada
+        try:
+            with open(_snapshot_path(version, tenant, 'json'), 'r', encoding='utf-8') as f:
+                write_snapshot(path, [Question.from_dict(question) for question in json.load(f)])
+        except FileNotFoundError:
+            return None
+    folder = _snapshot_folder(tenant)
+    with _lock:
+        decoded = _cache(tenant).questions
+    return MappedQuestions(_mirrored(path), lambda name: _mirrored(os.path.join(folder, name)), decoded)
+
+
+def _history_path(lineage: str, tenant: str) -> str:
+    name = hashlib.sha1(lineage.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(_snapshot_folder(tenant), 'history', f"{name}.jsonl")
+
+
+def bank_history(lineage: str, tenant: str = DEFAULT_TENANT) -> List[Dict[str, Any]]:
+    """
+    The versions a bank has gone through, oldest first.
+
+    Args:
+    lineage -- Name of the bank, the same for all its versions (course and exam files)
+    tenant -- Name of the tenant that owns the bank
+
+    Returns:
+    One entry per version: version, parent, creation time and the ids of the questions
+    added, removed and changed from its parent
+    """
+    try:
+        with open(_history_path(lineage, tenant), 'r', encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+    # Dos processos poden haver registrat la mateixa versió alhora
+    history = []
+    for entry in entries:
+        if not history or history[-1]['version'] != entry['version']:
+            history.append(entry)
+    return history
+
+
+def bank_histories(tenant: str = DEFAULT_TENANT) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    The history of every bank of a tenant, by lineage.
+    """
+    folder = os.path.join(_snapshot_folder(tenant), 'history')
+    if not os.path.isdir(folder):
+        return {}
+    histories = {}
+    for name in sorted(os.listdir(folder)):
+        if name.endswith('.jsonl'):
+            with open(os.path.join(folder, name), 'r', encoding='utf-8') as f:
+                first = f.readline()
+            if first.strip():
+                lineage = json.loads(first)['lineage']
+                histories[lineage] = bank_history(lineage, tenant)
+    return histories
+
+
+def diff_versions(old: Bank, new: Bank) -> Dict[str, List[str]]:
+    """
+    Compare two versions of a bank by question id.
+
+    A question keeps its id while its text and answers stay the same, so a
+    changed key or topic shows as 'changed' and an edited text as removed and added.
+
+    Returns:
+    A dictionary with the 'changed', 'added' and 'removed' question ids
+    """
+    old_digests = {old.question_id(index): old.questions.entry(index)[0] for index in range(len(old))}
+    new_digests = {new.question_id(index): new.questions.entry(index)[0] for index in range(len(new))}
+    return {
+        'changed': sorted(qid for qid in old_digests.keys() & new_digests.keys() if old_digests[qid] != new_digests[qid]),
+        'added': sorted(new_digests.keys() - old_digests.keys()),
+        'removed': sorted(old_digests.keys() - new_digests.keys()),
+    }
+
+
+def _record_version(lineage: str, tenant: str, bank: Bank, parent: Optional[Bank]):
+    if parent is not None:
+        diff = diff_versions(parent, bank)
+    else:
+        diff = {'changed': [], 'added': [bank.question_id(index) for index in range(len(bank))], 'removed': []}
+    entry = dict(diff, lineage=lineage, version=bank.version, parent=parent.version if parent else None,
+                 created=datetime.now().isoformat(timespec='seconds'), questions=len(bank),
+                 segments=bank.questions.segment_names())
+    path = _history_path(lineage, tenant)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Una sola escriptura en mode append: les línies de diversos processos no es barregen
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def register_bank(questions: List[Question], source_key: Any = None, tenant: str = DEFAULT_TENANT,
+                  lineage: Optional[str] = None) -> Bank:
+    """
+    Register a freshly parsed bank and publish its snapshot so any process can rebuild its version.
+
+    The parsed questions are only used to write the snapshot: the bank kept in
+    memory is the mapped one, like in every other process. With a lineage, the
+    new version shares the questions it has in common with the previous version
+    of the same bank, and is added to its history.
+
+    Args:
+    questions -- Unique questions, answers in file order
+    source_key -- Key describing where the bank comes from (files and modification times);
+                  with a lineage, it replaces the key of the previous version
+    tenant -- Name of the tenant that owns the bank
+    lineage -- Name of the bank, the same for all its versions
+
+    Returns:
+    The bank, shared with any previous registration of the same content
+    """
+    version = bank_version(questions)
+    history = bank_history(lineage, tenant) if lineage else []
+    parent_version = history[-1]['version'] if history else None
+    parent = get_bank(parent_version, tenant) if parent_version and parent_version != version else None
+
+    with _lock:
+        cache = _cache(tenant)
+        bank = cache.get(version)
+    if bank is None:
+        write_snapshot(_snapshot_path(version, tenant), questions, parent.questions if parent else None)
+        bank = get_bank(version, tenant)
+    if lineage and parent_version != version:
+        _record_version(lineage, tenant, bank, parent)
+    if source_key is not None:
+        with _lock:
+            cache._by_source[source_key] = version
+            if lineage:
+                previous = cache._lineage_sources.get(lineage)
+                if previous is not None and previous != source_key:
+                    cache._by_source.pop(previous, None)
+                cache._lineage_sources[lineage] = source_key
+    return bank
+
+
+def source_bank(source_key: Any, tenant: str = DEFAULT_TENANT) -> Optional[Bank]:
+    """
+    The bank already compiled for a source key, if any.
+    """
+    with _lock:
+        version = _cache(tenant)._by_source.get(source_key)
+    return get_bank(version, tenant) if version else None
+
+
+class _Flight:
+    """
+    A bank load in progress, that later callers for the same source wait on.
+    """
+    __slots__ = ('done', 'bank', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.bank = None
+        self.error = None
+        self.waiters = 0
+
+
+_flights: Dict[Any, _Flight] = {}
+_loader_stats = {'loads': 0, 'coalesced': 0, 'failed': 0, 'wait_seconds': 0.0}
+
+
+def load_bank_once(source_key: Any, tenant: str, loader: Callable[[], List[Question]],
+                   lineage: Optional[str] = None) -> Bank:
+    """
+    The bank of a source, parsed by a single caller however many ask for it at once.
+
+    The first caller for a source key runs loader() and registers the result;
+    concurrent callers for the same key wait for it and share the bank (or the
+    error it raised) instead of parsing the same files again.
+
+    Args:
+    source_key -- Key describing the source (files and modification times)
+    tenant -- Name of the tenant that owns the bank
+    loader -- Function that parses the source and returns its questions
+    lineage -- Name of the bank across its versions, to share questions with the previous one
+
+    Returns:
+    The bank
+    """
+    bank = source_bank(source_key, tenant)
+    if bank is not None:
+        return bank
+
+    key = (tenant, source_key)
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+        else:
+            flight.waiters += 1
+
+    if not leader:
+        start = time.perf_counter()
+        flight.done.wait()
+        with _lock:
+            _loader_stats['coalesced'] += 1
+            _loader_stats['wait_seconds'] += time.perf_counter() - start
+        if flight.error is not None:
+            raise flight.error
+        return flight.bank
+
+    try:
+        # Pot ser que una càrrega hagi acabat entre la primera consulta i ara
+        flight.bank = source_bank(source_key, tenant) or register_bank(loader(), source_key, tenant, lineage)
+        return flight.bank
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _lock:
+            _loader_stats['loads'] += 1
+            if flight.error is not None:
+                _loader_stats['failed'] += 1
+            del _flights[key]
+        flight.done.set()
+
+
+def loader_stats() -> Dict[str, Any]:
+    """
+    Bank loads run, and requests that waited on a load already in flight instead of running their own.
+    """
+    with _lock:
+        stats = dict(_loader_stats, in_flight=len(_flights),
+                     waiting=sum(flight.waiters for flight in _flights.values()))
+    stats['wait_seconds'] = round(stats['wait_seconds'], 3)
+    return stats
+
+
+def get_bank(version: str, tenant: str = DEFAULT_TENANT) -> Optional[Bank]:
+    """
+    A bank by version, from the memory of its tenant or mapped from its snapshot.
+    """
+    with _lock:
+        bank = _cache(tenant).get(version)
+    if bank is not None:
+        return bank
+    questions = _open_snapshot(version, tenant)
+    if questions is None:
+        return None
+    with _lock:
+        return _cache(tenant).put(Bank(version, questions, tenant))
+
+# ---------------------| Exams |------------------
+
+def new_exam(bank: Bank, count: int) -> Dict[str, Any]:
+    """
+    Describe a new attempt over a bank: a random seed and the number of questions.
+    """
+    return {'version': bank.version, 'tenant': bank.tenant, 'seed': secrets.randbits(63), 'count': min(count, len(bank))}
+
+
+def exam_question(bank: Bank, exam: Dict[str, Any], position: int) -> Dict[str, Any]:
+    """
+    Rebuild the question shown at a (0-based) position of an attempt, with its answers shuffled.
+    """
+    seed = exam['seed']
+    # Les variants pregenerades porten el seu ordre; la resta, la permutació de la llavor
+    index = exam['order'][position] if 'order' in exam else permute_index(seed, position, len(bank))
+    question = bank.questions[index]
+    order = shuffled_order(seed, position, len(question.answers))
+    mask = question.correct_mask
+    return {
+        'id': question.id,
+        'question': question.question,
+        'option_ids': tuple(order),
+        'answers': tuple(question.answers[i] for i in order),
+        'correct': [question.answers[i] for i in order if mask >> i & 1],
+        # Els ids d'opció són les posicions del fitxer: la màscara del banc serveix tal qual
+        'correct_mask': mask,
+    }
+
+
+def exam_positions(bank: Bank, exam: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Position (0-based) of each question of an attempt, by question id.
+
+    Only the ids are read, from the stored form of each question: nothing is decoded.
+    """
+    seed = exam['seed']
+    positions = {}
+    for position in range(exam['count']):
+        index = exam['order'][position] if 'order' in exam else permute_index(seed, position, len(bank))
+        positions.setdefault(bank.question_id(index), position)
+    return positions
+
+
+def exam_questions(bank: Bank, exam: Dict[str, Any], start: int = 0, end: int = None) -> List[Dict[str, Any]]:
+    """
+    Rebuild the questions of positions start..end (0-based, end excluded) of an attempt.
+    """
+    end = exam['count'] if end is None else min(end, exam['count'])
+    return [exam_question(bank, exam, position) for position in range(start, end)]
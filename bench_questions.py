@@ -0,0 +1,82 @@
+"""
+Memory benchmark of the question representation.
+
+Builds the same synthetic bank twice, as the dicts the parser used to return
+and as Question objects, and measures both with tracemalloc:
+
+    python bench_questions.py [--questions 100000] [--vocabulary 2000]
+
+Answers are drawn from a limited vocabulary, like real banks where "ext4" or
+"None of the above" appear in thousands of questions. Every string is built at
+run time, as the parser does when it reads a file, so the dict version holds
+one copy per occurrence.
+"""
+# Base imports
+import argparse
+import gc
+import random
+import tracemalloc
+from typing import List, Dict, Any, Callable
+
+# custom imports
+from questions import Question, correct_mask
+
+
+def synthetic_rows(count: int, vocabulary: int, seed: int = 1):
+    rng = random.Random(seed)
+    # Una part de les respostes són genèriques i es repeteixen molt
+    common = ['None of the above', 'All of the above', 'True', 'False']
+    for n in range(count):
+        n_answers = rng.randint(3, 5)
+        answers = []
+        for _ in range(n_answers):
+            if rng.random() < 0.2:
+                answers.append(''.join(rng.choice(common)))
+            else:
+                answers.append(''.join(['answer ', str(rng.randrange(vocabulary))]))
+        answers = list(dict.fromkeys(answers))
+        correct = [answers[rng.randrange(len(answers))]]
+        yield ''.join(['Which option applies to question number ', str(n), '?']), answers, correct
+
+
+def as_dicts(rows) -> List[Dict[str, Any]]:
+    return [{'question': text, 'answers': tuple(answers), 'correct': list(correct), 'id': f"{n:016x}",
+             'topic': ''.join(['topic', str(n % 20)])}
+            for n, (text, answers, correct) in enumerate(rows)]
+
+
+def as_questions(rows) -> List[Question]:
+    return [Question(text, answers, correct_mask(answers, correct), f"{n:016x}", ''.join(['topic', str(n % 20)]))
+            for n, (text, answers, correct) in enumerate(rows)]
+
+
+def measure(build: Callable, count: int, vocabulary: int) -> int:
+    """
+    Bytes still allocated by a built bank, once the parse input is gone.
+    """
+    gc.collect()
+    tracemalloc.start()
+    bank = build(synthetic_rows(count, vocabulary))
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del bank
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the memory of dict and Question banks.')
+    parser.add_argument('--questions', type=int, default=100000)
+    parser.add_argument('--vocabulary', type=int, default=2000, help='number of distinct answer texts')
+    args = parser.parse_args()
+
+    dicts = measure(as_dicts, args.questions, args.vocabulary)
+    questions = measure(as_questions, args.questions, args.vocabulary)
+    print(f"{args.questions} questions, {args.vocabulary} distinct answers")
+    print(f"{'dict':<10}{dicts / 2**20:>10.1f} MiB{dicts / args.questions:>8.0f} B/question")
+    print(f"{'Question':<10}{questions / 2**20:>10.1f} MiB{questions / args.questions:>8.0f} B/question")
+    print(f"Saving: {100 * (1 - questions / dicts):.1f}%")
+
+
+if __name__ == '__main__':
+    main()
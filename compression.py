@@ -0,0 +1,206 @@
+# Base imports
+import re
+import zlib
+from typing import List, Dict, Optional, Tuple
+
+# external imports
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# custom imports
+from config import COMPRESS_MIN_BYTES
+from config import COMPRESS_LEVEL
+from config import BROTLI_QUALITY
+
+# Compressió de les respostes i minificació de l'HTML generat. Les respostes en
+# streaming es comprimeixen tros a tros, amb un flush per tros, de manera que el
+# navegador rep cada part tan bon punt surt i res no s'acumula en memòria.
+
+COMPRESSIBLE_TYPES = ('text/html', 'text/css', 'text/plain', 'application/javascript', 'text/javascript',
+                      'application/json', 'image/svg+xml')
+
+# Blocs on els espais són significatius
+_VERBATIM = re.compile(r'(<(pre|textarea|script)\b.*?</\2\s*>)', re.S | re.I)
+_INDENT = re.compile(r'[ \t\r]*\n\s*')
+
+
+def minify_html(html: str) -> str:
+    """
+    Drop the indentation and blank lines of generated HTML.
+
+    Whitespace runs that span lines become a single newline, which renders the
+    same; the content of <pre>, <textarea> and <script> is left as is.
+    """
+    parts = _VERBATIM.split(html)
+    out = []
+    # split amb dos grups: text, bloc literal, nom de l'etiqueta, text...
+    for index in range(0, len(parts), 3):
+        out.append(_INDENT.sub('\n', parts[index]))
+        if index + 1 < len(parts):
+            out.append(parts[index + 1])
+    return ''.join(out)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    The best encoding the client accepts: brotli if available, then gzip.
+    """
+    accepted = {}
+    for item in accept_encoding.lower().split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    if brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', 0) > 0:
+        return 'gzip'
+    return None
+
+
+class Encoder:
+    """
+    Incremental compressor for one response body.
+    """
+    __slots__ = ('_compressor', '_brotli')
+
+    def __init__(self, encoding: str):
+        self._brotli = encoding == 'br'
+        if self._brotli:
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes, flush: bool) -> bytes:
+        """
+        Compress a chunk; with flush, everything compressed so far can be decoded by the client.
+        """
+        if self._brotli:
+            out = self._compressor.process(data)
+            return out + self._compressor.flush() if flush else out
+        out = self._compressor.compress(data)
+        return out + self._compressor.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self) -> bytes:
+        if self._brotli:
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def should_compress(status: int, headers: Dict[str, str]) -> bool:
+    """
+    Whether a response is worth compressing, from its status and (lowercase) headers.
+
+    A response without Content-Length is streamed and is always compressed.
+    """
+    if status != 200 or 'content-encoding' in headers:
+        return False
+    if headers.get('content-type', '').split(';')[0].strip() not in COMPRESSIBLE_TYPES:
+        return False
+    length = headers.get('content-length')
+    return length is None or int(length) >= COMPRESS_MIN_BYTES
+
+
+def _vary(value: Optional[str]) -> str:
+    if not value:
+        return 'Accept-Encoding'
+    if 'accept-encoding' in value.lower():
+        return value
+    return f"{value}, Accept-Encoding"
+
+
+class CompressionMiddleware:
+    """
+    WSGI middleware that compresses the responses of an app with gzip or brotli.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        encoding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+
+        state = {}
+
+        def capture(status, headers, exc_info=None):
+            state['status'], state['headers'], state['exc_info'] = status, headers, exc_info
+            # El cos s'escriu a través de l'iterador, no amb write()
+            return lambda data: None
+
+        result = self.app(environ, capture)
+        lowered = {name.lower(): value for name, value in state['headers']}
+        if not should_compress(int(state['status'].split()[0]), lowered):
+            start_response(state['status'], state['headers'], state['exc_info'])
+            return result
+
+        headers = [(name, value) for name, value in state['headers']
+                   if name.lower() not in ('content-length', 'vary')]
+        headers += [('Content-Encoding', encoding), ('Vary', _vary(lowered.get('vary')))]
+        start_response(state['status'], headers, state['exc_info'])
+        return self._compress(result, Encoder(encoding), streamed='content-length' not in lowered)
+
+    @staticmethod
+    def _compress(result, encoder: Encoder, streamed: bool):
+        try:
+            for data in result:
+                if data:
+                    out = encoder.chunk(data, flush=streamed)
+                    if out:
+                        yield out
+            yield encoder.finish()
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+
+def compress_asgi(app):
+    """
+    ASGI middleware that compresses the responses of an app with gzip or brotli.
+    """
+    async def compressed_app(scope, receive, send):
+        if scope['type'] != 'http' or scope.get('method') == 'HEAD':
+            return await app(scope, receive, send)
+        accept = b''
+        for name, value in scope['headers']:
+            if name == b'accept-encoding':
+                accept = value
+        encoding = choose_encoding(accept.decode('latin-1'))
+        if encoding is None:
+            return await app(scope, receive, send)
+
+        state = {'encoder': None, 'streamed': False}
+
+        async def compressing_send(message):
+            if message['type'] == 'http.response.start':
+                headers: List[Tuple[bytes, bytes]] = message.get('headers', [])
+                lowered = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in headers}
+                if should_compress(message['status'], lowered):
+                    state['encoder'] = Encoder(encoding)
+                    state['streamed'] = 'content-length' not in lowered
+                    headers = [(name, value) for name, value in headers
+                               if name.lower() not in (b'content-length', b'vary')]
+                    headers += [(b'content-encoding', encoding.encode()),
+                                (b'vary', _vary(lowered.get('vary')).encode('latin-1'))]
+                    message = dict(message, headers=headers)
+                return await send(message)
+            encoder = state['encoder']
+            if message['type'] != 'http.response.body' or encoder is None:
+                return await send(message)
+            more_body = message.get('more_body', False)
+            body = encoder.chunk(message.get('body', b''), flush=state['streamed'] and more_body)
+            if not more_body:
+                body += encoder.finish()
+            elif not body:
+                return
+            await send(dict(message, body=body))
+
+        await app(scope, receive, compressing_send)
+
+    return compressed_app
@@ -3,4 +3,53 @@ EXAM_QUESTIONS = 15
 QUESTIONS_PER_PAGE = 1
 THEME = 'STIT'
 TITLE = 'Examinator'
-APP_NAME = 'Examinator 3000'
\ No newline at end of file
+APP_NAME = 'Examinator 3000'
+GRADING_SCHEME = 'all_or_nothing'
+NEGATIVE_MARK_PERCENT = 25
+ATTEMPTS_FOLDER = 'attempts'
+EXAM_TIME_LIMIT = 0
+SESSION_FOLDER = 'flask_session'
+SESSION_LIFETIME_HOURS = 12
+ATTEMPT_RETENTION_DAYS = 365
+GC_INTERVAL_MINUTES = 15
+# Per servir des de diversos nodes, BANK_CACHE_FOLDER, ATTEMPTS_FOLDER i
+# SESSION_FOLDER han de ser en un disc compartit
+BANK_CACHE_FOLDER = 'bank_cache'
+# Còpia local de les instantànies dels bancs, mapada en lloc de la compartida ('' = cap)
+BANK_MIRROR_FOLDER = ''
+VARIANT_POOL_SIZE = 20
+VARIANT_MAX_OVERLAP = 50
+PRACTICE_DB = 'practice/practice.sqlite3'
+PRACTICE_QUESTIONS = 10
+VAULT_FOLDER = ''
+ASSETS_FOLDER = 'assets_cache'
+BANK_CACHE_MB = 64
+# Instàncies per organització, triades pel host de la petició. Les claus que
+# no s'indiquin prenen els valors d'aquest fitxer. Exemple:
+# TENANTS = {'acme': {'hosts': ['exams.acme.test'], 'exams_folder': 'tenants/acme',
+#                     'theme': 'STIT', 'title': 'ACME', 'exam_questions': 20, 'bank_cache_mb': 32}}
+TENANTS = {}
+# Respostes més petites no es comprimeixen (bytes)
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_LEVEL = 6
+BROTLI_QUALITY = 5
+# Límit per client i ruta: endpoint -> (peticions per segon, ràfega)
+RATE_LIMITS = {
+    'select_exam': (0.2, 5),
+    'practice': (0.2, 5),
+    'download_results': (0.1, 3),
+}
+# Sense sessió es limita per adreça, amb el ritme i la ràfega multiplicats per
+# aquest factor: els candidats d'una aula darrere d'un NAT comparteixen IP
+RATE_LIMIT_ADDRESS_SCALE = 30
+# SQLite compartit pels processos per a l'estat del limitador ('' = en memòria de cada procés)
+RATE_LIMIT_DB = ''
+# Control d'admissió dels punts cars: execucions simultànies, cua i espera màxima (segons)
+ADMISSION_ENDPOINTS = ('select_exam', 'practice', 'download_results')
+ADMISSION_SLOTS = 4
+ADMISSION_QUEUE = 16
+ADMISSION_TIMEOUT = 10
+# Mode fora de línia del client d'examen (service worker i cua de respostes)
+PWA_ENABLED = True
+# Cada quants segons el client envia els canvis de resposta pendents
+ANSWER_SYNC_SECONDS = 5
@@ -0,0 +1,75 @@
+# Base imports
+import heapq
+import itertools
+import threading
+import time
+from typing import Callable, Dict, List, Any
+
+# Planificador de venciments: un sol fil i un heap ordenat per hora límit,
+# de manera que milers d'intents amb temps no necessiten un fil cadascun.
+
+
+class DeadlineScheduler:
+    """
+    Run a callback when a deadline expires.
+
+    Deadlines live in a min-heap keyed by expiry time and a single daemon thread
+    sleeps until the earliest one. Cancelling is lazy: the heap entry is only
+    marked as dead and skipped when it reaches the top.
+    """
+    def __init__(self):
+        self._heap: List[List[Any]] = []
+        self._entries: Dict[str, List[Any]] = {}
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def schedule(self, key: str, when: float, callback: Callable[[str], None]):
+        """
+        Schedule callback(key) at the epoch time `when`, replacing any previous deadline for key.
+        """
+        with self._cond:
+            self._cancel(key)
+            entry = [when, next(self._counter), key, callback]
+            self._entries[key] = entry
+            heapq.heappush(self._heap, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='deadline-scheduler', daemon=True)
+                self._thread.start()
+            # Només cal despertar el fil si aquest és el nou primer venciment
+            if self._heap[0] is entry:
+                self._cond.notify()
+
+    def cancel(self, key: str):
+        with self._cond:
+            self._cancel(key)
+
+    def _cancel(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[3] = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                when, _, key, callback = self._heap[0]
+                delay = when - time.time()
+                if callback is not None and delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                if callback is None:
+                    continue
+                del self._entries[key]
+            try:
+                callback(key)
+            except Exception as e:
+                print(f"Error running deadline for {key}: {str(e)}")
+
+
+scheduler = DeadlineScheduler()
@@ -0,0 +1,113 @@
+# Base imports
+import itertools
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import List, Dict, Any, Tuple
+
+# Bus d'esdeveniments en procés per al tauler del vigilant. Els candidats només
+# afegeixen a un buffer circular (cost constant, independent del nombre de
+# vigilants); cada vigilant llegeix des del seu cursor.
+
+BUFFER_SIZE = 1000
+# Els intents sense notícies des de fa tant (pràctiques i exàmens sense límit abandonats) surten del tauler
+IDLE_SECONDS = 4 * 3600
+# Cada quant es busquen, com a molt
+PRUNE_INTERVAL_SECONDS = 60
+# Temps durant el qual s'ignoren les notícies tardanes d'un intent acabat (d'una altra pestanya o procés)
+TOMBSTONE_SECONDS = 600
+
+
+class ProgressBus:
+    """
+    Publish/subscribe bus with a bounded ring buffer and the latest state of each attempt.
+
+    Publishing never blocks on watchers: events go to a fixed-size ring and
+    watchers that fall too far behind resynchronise from the state snapshot.
+    Attempts that publish nothing for idle_seconds are dropped as abandoned:
+    practice and untimed attempts never expire on their own. Once an attempt
+    is finished or expired, late publishes for it are ignored for TOMBSTONE_SECONDS.
+    """
+    def __init__(self, buffer_size: int = BUFFER_SIZE, idle_seconds: float = IDLE_SECONDS):
+        self._ring: deque = deque(maxlen=buffer_size)
+        self._state: Dict[str, Dict[str, Any]] = {}
+        self._seq = itertools.count(1)
+        self.last_seq = 0
+        self.idle_seconds = idle_seconds
+        self._next_prune = 0.0
+        # Intents acabats fa poc, amb l'hora en què es van acabar
+        self._tombstones: OrderedDict = OrderedDict()
+        self._cond = threading.Condition()
+
+    def _append(self, state: Dict[str, Any]):
+        # Cal tenir _cond
+        self.last_seq = next(self._seq)
+        self._ring.append((self.last_seq, dict(state)))
+
+    def prune(self, now: float = None) -> int:
+        """
+        Drop the attempts not updated for idle_seconds, telling the watchers they were abandoned.
+
+        Returns:
+        The number of attempts dropped
+        """
+        now = time.time() if now is None else now
+        with self._cond:
+            limit = now - self.idle_seconds
+            idle = [attempt_id for attempt_id, state in self._state.items() if state['updated'] < limit]
+            for attempt_id in idle:
+                state = self._state.pop(attempt_id)
+                self._append(dict(state, status='abandoned'))
+            if idle:
+                self._cond.notify_all()
+            while self._tombstones and next(iter(self._tombstones.values())) < now - TOMBSTONE_SECONDS:
+                self._tombstones.popitem(last=False)
+            return len(idle)
+
+    def publish(self, attempt_id: str, **fields):
+        """
+        Update the state of an attempt and notify the watchers.
+        """
+        now = time.time()
+        with self._cond:
+            if attempt_id in self._tombstones:
+                return
+            state = self._state.setdefault(attempt_id, {'id': attempt_id})
+            state.update(fields, updated=now)
+            if state.get('status') in ('finished', 'expired'):
+                self._state.pop(attempt_id)
+                self._tombstones[attempt_id] = now
+            self._append(state)
+            if now >= self._next_prune:
+                self._next_prune = now + PRUNE_INTERVAL_SECONDS
+                self.prune(now)
+            self._cond.notify_all()
+
+    def snapshot(self) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Current state of every attempt in progress, and the sequence it corresponds to.
+        """
+        with self._cond:
+            return self.last_seq, [dict(state) for state in self._state.values()]
+
+    def events_since(self, seq: int) -> Tuple[int, List[Dict[str, Any]], bool]:
+        """
+        Events published after seq.
+
+        Returns:
+        The new cursor, the events, and whether the watcher lost events and must resync
+        """
+        with self._cond:
+            if self.last_seq == seq:
+                return seq, [], False
+            if self._ring and self._ring[0][0] > seq + 1:
+                return self.last_seq, [], True
+            return self.last_seq, [state for event_seq, state in self._ring if event_seq > seq], False
+
+
+bus = ProgressBus()
+
+
+def format_sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
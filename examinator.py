@@ -2,19 +2,27 @@
 import random
 import re
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator
 from time import sleep
 from io import BytesIO
-from datetime import datetime
+from datetime import datetime, timedelta
+from tempfile import SpooledTemporaryFile
 import io
+import html as html_lib
+import time
+import math
+import uuid
+import secrets
+import threading
 
 import importlib
 import ast
 
 # external imports
 from flask import Flask, render_template_string, request, session, redirect, url_for,flash
-from flask import send_file,render_template
+from flask import send_file,render_template,jsonify,Response,g
 from flask_session import Session
+from werkzeug.exceptions import TooManyRequests, ServiceUnavailable
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet
@@ -25,20 +33,49 @@ from reportlab.lib.styles import getSampleStyleSheet
 # from cryptography.hazmat.backends import default_backend
 
 # custom imports
-from config import EXAMS_FOLDER
-from config import EXAM_QUESTIONS
 from config import QUESTIONS_PER_PAGE
-from config import THEME
-from config import TITLE
 # from appsecrets import PRIVATE_KEY_PATH
 # from appsecrets import PRIVATE_KEY_PASSWORD
 import config
+from config import GRADING_SCHEME
+from config import SESSION_FOLDER
+from config import SESSION_LIFETIME_HOURS
+from config import VARIANT_POOL_SIZE
+from config import PRACTICE_QUESTIONS
+from config import RATE_LIMITS
+from config import RATE_LIMIT_ADDRESS_SCALE
+from config import ADMISSION_ENDPOINTS
+from config import PWA_ENABLED
+from config import ANSWER_SYNC_SECONDS
+from grading import grade_attempt, is_text_question, decode_answer
+from attempts import record_bank, save_attempt, load_attempt, attempt_user_answers
+from attempts import start_active, update_active, claim_active, iter_active
+from deadlines import scheduler
+from events import bus
+from housekeeping import ShardedFileSystemCache, METRICS, run_gc, start_housekeeper
+from questions import Question
+from compression import CompressionMiddleware, minify_html
+from limits import check_rate, admission, Overloaded, limits_stats
+from banks import Bank, load_bank_once, get_bank, new_exam, exam_questions, exam_positions, cache_stats, loader_stats
+from banks import bank_histories, diff_versions
+from tenants import DEFAULT_TENANT, current_tenant, tenant_for_host, use_tenant, reset_tenant, list_tenants
+from variants import build_pool, list_pools, hand_out_variant
+from review import pick_questions, record_reviews
+from lint import BankLintError, check_file
+from importers import importer_for, compile_question
+from assets import asset_path, refresh_vault, IMAGE_EXTENSIONS
+from markup import to_reportlab
 
 app = Flask(__name__)
 app.secret_key = 'una_clau_secreta_molt_segura'
-app.config['SESSION_TYPE'] = 'filesystem'
-app.config['SESSION_FILE_DIR'] = 'flask_session'
+# Sessions en fitxers repartits en subdirectoris; la neteja la fa el housekeeper
+app.config['SESSION_TYPE'] = 'cachelib'
+app.config['SESSION_CACHELIB'] = ShardedFileSystemCache(SESSION_FOLDER, threshold=0)
+app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=SESSION_LIFETIME_HOURS)
+# Només escrivim la sessió quan canvia, no a cada petició
+app.config['SESSION_REFRESH_EACH_REQUEST'] = False
 Session(app)
+app.wsgi_app = CompressionMiddleware(app.wsgi_app)
 
 QUESTION_STYLE = 'h3'
 
@@ -59,22 +96,29 @@ def load_private_key():
     except (TypeError, ValueError) as e:
         raise ValueError(f"Invalid private key or password: {str(e)}")
 
-def sign_pdf(pdf_content):
-    private_key = load_private_key()
-    
-    # Llegim el PDF
-    reader = PdfReader(io.BytesIO(pdf_content))
-    writer = PdfWriter()
+def sign_pdf(pdf_file):
+    """
+    Sign a PDF read from a file object, without loading it whole in memory.
 
-    # Copiem totes les pàgines al nou writer
-    for page in reader.pages:
-        writer.add_page(page)
+    Returns:
+    A spooled temporary file with the signed PDF, positioned at the start
+    """
+    private_key = load_private_key()
 
-    # Creem la signatura
+    # Creem la signatura, llegint el PDF a trossos
     hash_object = hashes.Hash(hashes.SHA256())
-    hash_object.update(pdf_content)
+    pdf_file.seek(0)
+    for block in iter(lambda: pdf_file.read(1 << 16), b''):
+        hash_object.update(block)
     digest = hash_object.finalize()
 
+    # Llegim el PDF des del fitxer i copiem totes les pàgines al nou writer
+    pdf_file.seek(0)
+    reader = PdfReader(pdf_file)
+    writer = PdfWriter()
+    for page in reader.pages:
+        writer.add_page(page)
+
     signature = private_key.sign(
         digest,
         padding.PSS(
@@ -90,44 +134,82 @@ def sign_pdf(pdf_content):
         '/SignatureMethod': 'RSA-SHA256'
     })
 
-    # Escrivim el PDF signat
-    output = io.BytesIO()
+    # Escrivim el PDF signat, en memòria només si és petit
+    output = SpooledTemporaryFile(max_size=PDF_SPOOL_BYTES)
     writer.write(output)
     output.seek(0)
     return output
 
-def generate_pdf(score: int, total_questions: int, detailed_results: List[Dict[str, Any]]) -> BytesIO:
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    story = []
+# Preguntes que es converteixen en flowables alhora en generar el PDF
+PDF_CHUNK_QUESTIONS = 50
+# Fins aquesta mida el PDF es queda en memòria; per sobre va a un fitxer temporal
+PDF_SPOOL_BYTES = 1024 * 1024
+
+class FlowableStream(list):
+    """
+    Story for reportlab that is filled in chunks from an iterator of flowables.
+
+    The document template consumes the story from the front while it lays out
+    the pages; refilling it only when it runs low keeps at most a chunk of
+    flowables alive, however long the exam is.
+    """
+    def __init__(self, flowables: Iterator, chunk: int):
+        super().__init__()
+        self._flowables = flowables
+        self._chunk = chunk
+
+    def __len__(self):
+        if super().__len__() < self._chunk and self._flowables is not None:
+            for flowable in self._flowables:
+                self.append(flowable)
+                if super().__len__() >= 2 * self._chunk:
+                    break
+            else:
+                self._flowables = None
+        return super().__len__()
+
+def iter_pdf_flowables(score: int, total_questions: int, detailed_results: Iterable[Dict[str, Any]]) -> Iterator:
     styles = getSampleStyleSheet()
 
     # Add title
-    story.append(Paragraph(f"Exam Results - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Title']))
-    story.append(Spacer(1, 12))
+    yield Paragraph(f"Exam Results - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", styles['Title'])
+    yield Spacer(1, 12)
 
     # Add score
     percentage = (score / total_questions) * 100
-    story.append(Paragraph(f"Score: {score} out of {total_questions} ({percentage:.2f}%)", styles['Heading2']))
-    story.append(Spacer(1, 12))
+    yield Paragraph(f"Score: {score} out of {total_questions} ({percentage:.2f}%)", styles['Heading2'])
+    yield Spacer(1, 12)
 
     # Add detailed results
     for i, result in enumerate(detailed_results, 1):
-        story.append(Paragraph(f"{i}. {result['question']}", styles['Heading3']))
+        # El text ja és HTML compilat: només cal passar-lo a les etiquetes de reportlab
+        correct_answers = to_reportlab(', '.join(result['correct_answers']))
+        yield Paragraph(f"{i}. {to_reportlab(result['question'])}", styles['Heading3'])
         
         if result['is_correct']:
-            story.append(Paragraph(f"Correct answer: {', '.join(result['correct_answers'])}", styles['BodyText']))
+            yield Paragraph(f"Correct answer: {correct_answers}", styles['BodyText'])
         else:
             if isinstance(result['user_answer'], list):
                 user_answer = ', '.join(result['user_answer']) if result['user_answer'] else "No answer selected"
             else:
                 user_answer = result['user_answer'] if result['user_answer'] else "No answer provided"
             
-            story.append(Paragraph(f"Your answer: {user_answer}", styles['BodyText']))
-            story.append(Paragraph(f"Correct answer: {', '.join(result['correct_answers'])}", styles['BodyText']))
+            yield Paragraph(f"Your answer: {to_reportlab(user_answer)}", styles['BodyText'])
+            yield Paragraph(f"Correct answer: {correct_answers}", styles['BodyText'])
         
-        story.append(Spacer(1, 12))
+        yield Spacer(1, 12)
+
+def generate_pdf(score: int, total_questions: int, detailed_results: Iterable[Dict[str, Any]]) -> SpooledTemporaryFile:
+    """
+    Render the results PDF in bounded chunks of questions.
 
+    Returns:
+    A spooled temporary file with the PDF, positioned at the start
+    """
+    buffer = SpooledTemporaryFile(max_size=PDF_SPOOL_BYTES)
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    # Cada pregunta són fins a 4 flowables
+    story = FlowableStream(iter_pdf_flowables(score, total_questions, detailed_results), PDF_CHUNK_QUESTIONS * 4)
     doc.build(story)
     buffer.seek(0)
     return buffer
@@ -154,13 +236,13 @@ def get_exam_files(course: str) -> List[str]:
     course -- The course for which to get the exam files
     
     Returns:
-    A list of filenames ending with '.md'
+    A list of filenames ending with '.md' or with the extension of an importer (GIFT, Moodle XML, CSV)
     """
-    exams_folder = EXAMS_FOLDER  # Define this variable according to your configuration
+    exams_folder = current_tenant().exams_folder
     syllabus_path = os.path.join(exams_folder, course)
-    return [f for f in os.listdir(syllabus_path) if f.endswith('.md')]
+    return [f for f in os.listdir(syllabus_path) if f.endswith('.md') or importer_for(f)]
 
-def process_files(course: str, file_names: List[str]) -> List[Dict[str, Any]]:
+def process_files(course: str, file_names: List[str]) -> List[Question]:
     """
     Process multiple exam files and return a list of unique questions and answers.
 
@@ -169,13 +251,23 @@ def process_files(course: str, file_names: List[str]) -> List[Dict[str, Any]]:
     file_names -- List of file names to process
 
     Returns:
-    A list of dictionaries containing unique questions, answers, and correct answers
+    A list of unique questions, tagged with the file they come from as topic
+
+    Raises:
+    BankLintError if any of the files fails lint
     """
     all_questions = []
+    # Els adjunts afegits a la volta des de l'última compilació
+    refresh_vault()
     
+    # Un fitxer amb errors no es carrega: millor ara que a mig examen
+    for file_name in file_names:
+        if file_name.endswith('.md'):
+            check_file(os.path.join(current_tenant().exams_folder, course, file_name))
     for file_name in file_names:
         questions = process_single_file(course, file_name)
         print(f"Loaded {len(questions)} questions from {file_name}")
+        record_bank(current_tenant().course_key(course), file_name, questions)
         all_questions.extend(questions)
     
     # Remove duplicates
@@ -185,7 +277,45 @@ def process_files(course: str, file_names: List[str]) -> List[Dict[str, Any]]:
     
     return unique_questions
 
-def process_single_file(course: str, file_name: str) -> List[Dict[str, Any]]:
+def load_bank(course: str, file_names: List[str]) -> Bank:
+    """
+    Compiled bank of the selected exam files of the current tenant, parsed again only when a file changes.
+
+    Concurrent requests for the same files share a single parse, and a new
+    version of the files shares the questions that didn't change with the previous one.
+
+    Args:
+    course -- The course name
+    file_names -- List of file names to process
+
+    Returns:
+    The bank, with its version
+    """
+    tenant = current_tenant()
+    mtimes = tuple(os.path.getmtime(os.path.join(tenant.exams_folder, course, file_name)) for file_name in file_names)
+    source_key = (tenant.exams_folder, course, tuple(file_names), mtimes)
+    lineage = f"{course}:{','.join(file_names)}"
+    return load_bank_once(source_key, tenant.name, lambda: process_files(course, file_names), lineage)
+
+def attempt_questions(data, start: int = 0, end: int = None) -> List[Dict[str, Any]]:
+    """
+    Rebuild the questions of an attempt from its descriptor, as they are shown to the candidate.
+
+    Args:
+    data -- The session (or any mapping holding the attempt descriptor under 'exam')
+    start -- First position (0-based)
+    end -- Position after the last one, all of them by default
+
+    Returns:
+    The questions, with their answers in the order of the attempt
+    """
+    exam = data['exam']
+    bank = get_bank(exam['version'], exam.get('tenant', DEFAULT_TENANT))
+    if bank is None:
+        raise LookupError(f"Question bank {exam['version']} is not available")
+    return exam_questions(bank, exam, start, end)
+
+def process_single_file(course: str, file_name: str) -> List[Question]:
     """
     Process a single exam file and return a list of questions and answers.
 
@@ -194,68 +324,77 @@ def process_single_file(course: str, file_name: str) -> List[Dict[str, Any]]:
     file_name -- The name of the file to process
 
     Returns:
-    A list of dictionaries containing questions, answers, and correct answers
+    A list of questions, with the file name (without extension) as their topic
     """
-    full_path = os.path.join(EXAMS_FOLDER, course, file_name)
+    full_path = os.path.join(current_tenant().exams_folder, course, file_name)
+    topic = os.path.splitext(file_name)[0]
+    # Exportacions d'altres eines (GIFT, Moodle XML, CSV)
+    importer = importer_for(file_name)
+    if importer is not None:
+        return list(importer(full_path, topic))
     with open(full_path, 'r', encoding='utf-8') as file:
         lines = file.readlines()
 
     questions_answers = []
-    current_question = {'question': '', 'answers': [], 'correct': []}
+    current_question = None
+    in_code = False
     for line in lines:
-        line = line.strip()
-        line = re.sub(r'\[\[(.*?)\]\]', r'\1', line)
-        line = re.sub(r'`(.*?)`', r'<code>\1</code>', line)
-        if line.startswith('####'):
-            if current_question['question']:
-                # Barreja les respostes aleatòriament
-                answers = current_question['answers']
-                correct_answers = current_question['correct']
-                zipped_answers = list(zip(answers, [answer in correct_answers for answer in answers]))
-                random.shuffle(zipped_answers)
-                current_question['answers'], is_correct = zip(*zipped_answers)
-                current_question['correct'] = [answer for answer, correct in zip(current_question['answers'], is_correct) if correct]
-                
-                questions_answers.append(current_question)
-                current_question = {'question': '', 'answers': [], 'correct': []}
-            current_question['question'] += line[4:] + ' '
-        elif line.startswith('+') or line.startswith('-'):
-            answer = line[1:].strip()
+        line = line.rstrip('\n')
+        stripped = line.strip()
+        # L'enunciat pot tenir diverses línies (paràgrafs, llistes i blocs de codi) fins a la primera resposta
+        if current_question is not None and not current_question['answers'] and (in_code or stripped.startswith('```')):
+            if stripped.startswith('```'):
+                in_code = not in_code
+            current_question['body'].append(line)
+        elif stripped.startswith('####'):
+            add_question(questions_answers, current_question, topic)
+            current_question = {'body': [stripped[4:]], 'answers': [], 'correct': []}
+        elif stripped.startswith('+') or stripped.startswith('-'):
+            if current_question is None:
+                continue
+            answer = stripped[1:].strip()
             is_correct = '**' in answer
             answer = answer.replace('**', '')
             current_question['answers'].append(answer)
             if is_correct:
                 current_question['correct'].append(answer)
+        elif current_question is not None and not current_question['answers']:
+            current_question['body'].append(stripped)
 
-    if current_question['question']:
-        # Barreja les respostes aleatòriament per a l'última pregunta
-        answers = current_question['answers']
-        correct_answers = current_question['correct']
-        zipped_answers = list(zip(answers, [answer in correct_answers for answer in answers]))
-        random.shuffle(zipped_answers)
-        current_question['answers'], is_correct = zip(*zipped_answers)
-        current_question['correct'] = [answer for answer, correct in zip(current_question['answers'], is_correct) if correct]
-        
-        questions_answers.append(current_question)
-    
+    add_question(questions_answers, current_question, topic)
     return questions_answers
 
-def remove_duplicates(questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def add_question(questions_answers: List[Question], parsed, topic: str = None) -> None:
+    """
+    Compile a parsed question to HTML and add it to the list.
+
+    Args:
+    questions_answers -- List of compiled questions
+    parsed -- The question as parsed: lines of its text, raw answers and raw correct answers
+    topic -- Topic of the question (the file it comes from)
+    """
+    if parsed is None:
+        return
+    question = compile_question(parsed['body'], parsed['answers'], parsed['correct'], topic)
+    if question is not None:
+        questions_answers.append(question)
+
+def remove_duplicates(questions: List[Question]) -> List[Question]:
     """
     Remove duplicate questions from the list.
 
     Args:
-    questions -- List of question dictionaries
+    questions -- List of questions
 
     Returns:
-    A list of unique question dictionaries
+    A list of unique questions
     """
     unique_questions = []
     seen_questions = set()
     
     for question in questions:
-        # Create a tuple of the question and its answers for comparison
-        question_tuple = (question['question'], tuple(sorted(question['answers'])))
+        # The question and its answers, in any order
+        question_tuple = question.dedup_key()
         
         if question_tuple not in seen_questions:
             seen_questions.add(question_tuple)
@@ -273,7 +412,7 @@ def generate_topic_selection_html(topics: List[str]) -> str:
     Returns:
     HTML string for topic selection page
     """
-    html = BASE_HTML
+    html = base_html()
     html += '<h2>Select a course:</h2>\n'
     html += '<form method="post" action="/select_topic">\n'
     for course in topics:
@@ -294,7 +433,7 @@ def generate_exam_selection_html(course: str, files: List[str]) -> str:
     Returns:
     HTML string for exam selection page
     """
-    html = BASE_HTML
+    html = base_html()
     html += f'<h2>Course: {course}</h2>\n'
     html += '<h3>Select an exam:</h3>\n'
     html += '<form method="post" action="/select_exam">\n'
@@ -302,29 +441,34 @@ def generate_exam_selection_html(course: str, files: List[str]) -> str:
         html += f'<input type="checkbox" name="exam" value="{file}">{file}<br>\n'
     html += f'<input type="hidden" name="course" value="{course}">\n'
     html += '<br><input type="submit" value="Start Exam">\n'
+    html += '<input type="submit" value="Practice" formaction="/practice">\n'
     html += '</form>\n'
     html += '</body></html>'
     return html
 
-def generate_results_html(score: int, total_questions: int, detailed_results: List[Dict[str, Any]]) -> str:
+def iter_results_html(score: int, total_questions: int, detailed_results: Iterable[Dict[str, Any]]) -> Iterator[str]:
     """
-    Generate HTML for the results page with colored answers and improved display logic.
+    Generate the results page piece by piece, with colored answers, so it can be streamed.
 
     Args:
     score -- User's score
     total_questions -- Total number of questions
-    detailed_results -- List of detailed results for each question
+    detailed_results -- Detailed results for each question
 
     Returns:
-    HTML string for the results page
+    An iterator over the chunks of HTML of the results page
     """
+    # La capçalera es resol ara: el cos s'envia quan la petició ja ha alliberat la seva organització
+    return _results_chunks(base_html(), score, total_questions, detailed_results)
+
+def _results_chunks(header: str, score: int, total_questions: int, detailed_results: Iterable[Dict[str, Any]]) -> Iterator[str]:
     percentage = (score / total_questions) * 100  
-    html= BASE_HTML  
-    html += f'<h1>Your score is: {score} out of {total_questions} ({percentage:.2f}%)</h1>'
-    html += '<h2>Detailed answers:</h2>'
+    yield header
+    yield f'<h1>Your score is: {score} out of {total_questions} ({percentage:.2f}%)</h1>'
+    yield '<h2>Detailed answers:</h2>'
     
     for i, result in enumerate(detailed_results, 1):
-        html += f"<{QUESTION_STYLE}>{i}. {result['question']}</{QUESTION_STYLE}>"
+        html = f"<{QUESTION_STYLE}>{i}. {result['question']}</{QUESTION_STYLE}>"
         
         if result['is_correct']:
             # If the answer is correct, show only the correct answer in green
@@ -342,16 +486,21 @@ def generate_results_html(score: int, total_questions: int, detailed_results: Li
             html += '<p><span style="color: black;">Correct answer: </span>'
             html += f'<span style="color: green;">{", ".join(result["correct_answers"])}</span></p>'
         
-        html += "<hr>"
+        yield minify_html(html) + "<hr>"
      
-        html += '<form method="get" action="/download_results">'
+    html = '<form method="get" action="/download_results">'
     html += '<input type="submit" value="Download Exam Results" />'
     html += '</form>'
     html += '<form method="get" action="/">'
     html += '<input type="submit" value="New Exam" />'
     html += '</form>'
-    
-    return html
+    yield html
+
+def generate_results_html(score: int, total_questions: int, detailed_results: List[Dict[str, Any]]) -> str:
+    """
+    Generate HTML for the results page as a single string.
+    """
+    return ''.join(iter_results_html(score, total_questions, detailed_results))
 
 def add_redirect(BASE_HTML, redirect_url, delay=5):
     # Creem la metaetiqueta de redirecció
@@ -405,11 +554,64 @@ def add_redirect(BASE_HTML, redirect_url, delay=5):
 
 # ---------------------| Variables |------------------
 
-header = load_cfg(f"static/theme/{THEME}/header.cfg")
-# load theme
-HEADER = f"<head>{header}</head>".replace("@THEME", THEME)
-HEADER = HEADER.replace("@TITLE", TITLE)
-BASE_HTML = f'<html>{HEADER}<body>\n'
+# Capçalera de cada pàgina, amb el tema i el títol de cada instància
+_base_html: Dict[str, str] = {}
+
+def base_html() -> str:
+    """
+    Start of every page, with the theme and title of the current tenant.
+    """
+    tenant = current_tenant()
+    html = _base_html.get(tenant.name)
+    if html is None:
+        header = load_cfg(f"static/theme/{tenant.theme}/header.cfg")
+        # load theme
+        header = f"<head>{header}</head>".replace("@THEME", tenant.theme)
+        header = header.replace("@TITLE", tenant.title)
+        if PWA_ENABLED:
+            header = header.replace('</head>', '<link rel="manifest" href="/manifest.webmanifest"></head>')
+        html = _base_html[tenant.name] = minify_html(f'<html>{header}<body>\n')
+    return html
+
+@app.before_request
+def select_tenant():
+    g.tenant_token = use_tenant(tenant_for_host(request.host))
+
+@app.teardown_request
+def release_tenant(exc=None):
+    token = g.pop('tenant_token', None)
+    if token is not None:
+        reset_tenant(token)
+
+@app.before_request
+def limit_heavy_requests():
+    """
+    Rate-limit each client on the expensive endpoints and admit them through a bounded queue.
+    """
+    endpoint = request.endpoint
+    if endpoint not in RATE_LIMITS and endpoint not in ADMISSION_ENDPOINTS:
+        return
+    # Els candidats d'una mateixa aula comparteixen IP: es limita per sessió quan n'hi ha.
+    # Només compta una sessió que és al magatzem (una de nova és buida): amb una galeta
+    # inventada a cada petició no s'estrena un cubell nou cada vegada
+    if session:
+        wait = check_rate(endpoint, f"session:{session.sid}")
+    else:
+        wait = check_rate(endpoint, f"address:{request.remote_addr}", RATE_LIMIT_ADDRESS_SCALE)
+    if wait:
+        raise TooManyRequests('Too many requests, please wait a moment.', retry_after=math.ceil(wait))
+    if endpoint in ADMISSION_ENDPOINTS:
+        try:
+            g.admitted_at = admission.acquire()
+        except Overloaded as e:
+            raise ServiceUnavailable('The server is busy, please try again in a moment.',
+                                     retry_after=e.retry_after)
+
+@app.teardown_request
+def release_admission(exc=None):
+    started = g.pop('admitted_at', None)
+    if started is not None:
+        admission.release(started)
 
 # --------------------------- Main app ------------------
 @app.route('/')
@@ -417,7 +619,7 @@ def index():
     """
     Route for the index page.
     """
-    topics = get_syllabus(EXAMS_FOLDER)
+    topics = get_syllabus(current_tenant().exams_folder)
     return render_template_string(generate_topic_selection_html(topics))
 
 @app.route('/select_topic', methods=['POST'])
@@ -440,25 +642,105 @@ def select_exam():
     course = request.form.get('course')
     selected_exams = request.form.getlist('exam')  # This will get multiple selected exams
     if course and selected_exams:
-        session['course'] = course
+        tenant = current_tenant()
+        session['course'] = tenant.course_key(course)
         session['selected_exams'] = selected_exams
-        questions_answers = process_files(course, selected_exams)
-        
-        # Shuffle the questions if needed
-        random.shuffle(questions_answers)
-        
-        # Limit to EXAM_QUESTIONS if needed
-        questions_answers = questions_answers[:EXAM_QUESTIONS]
-        
-        session['questions_answers'] = questions_answers
-        session['user_answers'] = {f'question{i+1}': [] for i in range(len(questions_answers))}
+        bank = load_bank(course, selected_exams)
+
+        # L'intent és només (versió del banc, llavor, nombre de preguntes): l'ordre
+        # de preguntes i respostes es reconstrueix a cada pàgina
+        exam = hand_out_variant(session['course'], selected_exams, bank) or new_exam(bank, tenant.exam_questions)
+        session['exam'] = exam
+        session['user_answers'] = {}
+        session['answer_seqs'] = {}
+
+        # Examen amb temps: el servidor el lliura automàticament quan venç
+        if tenant.exam_time_limit:
+            deadline = time.time() + tenant.exam_time_limit * 60
+            attempt_id = start_active(session.sid, session['course'], selected_exams, exam, deadline)
+            session['deadline'] = deadline
+            scheduler.schedule(attempt_id, deadline, expire_attempt)
+        else:
+            attempt_id = uuid.uuid4().hex
+        session['attempt_id'] = attempt_id
+        bus.publish(attempt_id, status='active', course=session['course'], page=1, answered=0,
+                    total=exam['count'], deadline=session.get('deadline'))
         return redirect(url_for('quiz'))
     return redirect(url_for('index'))
 
+# Capçalera de les pàgines que el service worker precarrega per a fer-les servir sense xarxa
+PREFETCH_HEADER = 'X-Examinator-Prefetch'
+
+# Cookie que identifica l'alumne entre sessions per al mode de pràctica
+LEARNER_COOKIE = 'examinator_learner'
+
+@app.route('/practice', methods=['POST'])
+def practice():
+    """
+    Route for a spaced-repetition practice session over the selected exams.
+    """
+    course = request.form.get('course')
+    selected_exams = request.form.getlist('exam')
+    if not course or not selected_exams:
+        return redirect(url_for('index'))
+    learner = request.cookies.get(LEARNER_COOKIE) or uuid.uuid4().hex
+    course_key = current_tenant().course_key(course)
+    bank = load_bank(course, selected_exams)
+    order = pick_questions(learner, course_key, bank, PRACTICE_QUESTIONS)
+
+    session.pop('deadline', None)
+    session['course'] = course_key
+    session['selected_exams'] = selected_exams
+    session['learner'] = learner
+    session['exam'] = {'version': bank.version, 'tenant': bank.tenant, 'seed': secrets.randbits(63), 'count': len(order),
+                       'order': order, 'practice': True}
+    session['user_answers'] = {}
+    session['answer_seqs'] = {}
+    session['attempt_id'] = uuid.uuid4().hex
+    bus.publish(session['attempt_id'], status='practice', course=course_key, page=1, answered=0,
+                total=len(order), deadline=None)
+
+    response = redirect(url_for('quiz'))
+    response.set_cookie(LEARNER_COOKIE, learner, max_age=365 * 86400, httponly=True, samesite='Lax')
+    return response
+
+
+@app.errorhandler(BankLintError)
+def bank_lint_error(error):
+    """
+    Page shown when the selected exams include a file that fails lint.
+    """
+    html = base_html()
+    html += f'<h2>The exam {error.file_name} has errors and can\'t be loaded</h2>\n<ul>\n'
+    for issue in error.issues:
+        if issue['severity'] == 'error':
+            html += f"<li>Line {issue['line']}: {issue['message']} ({issue['code']})</li>\n"
+    html += '</ul>\n<p>Run <code>python lint.py --format text</code> for the full report.</p>\n'
+    html += '<form method="get" action="/"><input type="submit" value="Back" /></form>\n'
+    html += '</body></html>'
+    return html, 422
+
+@app.route('/assets/<digest>/<variant>')
+def serve_asset(digest, variant):
+    """
+    Attachment of a question from the asset cache. The URL names the content, so it never changes.
+    """
+    path = asset_path(digest, variant)
+    if path is None:
+        return '', 404
+    if variant == 'original' and os.path.splitext(path)[1].lower() not in IMAGE_EXTENSIONS:
+        # Un adjunt qualsevol de la volta (html, svg...) no s'obre mai al lloc: es descarrega
+        response = send_file(os.path.abspath(path), mimetype='application/octet-stream', as_attachment=True,
+                             conditional=True, max_age=31536000)
+    else:
+        response = send_file(os.path.abspath(path), conditional=True, max_age=31536000)
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
 
 @app.route('/certificate_error')
 def certificate_error():
-    html=BASE_HTML
+    html = base_html()
     html+="<p>La contrasenya proporcionada per al certificat és incorrecta.</p>"
     return render_template_string(html)
 
@@ -474,9 +756,10 @@ def download_results():
         return redirect(url_for('pdfnotfound'))  # Redirigeix a la pàgina que tu vulguis
     
     try:
-        pdf_buffer = generate_pdf(score, total_questions, detailed_results)
-        signed_pdf = sign_pdf(pdf_buffer.getvalue())
-        
+        with generate_pdf(score, total_questions, detailed_results) as pdf_buffer:
+            signed_pdf = sign_pdf(pdf_buffer)
+        # send_file l'envia a trossos i el tanca en acabar
+
         return send_file(
             signed_pdf,
             as_attachment=True,
@@ -527,16 +810,118 @@ def admin():
     
     return render_template('admin.html', config_vars=config_vars)
 
+@app.route('/admin/housekeeping', methods=['GET', 'POST'])
+def admin_housekeeping():
+    """
+    Session and attempt collector metrics. A POST runs a collection right away.
+    """
+    if request.method == 'POST':
+        return jsonify(run_gc(SESSION_FOLDER))
+    return jsonify(METRICS)
+
+@app.route('/admin/variants', methods=['GET', 'POST'])
+def admin_variants():
+    """
+    Pools of pre-generated exam variants. A POST (course, exam files and optionally
+    variants) builds the pool of that selection ahead of a mass sitting.
+    """
+    if request.method == 'POST':
+        course = request.form.get('course')
+        selected_exams = request.form.getlist('exam')
+        if not course or not selected_exams:
+            return jsonify({'error': 'course and exam are required'}), 400
+        variants = int(request.form.get('variants', VARIANT_POOL_SIZE))
+        tenant = current_tenant()
+        bank = load_bank(course, selected_exams)
+        return jsonify(build_pool(tenant.course_key(course), selected_exams, bank, tenant.exam_questions, variants))
+    return jsonify(list_pools())
+
+@app.route('/admin/tenants')
+def admin_tenants():
+    """
+    Tenants and the memory use of their bank caches.
+    """
+    stats = cache_stats()
+    return jsonify([{
+        'name': tenant.name,
+        'hosts': tenant.hosts,
+        'exams_folder': tenant.exams_folder,
+        'theme': tenant.theme,
+        'bank_cache': stats.get(tenant.name, {'banks': 0, 'bytes': 0, 'quota_bytes': tenant.bank_cache_bytes,
+                                              'evictions': 0}),
+    } for tenant in list_tenants()])
+
+@app.route('/admin/banks')
+def admin_banks():
+    """
+    Bank loader metrics (loads run and coalesced waits) and the bank caches of every tenant, decoded questions included.
+    """
+    return jsonify({'loader': loader_stats(), 'caches': cache_stats()})
+
+@app.route('/admin/banks/history')
+def admin_bank_history():
+    """
+    The versions of every bank of the current tenant, with what changed in each one.
+    """
+    return jsonify(bank_histories(current_tenant().name))
+
+@app.route('/admin/banks/diff')
+def admin_bank_diff():
+    """
+    Questions added, removed and changed between two versions (?old=...&new=...) of a bank.
+    """
+    tenant = current_tenant().name
+    versions = [request.args.get('old', ''), request.args.get('new', '')]
+    if not all(re.fullmatch(r'[0-9a-f]{16}', version) for version in versions):
+        return jsonify({'error': 'unknown version'}), 404
+    old, new = (get_bank(version, tenant) for version in versions)
+    if old is None or new is None:
+        return jsonify({'error': 'unknown version'}), 404
+    return jsonify(diff_versions(old, new))
+
+@app.route('/admin/limits')
+def admin_limits():
+    """
+    Requests rejected by the rate limiter and state of the admission controller.
+    """
+    return jsonify(limits_stats())
+
+@app.route('/admin/proctor')
+def admin_proctor():
+    """
+    Live view of the attempts in progress.
+    """
+    return render_template_string(generate_proctor_html())
+
+@app.route('/admin/proctor/stream')
+def admin_proctor_stream():
+    """
+    The live stream of the dashboard is served by asgi.py without a thread per watcher: only reached without it.
+    """
+    raise ServiceUnavailable('The live proctor dashboard needs the ASGI server (asgi.py).')
+
+def generate_proctor_html():
+    html = base_html()
+    html += '<h2>Exàmens en curs</h2>\n'
+    html += '<table class="proctor-table">\n'
+    html += '<thead><tr><th>Intent</th><th>Curs</th><th>Pàgina</th><th>Respostes</th>'
+    html += '<th>Temps restant</th><th>Última activitat</th></tr></thead>\n'
+    html += '<tbody id="proctorRows"></tbody>\n'
+    html += '</table>\n'
+    html += '<script src="/static/js/proctor.js"></script>\n'
+    html += '</body></html>'
+    return html
+
 @app.route('/pdfnotfound')
 def pdfnotfound():
-    html=add_redirect(BASE_HTML, '/', 2)
+    html=add_redirect(base_html(), '/', 2)
     html+="No exam results available"
       
     return render_template_string(html), 400
 
-def generate_quiz_html(questions_answers, current_page, total_questions, saved_answers):
-    html = BASE_HTML
-
+def generate_quiz_html(questions_answers, current_page, total_questions, saved_answers, deadline=None,
+                       attempt_id=None, sync_seq=0):
+    html = base_html()
     total_pages = (total_questions + QUESTIONS_PER_PAGE - 1) // QUESTIONS_PER_PAGE
 
     # Modal de confirmació
@@ -559,31 +944,37 @@ def generate_quiz_html(questions_answers, current_page, total_questions, saved_a
     </div>
     <p class="quiz-page-label">Pregunta {current_page} de {total_pages}</p>
     '''
-
-    html += '<form id="quizForm" method="post">\n'
+    if deadline:
+        html += f'<p class="quiz-timer" id="quizTimer" data-deadline="{int(deadline)}"></p>\n'
+
+    if PWA_ENABLED and attempt_id:
+        # Amb el client fora de línia, les respostes van per /quiz/sync (vegeu quiz.js)
+        html += (f'<form id="quizForm" method="post" data-attempt="{attempt_id}" data-page="{current_page}" '
+                 f'data-pages="{total_pages}" data-seq="{sync_seq}" data-sync-seconds="{ANSWER_SYNC_SECONDS}">\n')
+        html += '<p class="sync-status" id="syncStatus" hidden></p>\n'
+    else:
+        html += '<form id="quizForm" method="post">\n'
 
     offset = (current_page - 1) * QUESTIONS_PER_PAGE
 
     for i, question in enumerate(questions_answers, offset + 1):
-        html += f'<div class="quiz-question">\n'
-        html += f'<p class="question-text"><span class="question-num">{i}.</span> {question["question"]}</p>\n'
+        data_id = f' data-id="{question["id"]}"' if question.get('id') else ''
+        html += f'<div class="quiz-question"{data_id}>\n'
+        html += f'<div class="question-text"><span class="question-num">{i}.</span> {question["question"]}</div>\n'
         key = f'question{i}'
-        user_answers = saved_answers.get(str(i), [])
+        # Les opcions s'envien pel seu id; la resposta desada és una màscara de bits d'ids
+        saved = saved_answers.get(str(i))
 
         html += '<div class="answer-list">\n'
-        if len(question['correct']) == 1 and len(question['answers']) == 1:
-            value = user_answers[0] if user_answers else ""
+        if is_text_question(question):
+            value = html_lib.escape(saved) if isinstance(saved, str) else ""
             html += f'<input type="text" name="{key}" value="{value}" />\n'
-        elif len(question['correct']) == 1:
-            for ans_idx, answer in enumerate(question['answers'], 1):
-                checked = 'checked' if answer in user_answers else ''
-                hint = f'<span class="key-hint">{ans_idx}</span>' if ans_idx <= 9 else ''
-                html += f'<label class="answer-option">{hint}<input type="radio" name="{key}" value="{answer}" {checked}><span>{answer}</span></label>\n'
         else:
-            for ans_idx, answer in enumerate(question['answers'], 1):
-                checked = 'checked' if answer in user_answers else ''
+            input_type = 'radio' if len(question['correct']) == 1 else 'checkbox'
+            for ans_idx, (option_id, answer) in enumerate(zip(question['option_ids'], question['answers']), 1):
+                checked = 'checked' if isinstance(saved, int) and saved >> option_id & 1 else ''
                 hint = f'<span class="key-hint">{ans_idx}</span>' if ans_idx <= 9 else ''
-                html += f'<label class="answer-option">{hint}<input type="checkbox" name="{key}" value="{answer}" {checked}><span>{answer}</span></label>\n'
+                html += f'<label class="answer-option">{hint}<input type="{input_type}" name="{key}" value="{option_id}" {checked}><span>{answer}</span></label>\n'
         html += '</div>\n'
         html += '</div>\n'
 
@@ -606,35 +997,134 @@ def generate_quiz_html(questions_answers, current_page, total_questions, saved_a
     html += '<input type="hidden" id="finishAction" name="action" value="" />\n'
     html += '</form>\n'
     html += '</body></html>'
-    return html
+    return minify_html(html)
 
-@app.route('/quiz', methods=['GET', 'POST'])
-def quiz():
-    if 'questions_answers' not in session:
-        return redirect(url_for('index'))
+def save_answers(data, form: Dict[str, List[str]], answer_seqs: Dict[str, int] = None):
+    """
+    Store the answers posted from a quiz page in the attempt.
 
-    questions_answers = session['questions_answers']
-    total_questions = len(questions_answers)
+    Args:
+    data -- The session (or any mapping holding the attempt)
+    form -- Posted fields, as a dictionary name -> list of values
+    answer_seqs -- Sequence numbers of the synced answers, stored along with them
+    """
+    user_answers = data.get('user_answers', {})
+
+    # Processar totes les claus que comencen amb 'question'
+    posted = {int(key[8:]): values for key, values in form.items()
+              if key.startswith('question') and key[8:].isdigit() and 0 < int(key[8:]) <= data['exam']['count']}
+    if posted:
+        first = min(posted)
+        questions = attempt_questions(data, first - 1, max(posted))
+        for number, values in posted.items():
+            question = questions[number - first]
+            if is_text_question(question):
+                user_answers[str(number)] = values[0] if values else ''
+            else:
+                # Ids d'opció desconeguts o mal formats s'ignoren
+                n_options = len(question['answers'])
+                user_answers[str(number)] = sum({1 << int(value) for value in values
+                                                 if value.isdigit() and int(value) < n_options})
+
+    data['user_answers'] = user_answers
+    if answer_seqs is not None:
+        data['answer_seqs'] = answer_seqs
+    if 'deadline' in data:
+        update_active(data['attempt_id'], user_answers, answer_seqs)
+    if 'attempt_id' in data:
+        bus.publish(data['attempt_id'], answered=sum(1 for answer in user_answers.values() if answer))
+
+def sync_answers(data, batch: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Apply a batch of answer changes sent by the quiz client.
 
-    if 'user_answers' not in session:
-        session['user_answers'] = {}
+    A change names its question by id ('id'), or by its number in the attempt
+    ('question'), and carries the chosen option ids ('options') or the text
+    ('text'), plus a sequence number that grows with every change the client
+    makes. A change that isn't newer than the last one applied to its question
+    is ignored, so the client can retry and coalesce batches freely. The whole
+    batch is one write to the attempt store and, if nothing in it is new,
+    the session isn't written at all. For an untimed attempt the store is the
+    session itself, written whole: quiz.js never has two batches in flight.
 
-    user_answers = session['user_answers']
+    Args:
+    data -- The session (or any mapping holding the attempt)
+    batch -- The posted batch: {'attempt': id, 'changes': [{'id', 'options' | 'text', 'seq'}, ...]}
+
+    Returns:
+    For each question of the batch (as the client named it), the sequence number of the answer kept
+    """
+    changes = [change for change in batch.get('changes') or [] if isinstance(change, dict)]
+    positions = None
+    if any('id' in change for change in changes):
+        exam = data['exam']
+        bank = get_bank(exam['version'], exam.get('tenant', DEFAULT_TENANT))
+        if bank is None:
+            raise LookupError(f"Question bank {exam['version']} is not available")
+        positions = exam_positions(bank, exam)
+
+    seqs = data.get('answer_seqs', {})
+    newest = {}
+    names = {}
+    for change in changes:
+        try:
+            seq = int(change['seq'])
+            if 'id' in change:
+                number = positions[str(change['id'])] + 1
+            else:
+                number = int(change['question'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if 'text' in change:
+            values = [str(change['text'])]
+        elif isinstance(change.get('options'), list):
+            values = [str(option) for option in change['options']]
+        else:
+            continue
+        if not 0 < number <= data['exam']['count']:
+            continue
+        key = str(number)
+        names[str(change.get('id', number))] = key
+        # Dins d'un mateix lot també mana el canvi més nou
+        if seq > seqs.get(key, 0) and seq > newest.get(key, (0, None))[0]:
+            newest[key] = (seq, values)
+
+    if newest:
+        seqs = dict(seqs, **{key: seq for key, (seq, _) in newest.items()})
+        save_answers(data, {f'question{key}': values for key, (_, values) in newest.items()}, seqs)
+    return {name: seqs.get(key, 0) for name, key in names.items()}
+
+def page_context(data, current_page: int, publish: bool = True):
+    """
+    Questions and saved answers of one quiz page.
+
+    Args:
+    data -- The session (or any mapping holding the attempt)
+    current_page -- The page, 1-based
+    publish -- Report the page to the proctor (not for pages the offline client prefetches)
+
+    Returns:
+    The questions of the page and the answers saved for them
+    """
+    user_answers = data.get('user_answers', {})
+    start = (current_page - 1) * QUESTIONS_PER_PAGE
+    end = min(start + QUESTIONS_PER_PAGE, data['exam']['count'])
+    saved_answers = {str(i): user_answers[str(i)] for i in range(start + 1, end + 1) if str(i) in user_answers}
+    # La pàgina que es mostra és el progrés que veu el vigilant
+    if publish and 'attempt_id' in data:
+        bus.publish(data['attempt_id'], page=current_page)
+    return attempt_questions(data, start, end), saved_answers
+
+@app.route('/quiz', methods=['GET', 'POST'])
+def quiz():
+    expired = check_deadline(session)
+    if expired:
+        return expired
+    if 'exam' not in session:
+        return redirect(url_for('index'))
 
     if request.method == 'POST':
-        # Processar totes les claus que comencen amb 'question'
-        processed_questions = set()
-        for key in request.form.keys():
-            if key.startswith('question'):
-                question_number = int(key[8:])
-                if question_number not in processed_questions:
-                    # Utilitzar getlist per obtenir tots els valors seleccionats
-                    values = request.form.getlist(key)
-                    user_answers[str(question_number)] = values
-                    processed_questions.add(question_number)
-
-        session['user_answers'] = user_answers
-        session.modified = True
+        save_answers(session, request.form.to_dict(flat=False))
 
         # Comprovar si s'ha premut Finish Exam
         if request.form.get('action') == 'Finish Exam':
@@ -653,59 +1143,181 @@ def quiz():
             return redirect(url_for('quiz', page=current_page))
     
     current_page = int(request.args.get('page', 1))
-    start = (current_page - 1) * QUESTIONS_PER_PAGE
-    end = min(start + QUESTIONS_PER_PAGE, total_questions)
-    page_questions = questions_answers[start:end]
+    page_questions, saved_answers = page_context(session, current_page,
+                                                 publish=PREFETCH_HEADER not in request.headers)
     
-    saved_answers = {str(i): user_answers.get(str(i), []) for i in range(start + 1, end + 1)}
-    
-    html = generate_quiz_html(page_questions, current_page, total_questions, saved_answers)
+    html = generate_quiz_html(page_questions, current_page, session['exam']['count'], saved_answers, session.get('deadline'),
+                              session.get('attempt_id'), max(session.get('answer_seqs', {}).values(), default=0))
     return render_template_string(html)
 
-def process_exam_results():
-    questions_answers = session['questions_answers']
-    user_answers = session['user_answers']
-    score = 0
-    detailed_results = []
-    
-    for i, question in enumerate(questions_answers, 1):
-        user_answer = user_answers.get(str(i), [])
-        correct_answers = set(question['correct'])
-        is_correct = False
-        
-        if len(question['correct']) == 1 and len(question['answers']) == 1:
-            user_answer = user_answer[0] if user_answer else ""
-            is_correct = user_answer.lower() == question['correct'][0].lower()
-        elif len(question['correct']) == 1:
-            user_answer = user_answer[0] if user_answer else ""
-            is_correct = user_answer in correct_answers
-        else:
-            is_correct = set(user_answer) == correct_answers
-        
-        if is_correct:
-            score += 1
-        
-        detailed_results.append({
-            'question': question['question'],
-            'user_answer': user_answer,
-            'correct_answers': question['correct'],
-            'is_correct': is_correct
-        })
+@app.route('/quiz/save', methods=['POST'])
+def quiz_save():
+    """
+    Autosave of the answers of the current page, without navigating.
+    """
+    if check_deadline(session) or 'exam' not in session:
+        return '', 409
+    save_answers(session, request.form.to_dict(flat=False))
+    return '', 204
+
+@app.route('/quiz/sync', methods=['POST'])
+def quiz_sync():
+    """
+    Batched, idempotent upload of the answer changes queued by the offline client.
+    """
+    batch = request.get_json(silent=True)
+    if not isinstance(batch, dict):
+        return jsonify({'error': 'expected a JSON object'}), 400
+    if check_deadline(session) or 'exam' not in session or batch.get('attempt') != session.get('attempt_id'):
+        # L'intent ja s'ha lliurat (o és un altre): el client deixa de sincronitzar
+        return jsonify({'error': 'no attempt in progress'}), 409
+    return jsonify({'acks': sync_answers(session, batch)})
+
+@app.route('/sw.js')
+def service_worker():
+    """
+    Service worker of the offline exam client, served from the root so it controls every page.
+    """
+    response = send_file(os.path.abspath('static/js/sw.js'), mimetype='application/javascript', max_age=0)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/manifest.webmanifest')
+def web_manifest():
+    tenant = current_tenant()
+    response = jsonify({
+        'name': tenant.app_name,
+        'short_name': tenant.title,
+        'start_url': '/',
+        'scope': '/',
+        'display': 'standalone',
+    })
+    response.mimetype = 'application/manifest+json'
+    return response
+
+def process_exam_results(data=None):
+    """
+    Grade and persist the attempt held in data (the session by default).
+
+    Returns:
+    The results page, streamed (see iter_results_html)
+    """
+    data = session if data is None else data
+    questions_answers = attempt_questions(data)
+    user_answers = data['user_answers']
+    score, detailed_results = grade_attempt(questions_answers, user_answers)
+
+    attempt_id = data.pop('attempt_id', None)
+    if 'deadline' in data:
+        scheduler.cancel(attempt_id)
+        if claim_active(attempt_id) is None:
+            # El planificador ja l'ha lliurat pel seu compte
+            return show_attempt_results(attempt_id, data)
+        data.pop('deadline', None)
+    data['attempt_id'] = save_attempt(data.get('course'), data.get('selected_exams', []),
+                                      questions_answers, user_answers, score, GRADING_SCHEME, attempt_id,
+                                      data['exam']['version'], data['exam'].get('practice', False))
+    bus.publish(data['attempt_id'], status='finished', score=score)
+    if data['exam'].get('practice'):
+        record_reviews(data['learner'], data.get('course'), questions_answers, detailed_results)
     
-    session['score'] = score
-    session['total_questions'] = len(questions_answers)
-    session['detailed_results'] = detailed_results
+    data['score'] = score
+    data['total_questions'] = len(questions_answers)
+    data['detailed_results'] = detailed_results
     
-    session.pop('user_answers', None)
-    session.pop('questions_answers', None)
-    return generate_results_html(score, len(questions_answers), detailed_results)
+    data.pop('user_answers', None)
+    data.pop('exam', None)
+    return iter_results_html(score, len(questions_answers), detailed_results)
+
+def show_attempt_results(attempt_id: str, data):
+    """
+    Show the results of an attempt that was already submitted (e.g. when its time ran out).
+
+    Returns:
+    The results page, streamed, or a redirection to the index if the attempt is gone
+    """
+    attempt = load_attempt(attempt_id)
+    if attempt is None:
+        data.clear()
+        return redirect('/')
+    score, detailed_results = grade_attempt(attempt['questions'], attempt_user_answers(attempt), attempt['scheme'])
+
+    data.clear()
+    data['attempt_id'] = attempt_id
+    data['score'] = score
+    data['total_questions'] = attempt['total']
+    data['detailed_results'] = detailed_results
+    return iter_results_html(score, attempt['total'], detailed_results)
+
+def check_deadline(data):
+    """
+    Enforce the time limit of the attempt held in data.
+
+    Returns:
+    The results page if the attempt is over, None if it can go on
+    """
+    if data.get('expired'):
+        return show_attempt_results(data['attempt_id'], data)
+    if 'deadline' in data and 'exam' in data and time.time() >= data['deadline']:
+        return process_exam_results(data)
+    return None
+
+def expire_attempt(attempt_id: str):
+    """
+    Submit an attempt whose deadline expired and free its session storage.
+
+    Runs in the deadline scheduler thread, outside of any request.
+    """
+    record = claim_active(attempt_id)
+    if record is None:
+        return
+    questions = attempt_questions(record)
+    user_answers = record['user_answers']
+    score, _ = grade_attempt(questions, user_answers)
+    save_attempt(record['course'], record['files'], questions, user_answers, score, GRADING_SCHEME, attempt_id,
+                 record['exam']['version'])
+
+    # Substituïm la sessió per una de mínima: preguntes i respostes ja són a l'intent
+    interface = app.session_interface
+    interface.cache.set(interface.key_prefix + record['sid'], {'attempt_id': attempt_id, 'expired': True},
+                        timeout=int(app.permanent_session_lifetime.total_seconds()))
+    bus.publish(attempt_id, status='expired', score=score)
+    print(f"Attempt {attempt_id} expired, submitted with score {score}")
+
+def resume_active_attempts():
+    """
+    Schedule again the deadlines of the attempts that were in progress when the app stopped.
+    """
+    for record in iter_active():
+        scheduler.schedule(record['id'], record['deadline'], expire_attempt)
+
+_background_lock = threading.Lock()
+_background_started = False
+
+def start_background_tasks():
+    """
+    Start the work of a serving process: the deadlines of the attempts in progress and the housekeeper.
+
+    Called by the entry points (python examinator.py, wsgi.py and the ASGI lifespan
+    startup), never on import: the tools and tests that import the app don't start
+    its threads. Calling it again does nothing.
+    """
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+    resume_active_attempts()
+    start_housekeeper(SESSION_FOLDER)
 
 @app.route('/exam_summary', methods=['GET', 'POST'])
 def exam_summary():
-    if 'questions_answers' not in session or 'user_answers' not in session:
+    expired = check_deadline(session)
+    if expired:
+        return expired
+    if 'exam' not in session or 'user_answers' not in session:
         return redirect(url_for('index'))
     
-    questions_answers = session['questions_answers']
     user_answers = session['user_answers']
     
     if request.method == 'POST':
@@ -714,17 +1326,17 @@ def exam_summary():
         else:
             return redirect(url_for('quiz'))
     
-    html = generate_summary_html(questions_answers, user_answers)
+    html = generate_summary_html(attempt_questions(session), user_answers)
     return render_template_string(html)
 
 def generate_summary_html(questions_answers, user_answers):
-    html = BASE_HTML
+    html = base_html()
     html += '<h2>Resum de l\'examen</h2>'
     html += '<form method="post">'
     
     for i, question in enumerate(questions_answers, 1):
         html += f"<h3>{i}. {question['question']}</h3>"
-        user_answer = user_answers.get(str(i), [])
+        user_answer = decode_answer(question, user_answers.get(str(i), []))
         
         for answer in question['answers']:
             checked = 'checked' if answer in user_answer else ''
@@ -736,7 +1348,8 @@ def generate_summary_html(questions_answers, user_answers):
     html += '<input type="submit" name="action" value="Return to Exam">'
     html += '</form>'
     html += '</body></html>'
-    return html
+    return minify_html(html)
 
 if __name__ == '__main__':
+    start_background_tasks()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,224 @@
+# Base imports
+import html
+import random
+import time
+from typing import List, Dict, Any, Tuple, Sequence
+
+# custom imports
+from config import GRADING_SCHEME
+from config import NEGATIVE_MARK_PERCENT
+
+# Motor de correcció per lots: cada resposta es codifica com una màscara de bits
+# sobre les opcions de la pregunta i la puntuació surt d'una taula precalculada.
+
+SCHEMES = ('all_or_nothing', 'partial', 'negative')
+
+# Per sobre d'aquest nombre d'opcions no precalculem la taula (2^n entrades)
+MAX_TABLE_OPTIONS = 10
+
+
+def is_text_question(question: Dict[str, Any]) -> bool:
+    """
+    A question with a single answer that is also the correct one is answered with free text.
+    """
+    return len(question['correct']) == 1 and len(question['answers']) == 1
+
+
+def option_ids(question: Dict[str, Any]) -> Sequence[int]:
+    """
+    Stable ids of the options of a question, in the order they are shown.
+
+    The id of an option is its position in the exam file, so it doesn't depend
+    on the order the answers were shuffled to in an attempt.
+    """
+    return question.get('option_ids') or range(len(question['answers']))
+
+
+def option_bits(question: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Map every answer string of a question to the bit of its option id.
+    """
+    return {answer: 1 << option_id for option_id, answer in zip(option_ids(question), question['answers'])}
+
+
+def encode_answer(bits: Dict[str, int], user_answer) -> int:
+    """
+    Encode the answers chosen by the user as a bitmask.
+
+    Args:
+    bits -- Mapping answer -> bit, as returned by option_bits
+    user_answer -- A bitmask of option ids, a single answer string or a list of them
+
+    Returns:
+    The bitmask of the selected options (unknown answers are ignored)
+    """
+    if isinstance(user_answer, int):
+        return user_answer
+    if isinstance(user_answer, str):
+        user_answer = [user_answer] if user_answer else []
+    mask = 0
+    for answer in user_answer:
+        mask |= bits.get(answer, 0)
+    return mask
+
+
+def decode_answer(question: Dict[str, Any], user_answer) -> List[str]:
+    """
+    Text of the options chosen by the user, in the order they are shown. Only needed to render them.
+
+    The options are already HTML; a free-text answer is escaped so it can be rendered as well.
+    """
+    if isinstance(user_answer, int):
+        return [answer for option_id, answer in zip(option_ids(question), question['answers'])
+                if user_answer >> option_id & 1]
+    if isinstance(user_answer, str):
+        return [html.escape(user_answer, quote=False)] if user_answer else []
+    return list(user_answer)
+
+
+def score_mask(selected: int, correct: int, scheme: str = GRADING_SCHEME,
+               penalty: float = NEGATIVE_MARK_PERCENT / 100) -> float:
+    """
+    Score one answered question.
+
+    Args:
+    selected -- Bitmask of the options chosen by the user
+    correct -- Bitmask of the correct options
+    scheme -- One of SCHEMES
+    penalty -- Points subtracted for a wrong answer with the 'negative' scheme
+
+    Returns:
+    The points obtained, between -penalty and 1
+    """
+    if scheme == 'all_or_nothing':
+        return 1 if selected == correct else 0
+    if scheme == 'partial':
+        total = correct.bit_count()
+        if not total:
+            return 0
+        hits = (selected & correct).bit_count()
+        misses = (selected & ~correct).bit_count()
+        return max(0, hits - misses) / total
+    if scheme == 'negative':
+        if selected == correct:
+            return 1
+        return -penalty if selected else 0
+    raise ValueError(f"Unknown grading scheme: {scheme}")
+
+
+class CompiledQuestion:
+    """
+    A question prepared for grading: option bits, correct mask and score table.
+    """
+    __slots__ = ('question', 'text', 'bits', 'correct', 'table', 'scheme', 'penalty')
+
+    def __init__(self, question: Dict[str, Any], scheme: str = GRADING_SCHEME,
+                 penalty: float = NEGATIVE_MARK_PERCENT / 100):
+        self.question = question
+        self.scheme = scheme
+        self.penalty = penalty
+        self.text = is_text_question(question)
+        self.bits = option_bits(question)
+        # Les preguntes del banc ja porten la màscara; els intents desats, només el text
+        mask = question.get('correct_mask')
+        self.correct = mask if mask is not None else encode_answer(self.bits, question['correct'])
+        self.table = None
+        n_options = len(question['answers'])
+        if not self.text and n_options <= MAX_TABLE_OPTIONS:
+            self.table = [score_mask(mask, self.correct, scheme, penalty) for mask in range(1 << n_options)]
+
+    def score(self, user_answer) -> float:
+        if self.text:
+            user_answer = user_answer[0] if isinstance(user_answer, list) and user_answer else user_answer
+            if not user_answer:
+                return 0
+            # La resposta correcta és HTML escapat; la del candidat, text tal qual
+            if user_answer.lower() == html.unescape(self.question['correct'][0]).lower():
+                return 1
+            return -self.penalty if self.scheme == 'negative' else 0
+        mask = encode_answer(self.bits, user_answer)
+        if self.table is not None:
+            # Els bits que no corresponen a cap opció s'ignoren
+            return self.table[mask & (len(self.table) - 1)]
+        return score_mask(mask, self.correct, self.scheme, self.penalty)
+
+
+def compile_questions(questions: Sequence[Dict[str, Any]], scheme: str = GRADING_SCHEME) -> List[CompiledQuestion]:
+    return [CompiledQuestion(question, scheme) for question in questions]
+
+
+def grade_attempt(questions: Sequence[Dict[str, Any]], user_answers: Dict[str, Any],
+                  scheme: str = GRADING_SCHEME) -> Tuple[float, List[Dict[str, Any]]]:
+    """
+    Grade a single attempt.
+
+    Args:
+    questions -- List of questions, in the order they were shown
+    user_answers -- Dictionary question number (1-based, as string) -> bitmask of option ids (or answer text)
+    scheme -- One of SCHEMES
+
+    Returns:
+    The score and the list of detailed results for each question, with the answers as text
+    """
+    score = 0
+    detailed_results = []
+    for i, compiled in enumerate(compile_questions(questions, scheme), 1):
+        question = compiled.question
+        raw_answer = user_answers.get(str(i), [])
+        points = compiled.score(raw_answer)
+        user_answer = decode_answer(question, raw_answer)
+        if len(question['correct']) == 1:
+            user_answer = user_answer[0] if user_answer else ""
+        score += points
+
+        detailed_results.append({
+            'question': question['question'],
+            'user_answer': user_answer,
+            'correct_answers': question['correct'],
+            'is_correct': points == 1,
+            'points': points
+        })
+    return score, detailed_results
+
+
+def grade_cohort(questions: Sequence[Dict[str, Any]], attempts: Sequence[Dict[str, Any]],
+                 scheme: str = GRADING_SCHEME) -> List[float]:
+    """
+    Grade many attempts over the same list of questions.
+
+    The questions are compiled only once, so each answer costs a table lookup
+    to score it (plus a dictionary lookup per option for answers given as text).
+
+    Args:
+    questions -- List of questions shared by all the attempts
+    attempts -- List of user_answers dictionaries (see grade_attempt)
+    scheme -- One of SCHEMES
+
+    Returns:
+    The list of scores, in the same order as attempts
+    """
+    compiled = compile_questions(questions, scheme)
+    keys = [str(i) for i in range(1, len(compiled) + 1)]
+    scores = []
+    for user_answers in attempts:
+        score = 0
+        for key, question in zip(keys, compiled):
+            score += question.score(user_answers.get(key, []))
+        scores.append(score)
+    return scores
+
+
+if __name__ == '__main__':
+    # Benchmark: 100k intents sobre un banc sintètic de 50 preguntes
+    questions = []
+    for q in range(50):
+        answers = [f"answer {q}-{a}" for a in range(5)]
+        correct = random.sample(answers, 1 if q % 3 else 2)
+        questions.append({'question': f"Question {q}", 'answers': tuple(answers), 'correct': correct})
+    attempts = [{str(i): sum(1 << option_id for option_id in random.sample(range(5), len(question['correct'])))
+                 for i, question in enumerate(questions, 1)} for _ in range(100000)]
+    for scheme in SCHEMES:
+        start = time.perf_counter()
+        scores = grade_cohort(questions, attempts, scheme)
+        print(f"{scheme}: graded {len(scores)} attempts in {time.perf_counter() - start:.2f}s "
+              f"(mean score {sum(scores) / len(scores):.2f})")
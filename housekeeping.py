@@ -0,0 +1,197 @@
+# Base imports
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, Tuple
+
+# external imports
+from cachelib.file import FileSystemCache
+
+# custom imports
+import attempts
+from config import ATTEMPTS_FOLDER
+from config import ATTEMPT_RETENTION_DAYS
+from config import GC_INTERVAL_MINUTES
+
+# Neteja en segon pla de sessions i intents: esborra els fitxers caducats,
+# compacta els índexs i guarda mètriques de l'espai recuperat.
+
+# Els fitxers temporals més antics que això són restes d'escriptures interrompudes
+STALE_TMP_SECONDS = 3600
+
+METRICS: Dict[str, Any] = {
+    'runs': 0,
+    'last_run': None,
+    'last_duration_ms': 0,
+    'sessions_removed': 0,
+    'attempts_removed': 0,
+    'index_entries_removed': 0,
+    'bytes_reclaimed': 0,
+}
+_metrics_lock = threading.Lock()
+
+
+class ShardedFileSystemCache(FileSystemCache):
+    """
+    FileSystemCache that spreads the files over 256 subdirectories.
+
+    The shard is the first two hex digits of the key hash, so no directory
+    grows past a few thousand entries even with hundreds of thousands of sessions.
+    A shard directory is created with the first session written to it, not
+    when the app is imported.
+    """
+    def __init__(self, cache_dir: str, **kwargs):
+        super().__init__(cache_dir, **kwargs)
+        self._shards = set()
+
+    def set(self, key: str, value: Any, timeout: int = None, mgmt_element: bool = False) -> bool:
+        shard = os.path.dirname(self._get_filename(key))
+        if shard not in self._shards:
+            os.makedirs(shard, exist_ok=True)
+            self._shards.add(shard)
+        return super().set(key, value, timeout, mgmt_element)
+
+    def _get_filename(self, key: str) -> str:
+        if not isinstance(key, str):
+            raise TypeError(f"Key must be a string, received type {type(key)}")
+        key_hash = self._hash_method(key.encode('utf-8')).hexdigest()
+        return os.path.join(self._path, key_hash[:2], key_hash)
+
+    def _list_dir(self):
+        for shard in os.scandir(self._path):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if not self._is_mgmt(entry.name):
+                        yield entry.path
+
+
+def _remove(path: str) -> int:
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def _session_expired(item: os.DirEntry, now: float, legacy: bool) -> bool:
+    try:
+        # Fitxers temporals d'una escriptura en curs: només si fa molt que hi són
+        if item.name.endswith(FileSystemCache._fs_transaction_suffix):
+            return item.stat().st_mtime < now - STALE_TMP_SECONDS
+        if legacy:
+            return True
+        with open(item.path, 'rb') as f:
+            expires = struct.unpack('I', f.read(4))[0]
+        return expires != 0 and expires < now
+    except (OSError, struct.error):
+        return False
+
+
+def sweep_sessions(cache_dir: str, now: float) -> Tuple[int, int]:
+    """
+    Remove expired session files.
+
+    Files left at the top level by the old, unsharded layout can't be reached
+    any more and are removed as well.
+
+    Returns:
+    The number of files removed and the bytes reclaimed
+    """
+    removed = reclaimed = 0
+    if not os.path.isdir(cache_dir):
+        return removed, reclaimed
+    for entry in os.scandir(cache_dir):
+        items = os.scandir(entry.path) if entry.is_dir() else [entry]
+        for item in items:
+            if _session_expired(item, now, legacy=entry is item):
+                reclaimed += _remove(item.path)
+                removed += 1
+    return removed, reclaimed
+
+
+def sweep_attempts(now: float) -> Tuple[int, int, int]:
+    """
+    Remove finished attempts older than ATTEMPT_RETENTION_DAYS and compact the question index.
+
+    Returns:
+    The number of attempts removed, of index entries removed and the bytes reclaimed
+    """
+    removed = entries_removed = reclaimed = 0
+    if not ATTEMPT_RETENTION_DAYS:
+        return removed, entries_removed, reclaimed
+    limit = now - ATTEMPT_RETENTION_DAYS * 86400
+    for path in attempts.iter_attempt_paths():
+        try:
+            if os.path.getmtime(path) < limit:
+                reclaimed += _remove(path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+
+    if not removed:
+        return removed, entries_removed, reclaimed
+
+    # Compactem l'índex: fora els intents que ja no existeixen
+    index_folder = os.path.join(ATTEMPTS_FOLDER, 'index')
+    if os.path.isdir(index_folder):
+        for entry in os.scandir(index_folder):
+            with open(entry.path, 'r', encoding='utf-8') as f:
+                ids = [line.strip() for line in f if line.strip()]
+            alive = [attempt_id for attempt_id in ids if attempts.attempt_exists(attempt_id)]
+            if len(alive) == len(ids):
+                continue
+            entries_removed += len(ids) - len(alive)
+            before = entry.stat().st_size
+            if alive:
+                tmp_path = entry.path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(''.join(attempt_id + '\n' for attempt_id in alive))
+                os.replace(tmp_path, entry.path)
+                reclaimed += before - os.path.getsize(entry.path)
+            else:
+                reclaimed += _remove(entry.path)
+    return removed, entries_removed, reclaimed
+
+
+def run_gc(session_dir: str) -> Dict[str, Any]:
+    """
+    Run one full collection and update METRICS.
+    """
+    start = time.perf_counter()
+    now = time.time()
+    sessions_removed, session_bytes = sweep_sessions(session_dir, now)
+    attempts_removed, entries_removed, attempt_bytes = sweep_attempts(now)
+    with _metrics_lock:
+        METRICS['runs'] += 1
+        METRICS['last_run'] = datetime.now().isoformat(timespec='seconds')
+        METRICS['last_duration_ms'] = int((time.perf_counter() - start) * 1000)
+        METRICS['sessions_removed'] += sessions_removed
+        METRICS['attempts_removed'] += attempts_removed
+        METRICS['index_entries_removed'] += entries_removed
+        METRICS['bytes_reclaimed'] += session_bytes + attempt_bytes
+        return dict(METRICS)
+
+
+def start_housekeeper(session_dir: str):
+    """
+    Start the background thread that runs the collector every GC_INTERVAL_MINUTES.
+    """
+    if not GC_INTERVAL_MINUTES:
+        return None
+
+    def loop():
+        while True:
+            time.sleep(GC_INTERVAL_MINUTES * 60)
+            try:
+                metrics = run_gc(session_dir)
+                print(f"Housekeeping: {metrics['sessions_removed']} sessions and "
+                      f"{metrics['attempts_removed']} attempts removed, {metrics['bytes_reclaimed']} bytes reclaimed so far")
+            except Exception as e:
+                print(f"Error during housekeeping: {str(e)}")
+
+    thread = threading.Thread(target=loop, name='housekeeper', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,398 @@
+"""
+Importers for question banks exported from other tools.
+
+Besides the markdown dialect of examinator.py, an exam file can be:
+
+    .gift   Moodle GIFT
+    .xml    Moodle XML
+    .csv    a 'question' column, answer columns ('answer...' or a single letter) and a
+            'correct' column with the correct answers (letters, 1-based numbers or their text)
+
+Every importer streams its file and yields Question objects compiled like the
+markdown ones, so they go through the same dedup, snapshot and cache pipeline.
+Question types the app can't show (essay, matching, numerical...) are skipped.
+More formats can be plugged in with register_importer().
+"""
+# Base imports
+import csv
+import os
+import re
+from html.parser import HTMLParser
+from typing import List, Dict, Iterator, Iterable, Optional, Callable
+
+# external imports
+try:
+    from defusedxml.ElementTree import iterparse
+except ImportError:
+    from xml.etree.ElementTree import iterparse
+
+# custom imports
+from attempts import question_id
+from lint import BankLintError, RULES
+from markup import render_question
+from questions import Question, correct_mask
+
+Importer = Callable[[str, str], Iterator[Question]]
+
+
+def compile_question(body: List[str], answers: List[str], correct: List[str], topic: str = None) -> Optional[Question]:
+    """
+    Compile a parsed question (markdown lines, raw answers) to a bank question.
+
+    Returns:
+    The question, or None if its text is empty
+    """
+    if not ''.join(body).strip() or not answers:
+        return None
+    # Les respostes es queden en l'ordre del fitxer: es barregen per intent (banks.exam_question)
+    rendered = render_question(body, answers, correct)
+    return Question(rendered['question'], rendered['answers'], correct_mask(rendered['answers'], rendered['correct']),
+                    question_id(rendered), topic)
+
+
+def _fail(path: str, line: int, code: str):
+    severity, message = RULES[code]
+    raise BankLintError(os.path.basename(path), [{'line': line, 'code': code, 'severity': severity, 'message': message}])
+
+
+class _MarkdownWriter(HTMLParser):
+    """
+    Translate the HTML of a question to the markdown the renderer understands.
+
+    The renderer escapes everything, so only the structure is kept: paragraphs,
+    lists, code and emphasis. Any other tag is dropped and its text kept.
+    """
+    BLOCKS = {'p', 'div', 'br', 'li', 'ul', 'ol', 'table', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+    INLINE = {'b': '**', 'strong': '**', 'i': '*', 'em': '*', 'code': '`'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.lines: List[str] = []
+        self._line: List[str] = []
+        self._pre = 0
+        self._skip = 0
+
+    def _break(self):
+        line = ''.join(self._line).strip()
+        if line:
+            self.lines.append(line)
+        self._line = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'):
+            self._skip += 1
+        elif tag == 'pre':
+            self._break()
+            self.lines.append('```')
+            self._pre += 1
+        elif tag in self.BLOCKS:
+            self._break()
+            if tag == 'li':
+                self._line.append('* ')
+        elif tag in self.INLINE and not self._pre:
+            self._line.append(self.INLINE[tag])
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style'):
+            self._skip = max(0, self._skip - 1)
+        elif tag == 'pre' and self._pre:
+            self.lines.extend(''.join(self._line).strip('\n').split('\n'))
+            self._line = []
+            self.lines.append('```')
+            self._pre -= 1
+        elif tag in self.BLOCKS:
+            self._break()
+        elif tag in self.INLINE and not self._pre:
+            self._line.append(self.INLINE[tag])
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        # Fora de <pre>, els salts de línia de l'HTML són espais
+        self._line.append(data if self._pre else re.sub(r'\s+', ' ', data))
+
+    def close(self):
+        super().close()
+        self._break()
+
+
+def html_to_markdown(text: str) -> List[str]:
+    """
+    Lines of markdown with the text and the structure of an HTML fragment.
+    """
+    writer = _MarkdownWriter()
+    writer.feed(text)
+    writer.close()
+    return writer.lines
+
+
+def _inline(lines: List[str]) -> str:
+    # Les respostes són d'una sola línia
+    return ' '.join(line for line in lines if line != '```')
+
+
+# ---------------------| GIFT |------------------
+
+# Caràcters que el GIFT escapa amb \, substituïts mentre s'analitza la pregunta
+_GIFT_ESCAPES = {'\\' + char: chr(0xE000 + index) for index, char in enumerate('~=#{}:\\')}
+_GIFT_RESTORE = {placeholder: escaped[1] for escaped, placeholder in _GIFT_ESCAPES.items()}
+_GIFT_ESCAPE_PATTERN = re.compile(r'\\[~=#{}:\\]')
+_GIFT_FORMAT = re.compile(r'^\s*\[(html|moodle|plain|markdown)\]', re.I)
+_GIFT_WEIGHT = re.compile(r'^%(-?\d+(?:\.\d+)?)%')
+
+
+def _gift_text(text: str) -> str:
+    return ''.join(_GIFT_RESTORE.get(char, char) for char in text).strip()
+
+
+def _gift_lines(text: str, text_format: str) -> List[str]:
+    text = _gift_text(text)
+    if text_format in ('markdown', 'plain'):
+        return [line.strip() for line in text.split('\n')]
+    # Per defecte (moodle) el GIFT admet HTML dins del text
+    return html_to_markdown(text.replace('\n', '<br>') if text_format == 'moodle' else text)
+
+
+def _gift_chunks(lines: Iterable[str]) -> Iterator[tuple]:
+    """
+    Split a GIFT file in questions: blank lines outside of an answer block separate them.
+    """
+    chunk: List[str] = []
+    start = depth = 0
+    for number, line in enumerate(lines, 1):
+        if depth == 0 and line.lstrip().startswith('//'):
+            continue
+        if not line.strip() and depth == 0:
+            if chunk:
+                yield start, '\n'.join(chunk)
+            chunk = []
+            continue
+        if not chunk:
+            start = number
+        chunk.append(line.rstrip('\n'))
+        escaped = _GIFT_ESCAPE_PATTERN.sub('', line)
+        depth = max(0, depth + escaped.count('{') - escaped.count('}'))
+    if chunk:
+        yield start, '\n'.join(chunk)
+
+
+def parse_gift_question(chunk: str) -> Optional[tuple]:
+    """
+    Parse one GIFT question.
+
+    Returns:
+    (lines of the text, answers, correct answers), or None for a question type the app can't show
+    """
+    text = _GIFT_ESCAPE_PATTERN.sub(lambda match: _GIFT_ESCAPES[match.group(0)], chunk)
+    if text.lstrip().startswith('$CATEGORY'):
+        return None
+    text = re.sub(r'^\s*::.*?::', '', text, count=1, flags=re.S)
+    text_format = 'moodle'
+    match = _GIFT_FORMAT.match(text)
+    if match:
+        text_format = match.group(1).lower()
+        text = text[match.end():]
+    opening, closing = text.find('{'), text.rfind('}')
+    if opening < 0 or closing < opening:
+        return None
+    block = text[opening + 1:closing].strip()
+    after = text[closing + 1:]
+    # Pregunta d'omplir el buit: el text continua després de les respostes
+    body = text[:opening] + (' _____ ' + after if after.strip() else '')
+    lines = _gift_lines(body, text_format)
+
+    if not block or block.startswith('#'):
+        # Redacció o numèrica
+        return None
+    truth = block.split('#')[0].strip().upper()
+    if truth in ('T', 'TRUE', 'F', 'FALSE'):
+        return lines, ['True', 'False'], ['True' if truth.startswith('T') else 'False']
+
+    answers, correct = [], []
+    for marker, raw in re.findall(r'([=~])([^=~]*)', block):
+        raw = raw.split('#')[0].strip()
+        if '->' in raw:
+            # Aparellament
+            return None
+        weight = _GIFT_WEIGHT.match(raw)
+        if weight:
+            raw = raw[weight.end():].strip()
+        answer = _inline(_gift_lines(raw, text_format))
+        if not answer:
+            continue
+        answers.append(answer)
+        if marker == '=' or (weight and float(weight.group(1)) > 0):
+            correct.append(answer)
+    if '~' not in block:
+        # Resposta curta: l'app només en compara una
+        answers = correct = answers[:1]
+    if not correct:
+        return None
+    return lines, answers, correct
+
+
+def import_gift(path: str, topic: str = None) -> Iterator[Question]:
+    """
+    Stream the questions of a Moodle GIFT file.
+    """
+    skipped = 0
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        for _, chunk in _gift_chunks(f):
+            parsed = parse_gift_question(chunk)
+            question = compile_question(*parsed, topic) if parsed else None
+            if question is None:
+                skipped += 0 if chunk.lstrip().startswith('$CATEGORY') else 1
+                continue
+            yield question
+    if skipped:
+        print(f"Skipped {skipped} questions of unsupported types in {os.path.basename(path)}")
+
+
+# ---------------------| Moodle XML |------------------
+
+def _moodle_lines(element) -> List[str]:
+    """
+    Markdown lines of a Moodle <questiontext> or <answer>, from its format attribute.
+    """
+    if element is None:
+        return []
+    text = element.findtext('text') or ''
+    if element.get('format') in ('markdown', 'plain_text'):
+        return [line.strip() for line in text.split('\n')]
+    return html_to_markdown(text)
+
+
+def parse_moodle_question(element) -> Optional[tuple]:
+    """
+    Parse a Moodle XML <question>.
+
+    Returns:
+    (lines of the text, answers, correct answers), or None for a question type the app can't show
+    """
+    question_type = element.get('type')
+    if question_type not in ('multichoice', 'truefalse', 'shortanswer'):
+        return None
+    lines = _moodle_lines(element.find('questiontext'))
+    answers, correct = [], []
+    for answer_element in element.findall('answer'):
+        answer = _inline(_moodle_lines(answer_element))
+        if not answer:
+            continue
+        answers.append(answer)
+        try:
+            fraction = float(answer_element.get('fraction', '0'))
+        except ValueError:
+            fraction = 0.0
+        if fraction > 0:
+            correct.append(answer)
+    if question_type == 'shortanswer':
+        # L'app només compara una resposta: la de més puntuació
+        answers = correct = correct[:1]
+    if not correct:
+        return None
+    return lines, answers, correct
+
+
+def import_moodle_xml(path: str, topic: str = None) -> Iterator[Question]:
+    """
+    Stream the questions of a Moodle XML export with iterparse.
+
+    Each <question> is dropped from the tree as soon as it has been read, so the
+    memory used doesn't grow with the size of the file.
+    """
+    skipped = 0
+    try:
+        events = iterparse(path, events=('start', 'end'))
+        _, root = next(events)
+        for event, element in events:
+            if event != 'end' or element.tag != 'question':
+                continue
+            if element.get('type') != 'category':
+                parsed = parse_moodle_question(element)
+                question = compile_question(*parsed, topic) if parsed else None
+                if question is None:
+                    skipped += 1
+                else:
+                    yield question
+            root.clear()
+    except SyntaxError as e:
+        # ParseError hereta de SyntaxError; la posició és (línia, columna)
+        _fail(path, getattr(e, 'position', (0, 0))[0], 'E101')
+    if skipped:
+        print(f"Skipped {skipped} questions of unsupported types in {os.path.basename(path)}")
+
+
+# ---------------------| CSV |------------------
+
+def _csv_correct(value: str, answers: List[str]) -> List[str]:
+    """
+    The correct answers named in a CSV cell: letters, 1-based numbers or the answer texts, separated by ; or |.
+    """
+    correct = []
+    for item in re.split(r'[;|]', value):
+        item = item.strip()
+        if not item:
+            continue
+        if len(item) == 1 and item.isalpha() and ord(item.upper()) - ord('A') < len(answers):
+            correct.append(answers[ord(item.upper()) - ord('A')])
+        elif item.isdigit() and 0 < int(item) <= len(answers):
+            correct.append(answers[int(item) - 1])
+        elif item in answers:
+            correct.append(item)
+    return correct
+
+
+def import_csv(path: str, topic: str = None) -> Iterator[Question]:
+    """
+    Stream the questions of a CSV file, one per row; the delimiter (, ; or tab) is detected.
+
+    The cells are markdown, like the text of a markdown bank.
+    """
+    skipped = 0
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        try:
+            dialect = csv.Sniffer().sniff(f.read(4096), delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        f.seek(0)
+        reader = csv.reader(f, dialect)
+        header = [name.strip().lower() for name in next(reader, [])]
+        if 'question' not in header or 'correct' not in header:
+            _fail(path, 1, 'E102')
+        question_column, correct_column = header.index('question'), header.index('correct')
+        answer_columns = [index for index, name in enumerate(header)
+                          if name.startswith('answer') or (len(name) == 1 and name.isalpha())]
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            cells = row + [''] * (len(header) - len(row))
+            answers = [cells[index].strip() for index in answer_columns if cells[index].strip()]
+            correct = _csv_correct(cells[correct_column], answers)
+            if len(answers) == 1 and not correct:
+                # Una sola resposta: pregunta de resposta lliure
+                correct = answers
+            question = compile_question(cells[question_column].split('\n'), answers, correct, topic) if correct else None
+            if question is None:
+                skipped += 1
+                continue
+            yield question
+    if skipped:
+        print(f"Skipped {skipped} rows without a question, answers or a valid correct answer in {os.path.basename(path)}")
+
+
+IMPORTERS: Dict[str, Importer] = {
+    '.gift': import_gift,
+    '.xml': import_moodle_xml,
+    '.csv': import_csv,
+}
+
+
+def register_importer(extension: str, importer: Importer):
+    """
+    Make exam files with an extension loadable, with a function (path, topic) -> iterator of Question.
+    """
+    IMPORTERS[extension.lower()] = importer
+
+
+def importer_for(file_name: str) -> Optional[Importer]:
+    return IMPORTERS.get(os.path.splitext(file_name)[1].lower())
@@ -0,0 +1,251 @@
+# Base imports
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Tuple
+
+# custom imports
+from config import RATE_LIMITS
+from config import RATE_LIMIT_DB
+from config import ADMISSION_SLOTS
+from config import ADMISSION_QUEUE
+from config import ADMISSION_TIMEOUT
+
+# Protecció dels punts cars (iniciar un examen, generar el PDF). Dues capes:
+#  - un limitador de cubell de fitxes per client i ruta, que talla les ràfegues
+#    de refrescos (429). Amb RATE_LIMIT_DB l'estat és en un SQLite que
+#    comparteixen tots els processos;
+#  - un control d'admissió global amb una cua limitada: si les places i la cua
+#    són plenes, es respon 503 de seguida en lloc de deixar créixer la latència.
+
+# Cada quant s'esborren els cubells plens (que són com si no hi fossin)
+PRUNE_INTERVAL_SECONDS = 60
+# Cubells en memòria com a molt: per sobre surten els que fa més temps que no es fan servir
+MAX_MEMORY_BUCKETS = 100000
+
+
+class MemoryBuckets:
+    """
+    Token buckets of this process, at most max_buckets of them.
+
+    Full buckets are dropped every PRUNE_INTERVAL_SECONDS; past max_buckets the
+    least recently used one goes, so a flood of new clients costs O(1) per request.
+    """
+    def __init__(self, max_buckets: int = MAX_MEMORY_BUCKETS):
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        # clau -> (fitxes, darrera actualització, quan tornarà a ser ple), el menys recent primer
+        self._buckets: OrderedDict = OrderedDict()
+        self._next_prune = 0.0
+
+    def take(self, key: str, rate: float, burst: int, now: float) -> float:
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (burst, now, now))
+            tokens, wait = _refill(tokens, updated, rate, burst, now)
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+            if now >= self._next_prune:
+                self._next_prune = now + PRUNE_INTERVAL_SECONDS
+                for full in [k for k, v in self._buckets.items() if v[2] <= now]:
+                    del self._buckets[full]
+        return wait
+
+
+class SqliteBuckets:
+    """
+    Token buckets in a SQLite file, shared by every worker that opens it.
+
+    Every PRUNE_INTERVAL_SECONDS a worker deletes the buckets not touched for
+    idle_seconds: by then they are full, the same as a missing one.
+    """
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS buckets (
+        key TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated REAL NOT NULL
+    ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: str, idle_seconds: float):
+        self.path = path
+        self.idle_seconds = idle_seconds
+        self._local = threading.local()
+        self._next_prune = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.executescript(self.SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def take(self, key: str, rate: float, burst: int, now: float) -> float:
+        connection = self._connect()
+        # IMMEDIATE: dos processos no poden llegir el mateix cubell i gastar la mateixa fitxa
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens, wait = _refill(tokens, updated, rate, burst, now)
+            connection.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                               (key, tokens, now))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        if now >= self._next_prune:
+            self._next_prune = now + PRUNE_INTERVAL_SECONDS
+            connection.execute('DELETE FROM buckets WHERE updated < ?', (now - self.idle_seconds,))
+        return wait
+
+
+def _refill(tokens: float, updated: float, rate: float, burst: int, now: float) -> Tuple[float, float]:
+    """
+    Refill a bucket up to now and take one token from it.
+
+    Returns:
+    The tokens left, and 0 if the token was taken or else the seconds until there is one
+    """
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+# Un cubell és ple com a molt burst / rate segons després de l'última petició (l'escala no hi compta)
+_buckets = (SqliteBuckets(RATE_LIMIT_DB, max((burst / rate for rate, burst in RATE_LIMITS.values()), default=0))
+            if RATE_LIMIT_DB else MemoryBuckets())
+_limited = {endpoint: 0 for endpoint in RATE_LIMITS}
+_stats_lock = threading.Lock()
+
+
+def check_rate(endpoint: str, client: str, scale: int = 1) -> float:
+    """
+    Take a token for a request of a client to an endpoint.
+
+    Args:
+    endpoint -- Name of the Flask endpoint
+    client -- Identifier of the client (its session, or its address)
+    scale -- Factor for the rate and burst of the endpoint, for clients that stand for several people
+
+    Returns:
+    0 if the request can go on, or else the seconds the client has to wait
+    """
+    limit = RATE_LIMITS.get(endpoint)
+    if limit is None:
+        return 0.0
+    rate, burst = limit
+    wait = _buckets.take(f"{endpoint}:{client}", rate * scale, burst * scale, time.time())
+    if wait:
+        with _stats_lock:
+            _limited[endpoint] += 1
+    return wait
+
+
+class Overloaded(Exception):
+    """
+    The admission queue is full, or the wait for a slot took too long.
+    """
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__(f"Overloaded, retry after {retry_after}s")
+
+
+class AdmissionController:
+    """
+    Bounded concurrency for heavy requests, with a bounded queue in front.
+
+    At most `slots` requests run at once and at most `queue` wait for a slot,
+    each for up to `timeout` seconds. Anything beyond that is rejected at once,
+    with an estimate of when to retry from the mean service time.
+    """
+    def __init__(self, slots: int, queue: int, timeout: float):
+        self.slots = slots
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.service_time = 1.0
+        self._cond = threading.Condition()
+
+    def retry_after(self) -> int:
+        # Cal tenir _cond
+        return max(1, math.ceil(self.service_time * (self.waiting + 1) / self.slots))
+
+    def acquire(self) -> float:
+        """
+        Wait for a slot.
+
+        Returns:
+        The time the slot was taken, to pass to release()
+
+        Raises:
+        Overloaded if the queue is full or no slot freed up in time
+        """
+        with self._cond:
+            if self.active >= self.slots:
+                if self.waiting >= self.queue:
+                    self.shed += 1
+                    raise Overloaded(self.retry_after())
+                self.waiting += 1
+                deadline = time.monotonic() + self.timeout
+                try:
+                    while self.active >= self.slots:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timed_out += 1
+                            raise Overloaded(self.retry_after())
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+        return time.monotonic()
+
+    def release(self, started: float):
+        with self._cond:
+            self.active -= 1
+            # Mitjana mòbil del temps de servei, per estimar el Retry-After
+            self.service_time = 0.8 * self.service_time + 0.2 * (time.monotonic() - started)
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'slots': self.slots,
+                'queue': self.queue,
+                'active': self.active,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'shed': self.shed,
+                'timed_out': self.timed_out,
+                'service_time': round(self.service_time, 3),
+            }
+
+
+admission = AdmissionController(ADMISSION_SLOTS, ADMISSION_QUEUE, ADMISSION_TIMEOUT)
+
+
+def limits_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        limited = dict(_limited)
+    return {
+        'rate_limits': {endpoint: {'rate': rate, 'burst': burst, 'limited': limited[endpoint]}
+                        for endpoint, (rate, burst) in RATE_LIMITS.items()},
+        'shared': bool(RATE_LIMIT_DB),
+        'admission': admission.stats(),
+    }
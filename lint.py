@@ -0,0 +1,275 @@
+"""
+Lint the question banks under EXAMS_FOLDER.
+
+Every .md file is checked in parallel and the result is cached by content
+hash, so unchanged files are not checked again. The report is JSON by default:
+
+    python lint.py [folder] [--format json|text] [--workers N] [--no-cache]
+
+The exit status is 1 if any file has errors. The app refuses to load those files.
+"""
+# Base imports
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Tuple
+
+# custom imports
+from config import EXAMS_FOLDER
+from config import BANK_CACHE_FOLDER
+
+# Canviar les regles invalida la memòria cau
+LINT_VERSION = 4
+CACHE_PATH = os.path.join(BANK_CACHE_FOLDER, 'lint.json')
+# Els fitxers comprovats en carregar un banc es desen junts, com a molt un cop cada tant
+SAVE_DELAY_SECONDS = 5
+
+RULES = {
+    'E001': ('error', 'Answer outside of any question'),
+    'E002': ('error', 'Question without answers'),
+    'E003': ('error', 'Question without any correct answer (no ** marker)'),
+    'E004': ('error', 'Empty question text'),
+    # Fitxers importats (importers.py)
+    'E101': ('error', 'Malformed Moodle XML'),
+    'E102': ('error', "CSV bank without a 'question' and a 'correct' column"),
+    'W001': ('warning', "Answer with a '-' bullet: examinator.py accepts it but routes/exam.py doesn't, use '+'"),
+    'W002': ('warning', 'Duplicate answer in the same question'),
+    'W003': ('warning', 'Duplicate question in the same file'),
+    'W004': ('warning', "Unbalanced '**' marker"),
+}
+
+_cache: Dict[str, List[Dict[str, Any]]] = {}
+_cache_loaded = False
+_lock = threading.Lock()
+_save_timer = None
+
+
+class BankLintError(ValueError):
+    """
+    A question bank file that can't be loaded because it fails lint.
+    """
+    def __init__(self, file_name: str, issues: List[Dict[str, Any]]):
+        self.file_name = file_name
+        self.issues = issues
+        super().__init__(f"{file_name} fails lint with {len(errors_of(issues))} error(s)")
+
+
+def errors_of(issues: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [issue for issue in issues if issue['severity'] == 'error']
+
+
+def _issue(line: int, code: str) -> Dict[str, Any]:
+    severity, message = RULES[code]
+    return {'line': line, 'code': code, 'severity': severity, 'message': message}
+
+
+def lint_text(text: str) -> List[Dict[str, Any]]:
+    """
+    Check the content of a bank file with the same rules the parser uses.
+
+    Returns:
+    The list of issues, each with its line number, code, severity and message
+    """
+    issues = []
+    seen_questions = set()
+    question = None
+
+    def close(question):
+        if question is None:
+            return
+        # L'enunciat pot tenir diverses línies fins a la primera resposta, com al parser
+        question['text'] = '\n'.join(question['body']).strip()
+        if not question['text']:
+            issues.append(_issue(question['line'], 'E004'))
+        if not question['answers']:
+            issues.append(_issue(question['line'], 'E002'))
+        elif not question['correct']:
+            issues.append(_issue(question['line'], 'E003'))
+        key = (question['text'], tuple(sorted(question['answers'])))
+        if key in seen_questions:
+            issues.append(_issue(question['line'], 'W003'))
+        seen_questions.add(key)
+
+    in_code = False
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        # Els blocs de codi de l'enunciat poden tenir línies que comencen per + o -
+        if question is not None and not question['answers'] and (in_code or line.startswith('```')):
+            if line.startswith('```'):
+                in_code = not in_code
+            question['body'].append(line)
+        elif line.startswith('####'):
+            close(question)
+            question = {'line': number, 'body': [line[4:]], 'answers': [], 'correct': 0}
+        elif line.startswith('+') or line.startswith('-'):
+            if question is None:
+                issues.append(_issue(number, 'E001'))
+                continue
+            if line.startswith('-'):
+                issues.append(_issue(number, 'W001'))
+            answer = line[1:].strip()
+            if answer.count('**') % 2:
+                issues.append(_issue(number, 'W004'))
+            if '**' in answer:
+                question['correct'] += 1
+            answer = answer.replace('**', '')
+            if answer in question['answers']:
+                issues.append(_issue(number, 'W002'))
+            question['answers'].append(answer)
+        elif question is not None and not question['answers']:
+            question['body'].append(line)
+    close(question)
+    issues.sort(key=lambda issue: issue['line'])
+    return issues
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.sha1(f"lint{LINT_VERSION}:".encode('utf-8') + content).hexdigest()
+
+
+def _load_cache():
+    global _cache_loaded
+    with _lock:
+        if _cache_loaded:
+            return
+        try:
+            with open(CACHE_PATH, 'r', encoding='utf-8') as f:
+                _cache.update(json.load(f))
+        except (FileNotFoundError, ValueError):
+            pass
+        _cache_loaded = True
+
+
+def _save_cache():
+    os.makedirs(BANK_CACHE_FOLDER, exist_ok=True)
+    tmp_path = f"{CACHE_PATH}.{uuid.uuid4().hex}.tmp"
+    with _lock:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(_cache, f)
+    os.replace(tmp_path, CACHE_PATH)
+
+
+def _schedule_save():
+    global _save_timer
+    with _lock:
+        if _save_timer is not None:
+            return
+        _save_timer = threading.Timer(SAVE_DELAY_SECONDS, _delayed_save)
+        _save_timer.daemon = True
+        _save_timer.start()
+
+
+def _delayed_save():
+    global _save_timer
+    with _lock:
+        _save_timer = None
+    _save_cache()
+
+
+def _lint_bytes(content: bytes) -> List[Dict[str, Any]]:
+    return lint_text(content.decode('utf-8', errors='replace'))
+
+
+def check_file(path: str) -> List[Dict[str, Any]]:
+    """
+    Lint one file before loading it, from the cache when its content hasn't changed.
+
+    Returns:
+    The issues of the file (warnings only)
+
+    Raises:
+    BankLintError if the file has errors
+    """
+    _load_cache()
+    with open(path, 'rb') as f:
+        content = f.read()
+    digest = content_hash(content)
+    with _lock:
+        issues = _cache.get(digest)
+    if issues is None:
+        issues = _lint_bytes(content)
+        with _lock:
+            _cache[digest] = issues
+        _schedule_save()
+    if errors_of(issues):
+        raise BankLintError(os.path.basename(path), issues)
+    return issues
+
+
+def lint_tree(folder: str = EXAMS_FOLDER, workers: int = None, use_cache: bool = True) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Lint every .md file under a folder, in parallel.
+
+    Args:
+    folder -- Root folder of the banks
+    workers -- Number of worker processes, one per CPU by default
+    use_cache -- Skip the files whose content was already checked; either way the results are saved to it,
+                 and the entries of contents this run didn't see are dropped
+
+    Returns:
+    One report per file (path, hash, issues) and how many of them were checked (not cached)
+    """
+    paths = sorted(os.path.join(root, name) for root, _, names in os.walk(folder)
+                   for name in names if name.endswith('.md'))
+    contents = {}
+    for path in paths:
+        with open(path, 'rb') as f:
+            contents[path] = f.read()
+    digests = {path: content_hash(content) for path, content in contents.items()}
+
+    _load_cache()
+    pending = [path for path in paths if not use_cache or digests[path] not in _cache]
+    results = {}
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for path, issues in zip(pending, executor.map(_lint_bytes, [contents[path] for path in pending],
+                                                         chunksize=16)):
+                results[digests[path]] = issues
+    # Només es conserven els continguts que hi ha ara: les versions velles dels fitxers no tornaran
+    seen = set(digests.values())
+    with _lock:
+        stale = [digest for digest in _cache if digest not in seen]
+        for digest in stale:
+            del _cache[digest]
+        _cache.update(results)
+    if pending or stale:
+        _save_cache()
+
+    reports = [{
+        'file': os.path.relpath(path, folder),
+        'hash': digests[path],
+        'errors': len(errors_of(_cache[digests[path]])),
+        'issues': _cache[digests[path]],
+    } for path in paths]
+    return reports, len(pending)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lint the question banks.')
+    parser.add_argument('folder', nargs='?', default=EXAMS_FOLDER)
+    parser.add_argument('--format', choices=('json', 'text'), default='json')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--no-cache', action='store_true', help='Check every file again')
+    args = parser.parse_args()
+
+    reports, checked = lint_tree(args.folder, args.workers, not args.no_cache)
+    failed = sum(1 for report in reports if report['errors'])
+    if args.format == 'json':
+        json.dump({'files': len(reports), 'checked': checked, 'failed': failed, 'reports': reports},
+                  sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        for report in reports:
+            for issue in report['issues']:
+                print(f"{report['file']}:{issue['line']}: {issue['code']} {issue['severity']}: {issue['message']}")
+        print(f"{len(reports)} files, {checked} checked, {failed} with errors", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,329 @@
+# Base imports
+import argparse
+import itertools
+import math
+import multiprocessing
+import random
+import re
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+from typing import List, Dict, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor
+
+# Simulador de càrrega: N candidats fent un examen complet contra l'app.
+# Amb --scaling arrenca diversos processos treballadors que comparteixen només
+# els magatzems en disc, i cada petició d'un candidat va a un treballador diferent.
+
+PAGE_LABEL = re.compile(r'Pregunta (\d+) de (\d+)')
+INPUT_FIELD = re.compile(r'<input type="(radio|checkbox|text)" name="(question\d+)" value="([^"]*)"')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class LocalClient:
+    """
+    Candidate client that talks to the in-process Flask test client.
+    """
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method: str, path: str, data: Dict[str, Any] = None) -> Tuple[int, str, str]:
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.get_data(as_text=True), response.location or ''
+
+
+class HttpClient:
+    """
+    Candidate client that talks to running instances over HTTP, with its own cookie jar.
+
+    With several base URLs every request goes to the next one, so a single
+    attempt is served by all the workers in turn.
+    """
+    def __init__(self, base_urls: List[str]):
+        self.base_urls = itertools.cycle([url.rstrip('/') for url in base_urls])
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect)
+
+    def request(self, method: str, path: str, data: Dict[str, Any] = None) -> Tuple[int, str, str]:
+        body = urllib.parse.urlencode(data, doseq=True).encode() if data is not None else None
+        req = urllib.request.Request(next(self.base_urls) + path, data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                return response.status, response.read().decode('utf-8', 'replace'), ''
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode('utf-8', 'replace'), e.headers.get('Location', '')
+
+
+class Recorder:
+    """
+    Thread-safe collector of (route, status, latency) samples.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples: Dict[str, List[Tuple[int, float]]] = {}
+
+    def add(self, route: str, status: int, latency: float):
+        with self.lock:
+            self.samples.setdefault(route, []).append((status, latency))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not values:
+        return 0.0
+    rank = max(0, min(len(values) - 1, math.ceil(pct / 100 * len(values)) - 1))
+    return values[rank]
+
+
+def think(mean: float):
+    # Temps de reflexió realista: distribució exponencial al voltant de la mitjana
+    if mean > 0:
+        time.sleep(min(random.expovariate(1 / mean), mean * 5))
+
+
+def timed(recorder: Recorder, client, route: str, method: str, path: str, data: Dict[str, Any] = None):
+    start = time.perf_counter()
+    try:
+        status, body, location = client.request(method, path, data)
+    except Exception as e:
+        print(f"Error on {method} {path}: {str(e)}")
+        status, body, location = 599, '', ''
+    recorder.add(route, status, time.perf_counter() - start)
+    return status, body, location
+
+
+def pick_answers(body: str) -> Dict[str, List[str]]:
+    """
+    Choose random answers for every question shown on a quiz page.
+    """
+    options: Dict[str, List[Tuple[str, str]]] = {}
+    for kind, name, value in INPUT_FIELD.findall(body):
+        options.setdefault(name, []).append((kind, value))
+    answers = {}
+    for name, values in options.items():
+        kind = values[0][0]
+        if kind == 'checkbox':
+            chosen = [v for _, v in values if random.random() < 0.5] or [values[0][1]]
+        else:
+            chosen = [random.choice(values)[1]] if kind == 'radio' else ['answer']
+        answers[name] = chosen
+    return answers
+
+
+def run_candidate(client, recorder: Recorder, course: str, exams: List[str], think_time: float):
+    """
+    Script one candidate through a full exam sitting.
+    """
+    timed(recorder, client, '/', 'GET', '/')
+    think(think_time)
+    timed(recorder, client, '/select_topic', 'POST', '/select_topic', {'course': course})
+    think(think_time)
+    status, _, _ = timed(recorder, client, '/select_exam', 'POST', '/select_exam',
+                         {'course': course, 'exam': exams})
+    if status >= 400:
+        return
+
+    page = 1
+    while True:
+        status, body, _ = timed(recorder, client, '/quiz [GET]', 'GET', f'/quiz?page={page}')
+        label = PAGE_LABEL.search(body)
+        if status >= 400 or not label:
+            return
+        total_pages = int(label.group(2))
+        think(think_time)
+        data = pick_answers(body)
+        data['current_page'] = page
+        data['navigation'] = 'next' if page < total_pages else ''
+        timed(recorder, client, '/quiz [POST]', 'POST', '/quiz', data)
+        if page >= total_pages:
+            break
+        page += 1
+
+    timed(recorder, client, '/exam_summary [GET]', 'GET', '/exam_summary')
+    think(think_time)
+    timed(recorder, client, '/exam_summary [POST]', 'POST', '/exam_summary', {'action': 'Submit Exam'})
+    think(think_time)
+    timed(recorder, client, '/download_results', 'GET', '/download_results')
+
+
+def report(recorder: Recorder, elapsed: float) -> str:
+    """
+    Format throughput, latency percentiles and error rate per route.
+    """
+    lines = [f"{'route':<22}{'reqs':>7}{'rps':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>8}"]
+    total = errors_total = 0
+    for route, samples in recorder.samples.items():
+        latencies = sorted(latency * 1000 for _, latency in samples)
+        errors = sum(1 for status, _ in samples if status >= 400)
+        total += len(samples)
+        errors_total += errors
+        lines.append(f"{route:<22}{len(samples):>7}{len(samples) / elapsed:>8.1f}"
+                     f"{percentile(latencies, 50):>9.1f}{percentile(latencies, 90):>9.1f}"
+                     f"{percentile(latencies, 99):>9.1f}{latencies[-1]:>9.1f}"
+                     f"{100 * errors / len(samples):>7.1f}%")
+    error_rate = 100 * errors_total / total if total else 0
+    lines.append(f"Total: {total} requests in {elapsed:.2f}s ({total / elapsed:.1f} req/s), {error_rate:.1f}% errors")
+    return '\n'.join(lines)
+
+
+def run_candidates(make_client, recorder: Recorder, candidates: int, concurrency: int,
+                   course: str, exams: List[str], think_time: float):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(run_candidate, make_client(), recorder, course, exams, think_time)
+                   for _ in range(candidates)]
+        for future in futures:
+            if future.exception():
+                print(f"Candidate aborted: {future.exception()}")
+
+# ---------------------| Scaling |------------------
+
+def serve_worker(port: int, exams_folder: str):
+    """
+    A stateless worker process: one instance of the app on a local port.
+    """
+    import logging
+    import examinator
+    from tenants import DEFAULT_TENANT, get_tenant
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    if exams_folder:
+        get_tenant(DEFAULT_TENANT).exams_folder = exams_folder
+    examinator.start_background_tasks()
+    make_server('127.0.0.1', port, examinator.app, threaded=True).serve_forever()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float = 30):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Worker on port {port} didn't start")
+
+
+def client_batch(urls: List[str], candidates: int, concurrency: int, course: str, exams: List[str],
+                 think_time: float) -> Dict[str, List[Tuple[int, float]]]:
+    # Els clients també es reparteixen en processos, perquè no siguin ells el coll d'ampolla
+    recorder = Recorder()
+    run_candidates(lambda: HttpClient(urls), recorder, candidates, concurrency, course, exams, think_time)
+    return recorder.samples
+
+
+def measure_workers(workers: int, args, exams: List[str]) -> Tuple[Recorder, float]:
+    """
+    Run the load against a number of local worker processes.
+
+    Returns:
+    The samples and the elapsed time
+    """
+    ports = [_free_port() for _ in range(workers)]
+    processes = [multiprocessing.Process(target=serve_worker, args=(port, args.exams_folder), daemon=True)
+                 for port in ports]
+    for process in processes:
+        process.start()
+    try:
+        for port in ports:
+            _wait_for_port(port)
+        urls = [f"http://127.0.0.1:{port}" for port in ports]
+        # Tants processos client com treballadors, amb la càrrega repartida
+        shares = [args.candidates // workers + (1 if i < args.candidates % workers else 0) for i in range(workers)]
+        recorder = Recorder()
+        start = time.perf_counter()
+        with multiprocessing.Pool(workers) as pool:
+            results = [pool.apply_async(client_batch, (urls, share, max(1, args.concurrency // workers),
+                                                       args.course, exams, args.think))
+                       for share in shares if share]
+            for result in results:
+                for route, samples in result.get().items():
+                    recorder.samples.setdefault(route, []).extend(samples)
+        return recorder, time.perf_counter() - start
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+
+def scaling(args, exams: List[str]):
+    """
+    Measure throughput with 1..N worker processes and compare it with a single worker.
+    """
+    rows = []
+    for workers in args.scaling:
+        recorder, elapsed = measure_workers(workers, args, exams)
+        total = sum(len(samples) for samples in recorder.samples.values())
+        errors = sum(1 for samples in recorder.samples.values() for status, _ in samples if status >= 400)
+        rows.append((workers, total / elapsed, errors, total))
+        print(f"--- {workers} worker(s)")
+        print(report(recorder, elapsed))
+    print(f"{'workers':>8}{'req/s':>10}{'speedup':>10}{'ideal':>8}{'errors':>8}")
+    base = rows[0][1] / rows[0][0]
+    for workers, rps, errors, total in rows:
+        print(f"{workers:>8}{rps:>10.1f}{rps / base:>10.2f}{workers:>8}{100 * errors / total:>7.1f}%")
+    print(f"CPUs: {multiprocessing.cpu_count()} (the speedup can't pass the number of CPUs)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate candidates sitting an exam.')
+    parser.add_argument('--candidates', type=int, default=20, help='number of simulated candidates')
+    parser.add_argument('--concurrency', type=int, default=10, help='candidates running at the same time')
+    parser.add_argument('--think', type=float, default=1.0, help='mean think time between requests (seconds)')
+    parser.add_argument('--url', action='append',
+                        help='base URL of a running instance, repeat it to spread the requests over several '
+                             'workers (default: in-process test client)')
+    parser.add_argument('--scaling', type=lambda value: [int(n) for n in value.split(',')],
+                        help='comma-separated worker counts (e.g. 1,2,4): start that many local worker '
+                             'processes and compare the throughput')
+    parser.add_argument('--exams-folder', help="override the default tenant's exams folder for the local app")
+    parser.add_argument('--course', default='demo')
+    parser.add_argument('--exam', action='append', help='exam file to select (repeatable)')
+    args = parser.parse_args()
+
+    if args.scaling:
+        import examinator
+        from tenants import DEFAULT_TENANT, get_tenant
+        if args.exams_folder:
+            get_tenant(DEFAULT_TENANT).exams_folder = args.exams_folder
+        exams = args.exam or examinator.get_exam_files(args.course)
+        if not exams:
+            parser.error('no exam files selected, use --exam')
+        return scaling(args, exams)
+
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+        exams = args.exam or []
+    else:
+        import examinator
+        from tenants import DEFAULT_TENANT, get_tenant
+        if args.exams_folder:
+            get_tenant(DEFAULT_TENANT).exams_folder = args.exams_folder
+        make_client = lambda: LocalClient(examinator.app)
+        exams = args.exam or examinator.get_exam_files(args.course)
+    if not exams:
+        parser.error('no exam files selected, use --exam')
+
+    recorder = Recorder()
+    start = time.perf_counter()
+    run_candidates(make_client, recorder, args.candidates, args.concurrency, args.course, exams, args.think)
+    print(report(recorder, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
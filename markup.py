@@ -0,0 +1,159 @@
+# Base imports
+import html
+import re
+from typing import List, Dict, Any
+
+# custom imports
+from assets import embed_html
+
+# Renderitzat del Markdown de les preguntes a HTML net. Es fa una sola vegada,
+# en compilar el banc; les pàgines emeten l'HTML tal qual.
+#
+# Només es genera un subconjunt d'etiquetes conegudes: tot el text del fitxer
+# s'escapa, de manera que l'HTML que hi pugui haver no arriba mai al navegador.
+
+INLINE_PATTERN = re.compile(
+    r'(?P<code>`(?P<code_text>[^`]+)`)'
+    r'|(?P<embed>!\[\[(?P<embed_name>[^\]|]+)(?:\|(?P<embed_spec>[^\]]*))?\]\])'
+    r'|(?P<wiki>\[\[(?P<wiki_target>[^\]|]+)(?:\|(?P<wiki_alias>[^\]]*))?\]\])'
+    r'|(?P<link>\[(?P<link_text>[^\]]+)\]\((?P<link_url>https?://[^)\s]+)\))'
+    r'|(?P<bold>\*\*(?P<bold_text>.+?)\*\*)'
+    r'|(?P<italic>(?<![\w*])\*(?P<italic_text>[^\s*](?:.*?[^\s*])?)\*(?![\w*])'
+    r'|(?<!\w)_(?P<italic_text2>[^\s_](?:.*?[^\s_])?)_(?!\w))'
+)
+LIST_ITEM = re.compile(r'^(?:(?P<bullet>\*)|(?P<number>\d+)[.)])\s+(?P<text>.*)$')
+
+
+def render_inline(text: str) -> str:
+    """
+    Render the inline Markdown of a line: code, bold, italics, links, wiki links and embeds.
+    """
+    out = []
+    position = 0
+    for match in INLINE_PATTERN.finditer(text):
+        out.append(html.escape(text[position:match.start()], quote=False))
+        position = match.end()
+        if match.group('code'):
+            out.append(f"<code>{html.escape(match.group('code_text'), quote=False)}</code>")
+        elif match.group('embed'):
+            out.append(embed_html(match.group('embed_name'), match.group('embed_spec')))
+        elif match.group('wiki'):
+            out.append(html.escape(match.group('wiki_alias') or match.group('wiki_target'), quote=False))
+        elif match.group('link'):
+            url = html.escape(match.group('link_url'))
+            out.append(f'<a href="{url}" target="_blank" rel="noopener noreferrer">'
+                       f"{render_inline(match.group('link_text'))}</a>")
+        elif match.group('bold'):
+            out.append(f"<strong>{render_inline(match.group('bold_text'))}</strong>")
+        else:
+            out.append(f"<em>{render_inline(match.group('italic_text') or match.group('italic_text2'))}</em>")
+    out.append(html.escape(text[position:], quote=False))
+    return ''.join(out)
+
+
+def render_block(lines: List[str]) -> str:
+    """
+    Render a multi-line body: paragraphs, '*' and numbered lists and ``` code blocks.
+
+    A body that is a single paragraph is returned without a <p>, as inline HTML.
+    """
+    blocks = []
+    paragraph: List[str] = []
+    items: List[str] = []
+    list_tag = None
+    code: List[str] = []
+    in_code = False
+
+    def flush():
+        nonlocal list_tag
+        if paragraph:
+            blocks.append(('p', render_inline(' '.join(paragraph))))
+            paragraph.clear()
+        if items:
+            blocks.append((list_tag, ''.join(f"<li>{item}</li>" for item in items)))
+            items.clear()
+            list_tag = None
+
+    for raw in lines:
+        line = raw.strip()
+        if line.startswith('```'):
+            if in_code:
+                blocks.append(('pre', f"<code>{html.escape(chr(10).join(code), quote=False)}</code>"))
+                code.clear()
+            else:
+                flush()
+            in_code = not in_code
+            continue
+        if in_code:
+            code.append(raw.rstrip())
+            continue
+        item = LIST_ITEM.match(line)
+        if item:
+            tag = 'ul' if item.group('bullet') else 'ol'
+            if paragraph or (list_tag and list_tag != tag):
+                flush()
+            list_tag = tag
+            items.append(render_inline(item.group('text')))
+        elif not line:
+            flush()
+        else:
+            if items:
+                flush()
+            paragraph.append(line)
+    if in_code:
+        blocks.append(('pre', f"<code>{html.escape(chr(10).join(code), quote=False)}</code>"))
+    flush()
+
+    if len(blocks) == 1 and blocks[0][0] == 'p':
+        return blocks[0][1]
+    return ''.join(f"<{tag}>{body}</{tag}>" for tag, body in blocks)
+
+
+def render_question(body: List[str], answers: List[str], correct: List[str]) -> Dict[str, Any]:
+    """
+    Compile a parsed question to HTML.
+
+    The answer of a free-text question is only escaped: the candidate types it,
+    so it must keep its literal text.
+
+    Args:
+    body -- Lines of the question text
+    answers -- Raw answers, in file order
+    correct -- Raw correct answers
+
+    Returns:
+    The question with its text, answers and correct answers as HTML
+    """
+    if len(answers) == 1 and len(correct) == 1:
+        render = lambda answer: html.escape(answer, quote=False)
+    else:
+        render = render_inline
+    rendered = {answer: render(answer) for answer in answers}
+    return {
+        'question': render_block(body),
+        'answers': tuple(rendered[answer] for answer in answers),
+        'correct': [rendered[answer] for answer in correct],
+    }
+
+
+# Traducció de l'HTML compilat a les etiquetes que entén reportlab
+_REPORTLAB_TAGS = (
+    (re.compile(r'<a class="question-image"[^>]*>.*?</a>'), '[image]'),
+    (re.compile(r'<strong>'), '<b>'), (re.compile(r'</strong>'), '</b>'),
+    (re.compile(r'<em>'), '<i>'), (re.compile(r'</em>'), '</i>'),
+    (re.compile(r'<code>'), '<font face="Courier">'), (re.compile(r'</code>'), '</font>'),
+    (re.compile(r'<pre>(.*?)</pre>', re.S), lambda m: '<br/>' + m.group(1).replace('\n', '<br/>') + '<br/>'),
+    (re.compile(r'<li>'), '<br/>&bull; '), (re.compile(r'</li>|</?[uo]l>'), ''),
+    (re.compile(r'<p>'), ''), (re.compile(r'</p>'), '<br/>'),
+    (re.compile(r'<a [^>]*href="([^"]*)"[^>]*>'), r'<a href="\1">'),
+    (re.compile(r'<(?!/?(?:b|i|font|a|br)\b)[^>]*>'), ''),
+)
+
+
+def to_reportlab(markup: str) -> str:
+    """
+    Map compiled question HTML to reportlab paragraph markup.
+    """
+    for pattern, replacement in _REPORTLAB_TAGS:
+        markup = pattern.sub(replacement, markup)
+    return markup
@@ -0,0 +1,64 @@
+# Base imports
+from typing import List
+
+# Generador pseudoaleatori basat en comptador: cada valor depèn només de
+# (llavor, comptadors), de manera que qualsevol posició d'un examen es pot
+# reconstruir sense generar les anteriors.
+
+MASK64 = (1 << 64) - 1
+
+# Fluxos independents per a cada ús de l'atzar
+STREAM_QUESTIONS = 1
+STREAM_ANSWERS = 2
+
+FEISTEL_ROUNDS = 4
+
+
+def _splitmix64(x: int) -> int:
+    x = (x + 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+def hash64(seed: int, *counters: int) -> int:
+    """
+    Counter-based random value: a 64-bit hash of the seed and the counters.
+    """
+    x = _splitmix64(seed & MASK64)
+    for counter in counters:
+        x = _splitmix64(x ^ (counter & MASK64))
+    return x
+
+
+def permute_index(seed: int, index: int, size: int) -> int:
+    """
+    Position `index` of a pseudo-random permutation of range(size).
+
+    Uses a balanced Feistel network over the smallest even number of bits that
+    covers size, walking the cycle until the value falls inside the range. Each
+    call costs O(1) on average, without building the permutation.
+    """
+    if size <= 1:
+        return 0
+    half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+    half_mask = (1 << half_bits) - 1
+    value = index
+    while True:
+        left, right = value >> half_bits, value & half_mask
+        for round_number in range(FEISTEL_ROUNDS):
+            left, right = right, left ^ (hash64(seed, STREAM_QUESTIONS, round_number, right) & half_mask)
+        value = (left << half_bits) | right
+        if value < size:
+            return value
+
+
+def shuffled_order(seed: int, position: int, size: int) -> List[int]:
+    """
+    Fisher-Yates order of size items for one exam position, drawn from the counter-based generator.
+    """
+    order = list(range(size))
+    for i in range(size - 1, 0, -1):
+        j = hash64(seed, STREAM_ANSWERS, position, i) % (i + 1)
+        order[i], order[j] = order[j], order[i]
+    return order
@@ -0,0 +1,85 @@
+# Base imports
+import sys
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+# Representació compacta d'una pregunta del banc. Els textos de les respostes
+# ("ext4", "Cap de les anteriors"...) es repeteixen a milers de preguntes:
+# s'internen, de manera que cada text diferent només és una vegada en memòria.
+# Les respostes correctes són una màscara de bits sobre l'ordre del fitxer.
+
+
+class Question:
+    """
+    An immutable bank question: text, answers in file order and the bitmask of the correct ones.
+
+    It can also be read like the dicts it replaces (question['answers'],
+    question.get('id')...), so the code that shows and grades questions doesn't
+    need to know which one it gets.
+    """
+    __slots__ = ('id', 'question', 'answers', 'correct_mask', 'topic')
+
+    def __init__(self, question: str, answers: Iterable[str], correct_mask: int,
+                 id: Optional[str] = None, topic: Optional[str] = None):
+        set_field = object.__setattr__
+        set_field(self, 'id', id)
+        set_field(self, 'question', question)
+        set_field(self, 'answers', tuple(sys.intern(answer) for answer in answers))
+        set_field(self, 'correct_mask', correct_mask)
+        set_field(self, 'topic', sys.intern(topic) if topic else topic)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Question is immutable, can't set {name}")
+
+    @property
+    def correct(self) -> List[str]:
+        """
+        The correct answers, in file order.
+        """
+        return [answer for index, answer in enumerate(self.answers) if self.correct_mask >> index & 1]
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__ and key != 'correct':
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def dedup_key(self) -> Tuple[str, Tuple[str, ...]]:
+        """
+        Two questions with the same text and the same answers (in any order) are the same question.
+        """
+        return (self.question, tuple(sorted(self.answers)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'id': self.id, 'question': self.question, 'answers': list(self.answers),
+                'correct_mask': self.correct_mask, 'topic': self.topic}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Question':
+        """
+        Build a question from its stored form, or from the dict form used before this type existed.
+        """
+        mask = data.get('correct_mask')
+        if mask is None:
+            mask = correct_mask(data['answers'], data['correct'])
+        return cls(data['question'], data['answers'], mask, data.get('id'), data.get('topic'))
+
+    def __repr__(self):
+        return f"Question({self.id!r}, {self.question[:40]!r}, {len(self.answers)} answers)"
+
+
+def correct_mask(answers: Iterable[str], correct: Iterable[str]) -> int:
+    """
+    Bitmask over the positions of the answers that are among the correct ones.
+    """
+    correct = set(correct)
+    mask = 0
+    for index, answer in enumerate(answers):
+        if answer in correct:
+            mask |= 1 << index
+    return mask
@@ -0,0 +1,112 @@
+# Base imports
+import argparse
+import json
+import os
+from datetime import datetime
+from typing import List, Dict, Any
+
+# custom imports
+import attempts
+from grading import grade_attempt
+from tenants import get_tenant, use_tenant
+
+# Tasca de recorrecció: quan es corregeix una marca ** en un banc, recalcula
+# només els intents que contenien les preguntes afectades.
+
+
+def regrade_file(course: str, file_name: str, questions: List[Dict[str, Any]], dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Re-grade the attempts affected by answer-key changes in one bank file.
+
+    Args:
+    course -- The course name
+    file_name -- The bank file
+    questions -- Questions freshly parsed from the file
+    dry_run -- Compute the report without saving anything
+
+    Returns:
+    An audit report with the bank diff and the score changes
+    """
+    old_bank = attempts.load_bank_snapshot(course, file_name)
+    new_bank = attempts.compile_bank(questions)
+    diff = attempts.diff_banks(old_bank, new_bank)
+
+    changed = set(diff['changed'])
+    affected_ids = set()
+    for qid in changed:
+        affected_ids.update(attempts.attempts_for_question(qid))
+
+    changes = []
+    for attempt_id in sorted(affected_ids):
+        attempt = attempts.load_attempt(attempt_id)
+        if attempt is None:
+            continue
+        for question in attempt['questions']:
+            if question['id'] in changed:
+                correct = set(new_bank[question['id']])
+                # Mantenim l'ordre en què es van mostrar les respostes
+                question['correct'] = [answer for answer in question['answers'] if answer in correct]
+
+        score, _ = grade_attempt(attempt['questions'], attempts.attempt_user_answers(attempt), attempt['scheme'])
+        if score != attempt['score']:
+            changes.append({
+                'attempt': attempt_id,
+                'submitted': attempt['submitted'],
+                'old_score': attempt['score'],
+                'new_score': score,
+                'total': attempt['total'],
+            })
+            attempt['score'] = score
+        if not dry_run:
+            attempts.update_attempt(attempt)
+
+    if not dry_run:
+        attempts.update_bank_snapshot(course, file_name, new_bank)
+
+    return {
+        'course': course,
+        'file': file_name,
+        'changed_questions': diff['changed'],
+        'added_questions': diff['added'],
+        'removed_questions': diff['removed'],
+        'attempts_checked': len(affected_ids),
+        'score_changes': changes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-grade stored attempts after answer-key corrections.')
+    parser.add_argument('course')
+    parser.add_argument('files', nargs='*', help='bank files to check (default: every file of the course)')
+    parser.add_argument('--tenant', help='tenant that owns the course (default: the default tenant)')
+    parser.add_argument('--exams-folder', help="override the tenant's exams folder")
+    parser.add_argument('--dry-run', action='store_true', help='report without saving')
+    args = parser.parse_args()
+
+    import examinator
+    tenant = get_tenant(args.tenant)
+    use_tenant(tenant)
+    if args.exams_folder:
+        tenant.exams_folder = args.exams_folder
+
+    reports = []
+    for file_name in args.files or examinator.get_exam_files(args.course):
+        report = regrade_file(tenant.course_key(args.course), file_name,
+                              examinator.process_single_file(args.course, file_name), args.dry_run)
+        reports.append(report)
+        print(f"{file_name}: {len(report['changed_questions'])} changed questions, "
+              f"{report['attempts_checked']} attempts checked, {len(report['score_changes'])} scores changed")
+        for change in report['score_changes']:
+            print(f"  {change['attempt']} ({change['submitted']}): {change['old_score']} -> {change['new_score']} / {change['total']}")
+
+    if not args.dry_run:
+        report_path = os.path.join(attempts.ATTEMPTS_FOLDER, 'reports',
+                                   f"regrade_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        os.makedirs(os.path.dirname(report_path), exist_ok=True)
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+        print(f"Audit report written to {report_path}")
+
+
+if __name__ == '__main__':
+    main()
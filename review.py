@@ -0,0 +1,195 @@
+# Base imports
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+# custom imports
+from banks import Bank
+from config import PRACTICE_DB
+from prng import permute_index
+
+# Mode de pràctica amb repetició espaiada (SM-2). L'estat de cada pregunta per
+# a cada alumne viu en una taula SQLite indexada per data de repàs, que fa de
+# cua de prioritat: triar les preguntes d'una pàgina no recorre l'historial.
+
+DAY = 86400
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reviews (
+    learner TEXT NOT NULL,
+    course TEXT NOT NULL,
+    qid TEXT NOT NULL,
+    due REAL NOT NULL,
+    interval REAL NOT NULL,
+    ease REAL NOT NULL,
+    reps INTEGER NOT NULL,
+    lapses INTEGER NOT NULL,
+    last_review REAL NOT NULL,
+    PRIMARY KEY (learner, course, qid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS reviews_due ON reviews (learner, course, due);
+CREATE TABLE IF NOT EXISTS new_questions (
+    learner TEXT NOT NULL,
+    bank TEXT NOT NULL,
+    seed INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (learner, bank)
+) WITHOUT ROWID;
+"""
+
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    # Una connexió per fil; WAL deixa llegir mentre un altre fil escriu
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        folder = os.path.dirname(PRACTICE_DB)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        connection = sqlite3.connect(PRACTICE_DB, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.executescript(SCHEMA)
+        _local.connection = connection
+    return connection
+
+
+def answer_quality(points: float) -> int:
+    """
+    SM-2 quality (0-5) of an answer from the points it got.
+    """
+    if points >= 1:
+        return 4
+    if points > 0:
+        return 3
+    return 1
+
+
+def schedule_review(state: Optional[Dict[str, Any]], quality: int, now: float) -> Dict[str, Any]:
+    """
+    Next review state of a question after an answer, following SM-2.
+
+    Args:
+    state -- Current state (interval in days, ease, reps, lapses), None for a new question
+    quality -- Quality of the answer, 0 to 5 (3 or more is a pass)
+    now -- Epoch time of the answer
+
+    Returns:
+    The new state, with its due time
+    """
+    state = dict(state or {'interval': 0, 'ease': INITIAL_EASE, 'reps': 0, 'lapses': 0})
+    if quality < 3:
+        state['reps'] = 0
+        state['interval'] = 1
+        state['lapses'] += 1
+    else:
+        state['reps'] += 1
+        if state['reps'] == 1:
+            state['interval'] = 1
+        elif state['reps'] == 2:
+            state['interval'] = 6
+        else:
+            state['interval'] = round(state['interval'] * state['ease'], 2)
+    state['ease'] = max(MIN_EASE, state['ease'] + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    state['due'] = now + state['interval'] * DAY
+    state['last_review'] = now
+    return state
+
+
+def _new_positions(connection: sqlite3.Connection, learner: str, course: str, bank: Bank,
+                   count: int, taken: set) -> List[int]:
+    # Preguntes mai vistes: recorrem una permutació pròpia de l'alumne des d'on es va quedar
+    row = connection.execute('SELECT seed, position FROM new_questions WHERE learner = ? AND bank = ?',
+                             (learner, bank.version)).fetchone()
+    seed, position = row if row else (secrets.randbits(63), 0)
+    positions = []
+    while len(positions) < count and position < len(bank):
+        index = permute_index(seed, position, len(bank))
+        position += 1
+        if index in taken:
+            continue
+        seen = connection.execute('SELECT 1 FROM reviews WHERE learner = ? AND course = ? AND qid = ?',
+                                  (learner, course, bank.question_id(index))).fetchone()
+        if not seen:
+            positions.append(index)
+    connection.execute('INSERT OR REPLACE INTO new_questions (learner, bank, seed, position) VALUES (?, ?, ?, ?)',
+                       (learner, bank.version, seed, position))
+    return positions
+
+
+def pick_questions(learner: str, course: str, bank: Bank, count: int, now: float = None) -> List[int]:
+    """
+    Choose the questions of a practice session: due reviews first, oldest due
+    first, then questions never seen, then the reviews that are due soonest.
+
+    Args:
+    learner -- Id of the learner
+    course -- The course name
+    bank -- Bank of the selected exam files
+    count -- Number of questions
+    now -- Epoch time, the current one by default
+
+    Returns:
+    The positions of the questions in the bank
+    """
+    now = time.time() if now is None else now
+    count = min(count, len(bank))
+    connection = _connect()
+    with connection:
+        positions = []
+        taken = set()
+
+        def take(rows):
+            for (qid,) in rows:
+                index = bank.position(qid)
+                # Preguntes del curs que no són als fitxers triats
+                if index is not None and index not in taken:
+                    positions.append(index)
+                    taken.add(index)
+                    if len(positions) == count:
+                        return
+
+        take(connection.execute('SELECT qid FROM reviews WHERE learner = ? AND course = ? AND due <= ? ORDER BY due',
+                                (learner, course, now)))
+        if len(positions) < count:
+            new = _new_positions(connection, learner, course, bank, count - len(positions), taken)
+            positions.extend(new)
+            taken.update(new)
+        if len(positions) < count:
+            take(connection.execute('SELECT qid FROM reviews WHERE learner = ? AND course = ? AND due > ? ORDER BY due',
+                                    (learner, course, now)))
+    return positions
+
+
+def record_reviews(learner: str, course: str, questions: List[Dict[str, Any]],
+                   detailed_results: List[Dict[str, Any]], now: float = None):
+    """
+    Update the review state of the questions answered in a practice session.
+
+    Args:
+    learner -- Id of the learner
+    course -- The course name
+    questions -- Questions of the session, as shown
+    detailed_results -- Detailed results of the session (see grading.grade_attempt)
+    now -- Epoch time, the current one by default
+    """
+    now = time.time() if now is None else now
+    connection = _connect()
+    with connection:
+        for question, result in zip(questions, detailed_results):
+            row = connection.execute(
+                'SELECT interval, ease, reps, lapses FROM reviews WHERE learner = ? AND course = ? AND qid = ?',
+                (learner, course, question['id'])).fetchone()
+            current = dict(zip(('interval', 'ease', 'reps', 'lapses'), row)) if row else None
+            state = schedule_review(current, answer_quality(result['points']), now)
+            connection.execute(
+                'INSERT OR REPLACE INTO reviews (learner, course, qid, due, interval, ease, reps, lapses, last_review) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (learner, course, question['id'], state['due'], state['interval'], state['ease'],
+                 state['reps'], state['lapses'], state['last_review']))
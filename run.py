@@ -30,6 +30,7 @@ from config import THEME, TITLE, APP_NAME,EXAMS_FOLDER
 from appsecrets import PRIVATE_KEY_PATH
 from appsecrets import PRIVATE_KEY_PASSWORD
 import config
+from grading import grade_attempt
 from routes.index import index_bp
 from routes.exam import selexam_bp
 
@@ -777,24 +778,10 @@ def submit():
     questions_answers = session['questions_answers']
     user_answers = session['user_answers']
     
-    score = 0
     total_questions = len(questions_answers)
-    detailed_results = []
-    
-    for i, question in enumerate(questions_answers, 1):
-        user_answer = set(user_answers.get(f'question{i}', []))
-        correct_answers = set(question['correct'])
-        is_correct = user_answer == correct_answers
-        
-        if is_correct:
-            score += 1
-        
-        detailed_results.append({
-            'question': question['question'],
-            'user_answer': user_answer,
-            'correct_answers': correct_answers,
-            'is_correct': is_correct
-        })
+    score, detailed_results = grade_attempt(
+        questions_answers,
+        {str(i): user_answers.get(f'question{i}', []) for i in range(1, total_questions + 1)})
     
     session['score'] = score
     session['total_questions'] = total_questions
@@ -0,0 +1,46 @@
+/* proctor.js — tauler en directe dels exàmens en curs */
+
+var attempts = {};
+
+function formatLeft(deadline) {
+    if (!deadline) return '-';
+    var left = Math.max(0, Math.round(deadline - Date.now() / 1000));
+    var mins = Math.floor(left / 60), secs = left % 60;
+    return mins + ':' + (secs < 10 ? '0' : '') + secs;
+}
+
+function render() {
+    var rows = document.getElementById('proctorRows');
+    rows.innerHTML = '';
+    Object.keys(attempts).sort().forEach(function(id) {
+        var a = attempts[id];
+        var tr = document.createElement('tr');
+        [id.substring(0, 8), a.course || '', a.page || '', (a.answered || 0) + ' / ' + (a.total || 0),
+         formatLeft(a.deadline), new Date(a.updated * 1000).toLocaleTimeString()].forEach(function(value) {
+            var td = document.createElement('td');
+            td.textContent = value;
+            tr.appendChild(td);
+        });
+        rows.appendChild(tr);
+    });
+}
+
+function update(state) {
+    if (state.status === 'finished' || state.status === 'expired' || state.status === 'abandoned') {
+        delete attempts[state.id];
+    } else {
+        attempts[state.id] = state;
+    }
+}
+
+var source = new EventSource('/admin/proctor/stream');
+source.addEventListener('snapshot', function(e) {
+    attempts = {};
+    JSON.parse(e.data).forEach(update);
+    render();
+});
+source.addEventListener('progress', function(e) {
+    update(JSON.parse(e.data));
+    render();
+});
+setInterval(render, 1000);
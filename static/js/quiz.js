@@ -3,8 +3,264 @@
 function showConfirm() { document.getElementById('confirmOverlay').style.display = 'flex'; }
 function hideConfirm() { document.getElementById('confirmOverlay').style.display = 'none'; }
 function submitExam() {
+    var form = document.getElementById('quizForm');
     document.getElementById('finishAction').value = 'Finish Exam';
-    document.getElementById('quizForm').submit();
+    if (!offline) { form.submit(); return; }
+    // Primer han d'arribar totes les respostes; sense xarxa es torna a provar
+    syncAnswers().then(function(pending) {
+        if (pending) {
+            showSyncStatus('Sense connexió: l\'examen es lliurarà quan tornis a tenir xarxa.');
+            setTimeout(submitExam, 3000);
+        } else {
+            form.submit();
+        }
+    });
+}
+
+// Mode fora de línia: cada canvi de resposta es desa a IndexedDB amb un número
+// de seqüència i s'envia en lots a /quiz/sync. El servidor ignora els canvis
+// que ja té, de manera que un lot es pot reenviar tantes vegades com calgui.
+var offline = null;
+
+function openStore() {
+    return new Promise(function(resolve, reject) {
+        var request = indexedDB.open('examinator', 1);
+        request.onupgradeneeded = function() {
+            request.result.createObjectStore('answers', { keyPath: ['attempt', 'question'] });
+            request.result.createObjectStore('meta', { keyPath: 'attempt' });
+        };
+        request.onsuccess = function() { resolve(request.result); };
+        request.onerror = function() { reject(request.error); };
+    });
+}
+
+function storeRequest(mode, stores, work) {
+    return offline.db.then(function(db) {
+        return new Promise(function(resolve, reject) {
+            var tx = db.transaction(stores, mode);
+            var result = work(tx);
+            tx.oncomplete = function() { resolve(result.value); };
+            tx.onerror = function() { reject(tx.error); };
+        });
+    });
+}
+
+function storedAnswers() {
+    return storeRequest('readonly', ['answers'], function(tx) {
+        var result = { value: [] };
+        var range = IDBKeyRange.bound([offline.attempt, 0], [offline.attempt, Infinity]);
+        tx.objectStore('answers').openCursor(range).onsuccess = function(e) {
+            var cursor = e.target.result;
+            if (cursor) { result.value.push(cursor.value); cursor.continue(); }
+        };
+        return result;
+    });
+}
+
+function fieldValues(form, name) {
+    var values = [];
+    form.querySelectorAll('input[name="' + name + '"]').forEach(function(input) {
+        if (input.type === 'text' || input.checked) values.push(input.value);
+    });
+    return values;
+}
+
+// La pregunta d'un camp: el seu número a l'intent i el seu id al banc
+function describeChange(form, input) {
+    var match = /^question(\d+)$/.exec(input.name || '');
+    if (!match) return null;
+    var block = input.closest('.quiz-question');
+    return { question: parseInt(match[1]), id: block && block.dataset.id, text: input.type === 'text',
+             values: fieldValues(form, input.name) };
+}
+
+// El canvi tal com l'espera /quiz/sync
+function syncChange(answer) {
+    var change = { seq: answer.seq };
+    if (answer.id) { change.id = answer.id; } else { change.question = answer.question; }
+    if (answer.text) { change.text = answer.values[0] || ''; } else { change.options = answer.values; }
+    return change;
+}
+
+function postChanges(attempt, changes, keepalive) {
+    return fetch('/quiz/sync', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ attempt: attempt, changes: changes }),
+        credentials: 'same-origin',
+        keepalive: keepalive
+    });
+}
+
+// Sense IndexedDB: s'envien els canvis en lloc de tot el formulari, amb un sol lot alhora.
+// En un intent sense temps la sessió és el magatzem: dues peticions simultànies la
+// desarien sencera totes dues i l'última esborraria el canvi de l'altra
+var direct = { seq: 0, pending: {}, inflight: null };
+
+function sendChange(form, input) {
+    var answer = describeChange(form, input);
+    if (!answer) return;
+    direct.seq = Math.max(direct.seq, parseInt(form.dataset.seq) || 0) + 1;
+    answer.seq = direct.seq;
+    // Els canvis a la mateixa pregunta mentre n'hi ha un lot en curs es fonen en un
+    direct.pending[answer.question] = answer;
+    flushChanges(form.dataset.attempt);
+}
+
+function flushChanges(attempt) {
+    if (direct.inflight) return;
+    var changes = Object.keys(direct.pending).map(function(key) { return syncChange(direct.pending[key]); });
+    if (!changes.length) return;
+    direct.pending = {};
+    direct.inflight = postChanges(attempt, changes, false).catch(function() {}).then(function() {
+        direct.inflight = null;
+        flushChanges(attempt);
+    });
+}
+
+function recordChange(form, input) {
+    var answer = describeChange(form, input);
+    if (!answer) return;
+    storeRequest('readwrite', ['answers', 'meta'], function(tx) {
+        var meta = tx.objectStore('meta');
+        meta.get(offline.attempt).onsuccess = function(e) {
+            // El servidor també compta: mai no es torna a un número que ja ha vist
+            var seq = Math.max(e.target.result ? e.target.result.seq : 0, offline.serverSeq) + 1;
+            meta.put({ attempt: offline.attempt, seq: seq });
+            answer.attempt = offline.attempt;
+            answer.seq = seq;
+            answer.synced = false;
+            tx.objectStore('answers').put(answer);
+        };
+        return {};
+    }).then(scheduleSync);
+}
+
+function showSyncStatus(text) {
+    var status = document.getElementById('syncStatus');
+    if (!status) return;
+    status.textContent = text || '';
+    status.hidden = !text;
+}
+
+function scheduleSync() {
+    if (!offline.timer) offline.timer = setTimeout(syncAnswers, offline.interval);
+}
+
+// Envia els canvis pendents en un sol lot. Retorna quants en queden per enviar.
+function syncAnswers() {
+    clearTimeout(offline.timer);
+    offline.timer = null;
+    // Un sol lot alhora; qui arriba mentrestant espera i en fa un altre amb el que quedi
+    if (offline.inflight) return offline.inflight.then(syncAnswers);
+    offline.inflight = sendPending().then(function(left) {
+        offline.inflight = null;
+        return left;
+    });
+    return offline.inflight;
+}
+
+function sendPending() {
+    return storedAnswers().then(function(answers) {
+        var pending = answers.filter(function(answer) { return !answer.synced; });
+        if (!pending.length) return 0;
+        return postChanges(offline.attempt, pending.map(syncChange), true).then(function(response) {
+            if (response.status === 409) return { acks: null };
+            if (!response.ok) throw new Error(response.status);
+            return response.json();
+        }).then(function(result) {
+            if (!result.acks) { showSyncStatus(''); return 0; }
+            return markSynced(pending, result.acks);
+        });
+    }).then(function(left) {
+        showSyncStatus(left ? 'Respostes pendents d\'enviar: ' + left : '');
+        if (left) scheduleSync();
+        return left;
+    }, function() {
+        // Sense xarxa: les respostes es queden a IndexedDB fins que torni
+        showSyncStatus('Sense connexió: les respostes es desen en aquest dispositiu.');
+        scheduleSync();
+        return 1;
+    });
+}
+
+function markSynced(pending, acks) {
+    return storeRequest('readwrite', ['answers'], function(tx) {
+        var result = { value: 0 };
+        var store = tx.objectStore('answers');
+        pending.forEach(function(answer) {
+            var acked = acks[String(answer.id || answer.question)] || 0;
+            // Només si mentrestant no s'ha tornat a canviar
+            store.get([answer.attempt, answer.question]).onsuccess = function(e) {
+                var current = e.target.result;
+                if (!current || current.synced) return;
+                if (current.seq <= acked) {
+                    current.synced = true;
+                    store.put(current);
+                } else {
+                    result.value += 1;
+                }
+            };
+        });
+        return result;
+    });
+}
+
+// Respostes desades al dispositiu que el servidor encara no té (o una pàgina de la memòria cau)
+function restoreAnswers(form) {
+    return storedAnswers().then(function(answers) {
+        answers.forEach(function(answer) {
+            var inputs = form.querySelectorAll('input[name="question' + answer.question + '"]');
+            if (!inputs.length || answer.seq <= offline.serverSeq && answer.synced) return;
+            inputs.forEach(function(input) {
+                if (input.type === 'text') {
+                    input.value = answer.values[0] || '';
+                } else {
+                    input.checked = answer.values.indexOf(input.value) !== -1;
+                    input.closest('.answer-option').classList.toggle('is-selected', input.checked);
+                }
+            });
+        });
+    });
+}
+
+function initOffline(form) {
+    if (!form.dataset.attempt || !window.indexedDB || !window.fetch || !window.Promise) return false;
+    offline = {
+        attempt: form.dataset.attempt,
+        serverSeq: parseInt(form.dataset.seq) || 0,
+        interval: (parseInt(form.dataset.syncSeconds) || 5) * 1000,
+        db: openStore(),
+        timer: null,
+        inflight: null
+    };
+    offline.db.catch(function() { offline = null; });
+
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.register('/sw.js').then(function() {
+            return navigator.serviceWorker.ready;
+        }).then(function(registration) {
+            // El service worker precarrega totes les pàgines de l'examen
+            registration.active.postMessage({ type: 'exam', attempt: offline.attempt,
+                                              pages: parseInt(form.dataset.pages) });
+        }).catch(function() {});
+    }
+
+    // Anterior / Següent: les respostes ja van per la cua, la pàgina es demana per GET
+    // i, sense xarxa, la serveix el service worker
+    form.addEventListener('submit', function(e) {
+        var button = e.submitter;
+        if (!offline || !button || button.name !== 'navigation') return;
+        e.preventDefault();
+        var page = parseInt(form.dataset.page) + (button.value === 'next' ? 1 : -1);
+        syncAnswers();
+        window.location.href = '/quiz?page=' + page;
+    });
+    window.addEventListener('online', syncAnswers);
+    window.addEventListener('pagehide', function() { if (offline) syncAnswers(); });
+
+    restoreAnswers(form).then(syncAnswers);
+    return true;
 }
 
 function updateSelection(input) {
@@ -30,13 +286,46 @@ function initQuiz() {
             setTimeout(function() { updateSelection(inp); }, 0);
         });
     });
+
+    // Desa les respostes a cada canvi, sense esperar a canviar de pàgina
+    var form = document.getElementById('quizForm');
+    if (form) {
+        var queued = initOffline(form);
+        form.addEventListener('change', function(e) {
+            if (queued && offline) {
+                recordChange(form, e.target);
+            } else if (form.dataset.attempt && window.fetch) {
+                sendChange(form, e.target);
+            } else {
+                fetch('/quiz/save', { method: 'POST', body: new URLSearchParams(new FormData(form)) });
+            }
+        });
+    }
+}
+
+// Compte enrere dels exàmens amb temps (el servidor és qui fa complir el límit)
+function initTimer() {
+    var timer = document.getElementById('quizTimer');
+    if (!timer) return;
+    var deadline = parseInt(timer.dataset.deadline) * 1000;
+    function tick() {
+        var left = Math.max(0, Math.round((deadline - Date.now()) / 1000));
+        var mins = Math.floor(left / 60), secs = left % 60;
+        timer.textContent = 'Temps restant: ' + mins + ':' + (secs < 10 ? '0' : '') + secs;
+        timer.classList.toggle('is-ending', left <= 60);
+        if (left === 0) { clearInterval(interval); submitExam(); }
+    }
+    var interval = setInterval(tick, 1000);
+    tick();
 }
 
 // Inicialitza quan el DOM estigui llest
 if (document.readyState === 'loading') {
     document.addEventListener('DOMContentLoaded', initQuiz);
+    document.addEventListener('DOMContentLoaded', initTimer);
 } else {
     initQuiz();
+    initTimer();
 }
 
 document.addEventListener('keydown', function(e) {
@@ -66,6 +355,7 @@ document.addEventListener('keydown', function(e) {
             target.checked = !target.checked;
         }
         updateSelection(target);
+        target.dispatchEvent(new Event('change', { bubbles: true }));
         var label = target.closest('.answer-option');
         label.classList.add('key-flash');
         setTimeout(function() { label.classList.remove('key-flash'); }, 250);
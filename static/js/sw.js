@@ -0,0 +1,116 @@
+/* sw.js — service worker of the STIT examinator offline exam client */
+
+// Canviar la versió quan canviïn els fitxers estàtics: activate esborra les memòries cau velles
+var VERSION = 'v2';
+var STATIC_CACHE = 'examinator-static-' + VERSION;
+var PAGES_CACHE = 'examinator-pages-' + VERSION;
+var PREFETCH_HEADER = 'X-Examinator-Prefetch';
+
+var OFFLINE_PAGE = '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Sense connexió</title></head>' +
+    '<body><p>Sense connexió i aquesta pàgina de l\'examen no és al dispositiu.</p>' +
+    '<p>Les respostes que ja has donat estan desades; torna-ho a provar quan tinguis xarxa.</p></body></html>';
+
+self.addEventListener('install', function() {
+    self.skipWaiting();
+});
+
+self.addEventListener('activate', function(event) {
+    event.waitUntil(caches.keys().then(function(names) {
+        return Promise.all(names.filter(function(name) {
+            return name.indexOf('examinator-') === 0 && name !== STATIC_CACHE && name !== PAGES_CACHE;
+        }).map(function(name) { return caches.delete(name); }));
+    }).then(function() { return self.clients.claim(); }));
+});
+
+// /quiz i /quiz?page=1 són la mateixa pàgina
+function pageKey(url) {
+    return '/quiz?page=' + (parseInt(url.searchParams.get('page')) || 1);
+}
+
+// Estàtics: es serveixen de la memòria cau i s'actualitzen en segon pla
+function staleWhileRevalidate(request) {
+    return caches.open(STATIC_CACHE).then(function(cache) {
+        return cache.match(request).then(function(cached) {
+            var fresh = fetch(request).then(function(response) {
+                if (response.ok) cache.put(request, response.clone());
+                return response;
+            });
+            return cached || fresh;
+        });
+    });
+}
+
+// Pàgines de l'examen: primer la xarxa, i la còpia desada si no n'hi ha
+function networkFirst(request, url) {
+    var key = pageKey(url);
+    return fetch(request).then(function(response) {
+        // Una redirecció vol dir que l'intent ja no és en curs: no es desa
+        if (response.ok && !response.redirected) {
+            var copy = response.clone();
+            caches.open(PAGES_CACHE).then(function(cache) { cache.put(key, copy); });
+        }
+        return response;
+    }).catch(function() {
+        return caches.open(PAGES_CACHE).then(function(cache) {
+            return cache.match(key);
+        }).then(function(cached) {
+            return cached || new Response(OFFLINE_PAGE, { headers: { 'Content-Type': 'text/html; charset=utf-8' } });
+        });
+    });
+}
+
+self.addEventListener('fetch', function(event) {
+    var request = event.request;
+    if (request.method !== 'GET') return;
+    var url = new URL(request.url);
+    if (url.origin !== self.location.origin) return;
+    if (url.pathname.indexOf('/static/') === 0) {
+        event.respondWith(staleWhileRevalidate(request));
+    } else if (url.pathname === '/quiz') {
+        event.respondWith(networkFirst(request, url));
+    }
+});
+
+// Precàrrega de totes les pàgines de l'intent, perquè l'examen es pugui seguir sense xarxa.
+// L'intent de les pàgines desades és a la mateixa memòria cau: el service worker es pot aturar.
+var ATTEMPT_KEY = '/quiz?attempt';
+
+function prefetchExam(attempt, pages) {
+    return caches.open(PAGES_CACHE).then(function(cache) {
+        return cache.match(ATTEMPT_KEY).then(function(stored) {
+            return stored ? stored.text() : null;
+        }).then(function(cachedAttempt) {
+            if (cachedAttempt === attempt) return;
+            // Les pàgines d'un altre intent no serveixen
+            return cache.keys().then(function(keys) {
+                return Promise.all(keys.map(function(key) { return cache.delete(key); }));
+            }).then(function() {
+                return cache.put(ATTEMPT_KEY, new Response(attempt));
+            });
+        }).then(function() {
+            var fetches = [];
+            for (var page = 1; page <= pages; page++) {
+                fetches.push(fetchPage(cache, '/quiz?page=' + page));
+            }
+            return Promise.all(fetches);
+        });
+    });
+}
+
+function fetchPage(cache, key) {
+    return cache.match(key).then(function(cached) {
+        if (cached) return;
+        var headers = {};
+        headers[PREFETCH_HEADER] = '1';
+        return fetch(key, { credentials: 'same-origin', headers: headers }).then(function(response) {
+            if (response.ok && !response.redirected) return cache.put(key, response);
+        }).catch(function() {});
+    });
+}
+
+self.addEventListener('message', function(event) {
+    var data = event.data || {};
+    if (data.type === 'exam' && data.attempt && data.pages > 0) {
+        event.waitUntil(prefetchExam(data.attempt, data.pages));
+    }
+});
@@ -0,0 +1,98 @@
+# Base imports
+import re
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
+
+# custom imports
+from config import EXAMS_FOLDER
+from config import EXAM_QUESTIONS
+from config import EXAM_TIME_LIMIT
+from config import THEME
+from config import TITLE
+from config import APP_NAME
+from config import BANK_CACHE_MB
+from config import TENANTS
+
+# Organitzacions allotjades. Cada una té la seva arrel de bancs, tema i
+# paràmetres, i la seva pròpia memòria cau de bancs (vegeu banks.py). La que
+# atén una petició es tria pel nom de host; la resta van a la de per defecte,
+# construïda amb els valors globals de config.py.
+
+DEFAULT_TENANT = 'default'
+NAME_PATTERN = re.compile(r'^[a-z0-9][a-z0-9_-]*$')
+
+
+class Tenant:
+    """
+    Settings of one tenant.
+    """
+    __slots__ = ('name', 'hosts', 'exams_folder', 'theme', 'title', 'app_name',
+                 'exam_questions', 'exam_time_limit', 'bank_cache_bytes')
+
+    def __init__(self, name: str, settings: Dict[str, Any]):
+        self.name = name
+        self.hosts = [host.lower() for host in settings.get('hosts', [])]
+        self.exams_folder = settings.get('exams_folder', EXAMS_FOLDER)
+        self.theme = settings.get('theme', THEME)
+        self.title = settings.get('title', TITLE)
+        self.app_name = settings.get('app_name', APP_NAME)
+        self.exam_questions = settings.get('exam_questions', EXAM_QUESTIONS)
+        self.exam_time_limit = settings.get('exam_time_limit', EXAM_TIME_LIMIT)
+        self.bank_cache_bytes = int(settings.get('bank_cache_mb', BANK_CACHE_MB) * 1024 * 1024)
+
+    def course_key(self, course: str) -> str:
+        """
+        Course name qualified with the tenant, for the stores shared by all of them.
+        """
+        return course if self.name == DEFAULT_TENANT else f"{self.name}/{course}"
+
+
+def _load_tenants() -> Dict[str, Tenant]:
+    tenants = {DEFAULT_TENANT: Tenant(DEFAULT_TENANT, TENANTS.get(DEFAULT_TENANT, {}))}
+    for name, settings in TENANTS.items():
+        if name == DEFAULT_TENANT:
+            continue
+        if not NAME_PATTERN.match(name):
+            print(f"Ignoring tenant with an invalid name: {name}")
+            continue
+        tenants[name] = Tenant(name, settings)
+    return tenants
+
+
+_tenants = _load_tenants()
+_by_host = {host: tenant for tenant in _tenants.values() for host in tenant.hosts}
+_current: ContextVar[Optional[Tenant]] = ContextVar('tenant', default=None)
+
+
+def list_tenants() -> List[Tenant]:
+    return list(_tenants.values())
+
+
+def get_tenant(name: Optional[str]) -> Tenant:
+    """
+    A tenant by name; the default one if the name is unknown.
+    """
+    return _tenants.get(name or DEFAULT_TENANT) or _tenants[DEFAULT_TENANT]
+
+
+def tenant_for_host(host: Optional[str]) -> Tenant:
+    """
+    The tenant that serves a host name (the port is ignored).
+    """
+    host = (host or '').split(':', 1)[0].lower()
+    return _by_host.get(host) or _tenants[DEFAULT_TENANT]
+
+
+def use_tenant(tenant: Tenant):
+    """
+    Make a tenant the current one for this request (or task, or thread).
+    """
+    return _current.set(tenant)
+
+
+def reset_tenant(token):
+    _current.reset(token)
+
+
+def current_tenant() -> Tenant:
+    return _current.get() or _tenants[DEFAULT_TENANT]
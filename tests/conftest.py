@@ -0,0 +1,6 @@
+# Base imports
+import os
+import sys
+
+# Els mòduls de l'aplicació són a l'arrel del repositori
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
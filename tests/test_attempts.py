@@ -0,0 +1,53 @@
+# Base imports
+import threading
+
+# custom imports
+import attempts
+
+
+def test_concurrent_batches_keep_the_newest_answers(tmp_path, monkeypatch):
+    monkeypatch.setattr(attempts, 'ATTEMPTS_FOLDER', str(tmp_path))
+    attempt_id = attempts.start_active('sid', 'demo', ['bank.md'], {}, 0)
+
+    def sync(key):
+        for seq in range(1, 21):
+            attempts.update_active(attempt_id, {key: [f"answer {seq}"]}, {key: seq})
+
+    workers = [threading.Thread(target=sync, args=(str(key),)) for key in range(1, 9)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    record = attempts.claim_active(attempt_id)
+    assert record['answer_seqs'] == {str(key): 20 for key in range(1, 9)}
+    assert record['user_answers'] == {str(key): ['answer 20'] for key in range(1, 9)}
+    assert list((tmp_path / 'active').iterdir()) == []
+
+
+def test_practice_sittings_stay_out_of_the_question_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(attempts, 'ATTEMPTS_FOLDER', str(tmp_path))
+    question = {'id': 'q1', 'question': 'Pick one', 'answers': ['a', 'b'], 'correct': ['a']}
+    exam_id = attempts.save_attempt('demo', ['bank.md'], [question], {'1': [0]}, 1, 'all_or_nothing')
+    practice_id = attempts.save_attempt('demo', ['bank.md'], [question], {'1': [1]}, 0, 'all_or_nothing',
+                                        practice=True)
+
+    assert attempts.attempts_for_question('q1') == [exam_id]
+    assert attempts.load_attempt(practice_id)['practice']
+
+
+def test_concurrent_record_bank_keeps_every_new_question(tmp_path, monkeypatch):
+    monkeypatch.setattr(attempts, 'ATTEMPTS_FOLDER', str(tmp_path))
+
+    def load(worker):
+        for number in range(10):
+            question = {'id': f"{worker}-{number}", 'question': 'Pick one', 'answers': ['a', 'b'], 'correct': ['a']}
+            attempts.record_bank('demo', 'bank.md', [question])
+
+    workers = [threading.Thread(target=load, args=(worker,)) for worker in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert len(attempts.load_bank_snapshot('demo', 'bank.md')) == 80
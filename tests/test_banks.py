@@ -0,0 +1,33 @@
+# custom imports
+import banks
+from questions import Question
+
+
+def make_questions(*texts):
+    return [Question(text, ['a', 'b'], 1, f"id-{text}", 'topic') for text in texts]
+
+
+def use_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(banks, 'BANK_CACHE_FOLDER', str(tmp_path))
+    monkeypatch.setattr(banks, '_caches', {})
+
+
+def test_new_version_replaces_the_source_key_of_its_lineage(tmp_path, monkeypatch):
+    use_store(tmp_path, monkeypatch)
+    old = banks.register_bank(make_questions('one', 'two'), ('exams', 'demo', ('bank.md',), (1.0,)), lineage='demo:bank.md')
+    new = banks.register_bank(make_questions('one', 'three'), ('exams', 'demo', ('bank.md',), (2.0,)), lineage='demo:bank.md')
+
+    assert banks.source_bank(('exams', 'demo', ('bank.md',), (1.0,))) is None
+    assert banks.source_bank(('exams', 'demo', ('bank.md',), (2.0,))) is new
+    assert banks.diff_versions(old, new) == {'changed': [], 'added': ['id-three'], 'removed': ['id-two']}
+
+
+def test_diff_versions_reads_ids_without_decoding(tmp_path, monkeypatch):
+    use_store(tmp_path, monkeypatch)
+    old = banks.register_bank(make_questions('one', 'two'))
+    new = banks.register_bank(make_questions('one', 'three'))
+    decoded = banks.cache_stats()['default']['decoded_questions']
+
+    banks.diff_versions(old, new)
+
+    assert banks.cache_stats()['default']['decoded_questions'] == decoded
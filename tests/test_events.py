@@ -0,0 +1,43 @@
+# Base imports
+import time
+
+# custom imports
+from events import ProgressBus
+
+
+def test_idle_attempts_are_pruned():
+    bus = ProgressBus(idle_seconds=60)
+    bus.publish('practice', status='practice', page=1)
+    bus.publish('exam', status='active', page=1)
+    bus.publish('exam', page=2)
+
+    assert bus.prune(time.time() + 30) == 0
+    bus._state['practice']['updated'] -= 120
+    assert bus.prune() == 1
+
+    _, states = bus.snapshot()
+    assert [state['id'] for state in states] == ['exam']
+    _, events, lost = bus.events_since(3)
+    assert not lost
+    assert events == [dict(events[0], id='practice', status='abandoned')]
+
+
+def test_publish_prunes_abandoned_attempts():
+    bus = ProgressBus(idle_seconds=60)
+    bus.publish('practice', status='practice', page=1)
+    bus._state['practice']['updated'] -= 120
+    bus._next_prune = 0
+    bus.publish('exam', status='active', page=1)
+
+    _, states = bus.snapshot()
+    assert [state['id'] for state in states] == ['exam']
+
+
+def test_late_publish_after_finish_is_ignored():
+    bus = ProgressBus()
+    bus.publish('exam', status='active', page=1)
+    bus.publish('exam', status='finished', score=3)
+    seq = bus.last_seq
+    bus.publish('exam', answered=4)
+
+    assert bus.snapshot() == (seq, [])
@@ -0,0 +1,60 @@
+# Base imports
+import uuid
+
+# external imports
+import pytest
+
+# custom imports
+import examinator
+import limits
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(limits, '_buckets', limits.MemoryBuckets())
+    monkeypatch.setattr(examinator, 'RATE_LIMIT_ADDRESS_SCALE', 1)
+    return examinator.app.test_client()
+
+
+def test_rotating_session_cookies_share_the_address_bucket(client):
+    rate, burst = limits.RATE_LIMITS['select_exam']
+    statuses = []
+    for _ in range(burst + 2):
+        # Una galeta de sessió que no és al magatzem, diferent a cada petició
+        client.set_cookie(examinator.app.config['SESSION_COOKIE_NAME'], uuid.uuid4().hex)
+        statuses.append(client.post('/select_exam').status_code)
+    assert 429 not in statuses[:burst]
+    assert statuses[-1] == 429
+
+
+def test_stored_session_gets_its_own_bucket(client):
+    rate, burst = limits.RATE_LIMITS['select_exam']
+    with client.session_transaction() as session:
+        session['course'] = 'demo'
+    # L'adreça ja ha gastat el seu cubell, la sessió no
+    other = examinator.app.test_client()
+    for _ in range(burst + 1):
+        other.post('/select_exam')
+    assert client.post('/select_exam').status_code != 429
+
+
+def test_memory_buckets_evict_the_least_recently_used_past_the_cap():
+    buckets = limits.MemoryBuckets(max_buckets=3)
+    for key in ('a', 'b', 'c'):
+        buckets.take(key, 1, 1, 100)
+    buckets.take('a', 1, 1, 100.5)
+    buckets.take('d', 1, 1, 100.5)
+
+    assert list(buckets._buckets) == ['c', 'a', 'd']
+    # Un cubell expulsat torna ple: la següent petició passa
+    assert buckets.take('b', 1, 1, 100.5) == 0
+
+
+def test_sqlite_buckets_delete_idle_rows(tmp_path):
+    buckets = limits.SqliteBuckets(str(tmp_path / 'limits.db'), idle_seconds=10)
+    buckets.take('old', 1, 1, 1000)
+    buckets.take('recent', 1, 1, 1000 + limits.PRUNE_INTERVAL_SECONDS - 5)
+    buckets.take('new', 1, 1, 1000 + limits.PRUNE_INTERVAL_SECONDS)
+
+    rows = buckets._connect().execute('SELECT key FROM buckets ORDER BY key').fetchall()
+    assert rows == [('new',), ('recent',)]
@@ -0,0 +1,70 @@
+# Base imports
+import json
+import time
+
+# custom imports
+import lint
+from lint import lint_text
+
+
+def codes(text):
+    return [issue['code'] for issue in lint_text(text)]
+
+
+def test_multi_line_body_is_not_empty():
+    text = '\n'.join([
+        '####',
+        'Which command lists the files of a directory?',
+        '',
+        '```',
+        '$ ls -l',
+        '- not an answer',
+        '```',
+        '+ **ls**',
+        '+ cd',
+    ])
+    assert codes(text) == []
+
+
+def test_empty_body_is_an_error():
+    assert codes('####\n\n+ **yes**\n+ no\n') == ['E004']
+
+
+def test_questions_differing_after_the_first_line_are_not_duplicates():
+    text = '#### Pick one\nfirst\n+ **a**\n+ b\n#### Pick one\nsecond\n+ **a**\n+ b\n'
+    assert codes(text) == []
+
+
+def test_lint_tree_keeps_only_the_contents_it_saw(tmp_path, monkeypatch):
+    cache_path = tmp_path / 'lint.json'
+    cache_path.write_text(json.dumps({'old': []}), encoding='utf-8')
+    monkeypatch.setattr(lint, 'CACHE_PATH', str(cache_path))
+    monkeypatch.setattr(lint, 'BANK_CACHE_FOLDER', str(tmp_path))
+    monkeypatch.setattr(lint, '_cache', {})
+    monkeypatch.setattr(lint, '_cache_loaded', False)
+    banks = tmp_path / 'banks'
+    banks.mkdir()
+    (banks / 'bank.md').write_text('#### Pick one\n+ **a**\n+ b\n', encoding='utf-8')
+
+    for use_cache in (False, True):
+        reports, checked = lint.lint_tree(str(banks), workers=1, use_cache=use_cache)
+        assert checked == (0 if use_cache else 1) and reports[0]['errors'] == 0
+        saved = json.loads(cache_path.read_text(encoding='utf-8'))
+        assert set(saved) == {reports[0]['hash']}
+
+
+def test_check_file_saves_the_cache_once_for_a_burst(tmp_path, monkeypatch):
+    cache_path = tmp_path / 'lint.json'
+    monkeypatch.setattr(lint, 'CACHE_PATH', str(cache_path))
+    monkeypatch.setattr(lint, 'BANK_CACHE_FOLDER', str(tmp_path))
+    monkeypatch.setattr(lint, 'SAVE_DELAY_SECONDS', 0.1)
+    monkeypatch.setattr(lint, '_cache', {})
+    monkeypatch.setattr(lint, '_cache_loaded', True)
+    for number in range(3):
+        path = tmp_path / f"bank{number}.md"
+        path.write_text(f"#### Question {number}\n+ **a**\n+ b\n", encoding='utf-8')
+        lint.check_file(str(path))
+
+    assert not cache_path.exists()
+    time.sleep(0.5)
+    assert len(json.loads(cache_path.read_text(encoding='utf-8'))) == 3
@@ -0,0 +1,43 @@
+# Base imports
+import json
+import os
+
+# custom imports
+import variants
+from banks import Bank
+from questions import Question
+
+
+def make_bank(version):
+    return Bank(version, [Question(f"Question {i}", ['a', 'b'], 1, str(i), 'topic') for i in range(10)])
+
+
+def test_pool_rebuilt_by_another_worker_is_picked_up(tmp_path, monkeypatch):
+    monkeypatch.setattr(variants, 'BANK_CACHE_FOLDER', str(tmp_path))
+    monkeypatch.setattr(variants, '_pools', {})
+    monkeypatch.setattr(variants, '_difficulty', {})
+    variants.build_pool('demo', ['bank.md'], make_bank('v1'), 5, 2)
+    assert variants.hand_out_variant('demo', ['bank.md'], make_bank('v1'))['version'] == 'v1'
+
+    # Un altre procés refà el pool sobre la versió nova del banc
+    path = variants._pool_path(variants.pool_id('demo', ['bank.md']))
+    with open(path, 'r', encoding='utf-8') as f:
+        pool = json.load(f)
+    pool['version'] = 'v2'
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(pool, f)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+
+    assert variants.hand_out_variant('demo', ['bank.md'], make_bank('v2'))['version'] == 'v2'
+    assert variants.hand_out_variant('demo', ['bank.md'], make_bank('v1')) is None
+
+
+def test_difficulty_is_measured_once_per_ttl(monkeypatch):
+    monkeypatch.setattr(variants, '_difficulty', {})
+    reads = []
+    monkeypatch.setattr(variants.attempts, 'attempts_for_question', lambda qid: reads.append(qid) or [])
+    question = Question('Question', ['a', 'b'], 1, 'q1', 'topic')
+
+    assert variants.question_difficulty(question) == 'unknown'
+    assert variants.question_difficulty(question) == 'unknown'
+    assert reads == ['q1']
@@ -0,0 +1,251 @@
+# Base imports
+import hashlib
+import json
+import os
+import random
+import secrets
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+# custom imports
+import attempts
+from banks import Bank
+from config import BANK_CACHE_FOLDER
+from config import VARIANT_MAX_OVERLAP
+from grading import CompiledQuestion
+
+# Pools de variants d'examen generades per endavant per a convocatòries
+# massives. Cada variant és una llista d'índexs del banc, equilibrada per tema
+# (fitxer d'origen) i dificultat (encerts històrics), i amb un solapament
+# limitat amb la resta. Repartir-ne una és O(1).
+
+# Respostes mínimes a una pregunta per tenir-ne la dificultat en compte
+MIN_DIFFICULTY_SAMPLE = 5
+DIFFICULTY_SAMPLE = 50
+DIFFICULTY_LEVELS = (('hard', 0.4), ('medium', 0.7), ('easy', 1.01))
+# La dificultat canvia a poc a poc: es recalcula com a molt un cop per hora i pregunta
+DIFFICULTY_TTL_SECONDS = 3600
+
+_lock = threading.Lock()
+# Per id: l'hora de modificació del fitxer del pool i el pool
+_pools: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+_next_variant: Dict[str, int] = {}
+# Per id de pregunta: quan caduca i el nivell
+_difficulty: Dict[str, Tuple[float, str]] = {}
+
+
+def pool_id(course: str, files: List[str]) -> str:
+    """
+    Id of the pool of a course and file selection (the order of the files doesn't matter).
+    """
+    key = json.dumps([course, sorted(files)], ensure_ascii=False)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+def _pool_path(pid: str) -> str:
+    return os.path.join(BANK_CACHE_FOLDER, 'pools', f"{pid}.json")
+
+
+def question_difficulty(question: Dict[str, Any]) -> str:
+    """
+    Difficulty level of a question from the last attempts that included it, kept for DIFFICULTY_TTL_SECONDS.
+
+    Returns:
+    'easy', 'medium', 'hard', or 'unknown' if it hasn't been answered enough times
+    """
+    now = time.time()
+    with _lock:
+        cached = _difficulty.get(question['id'])
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    level = _measure_difficulty(question)
+    with _lock:
+        _difficulty[question['id']] = (now + DIFFICULTY_TTL_SECONDS, level)
+    return level
+
+
+def _measure_difficulty(question: Dict[str, Any]) -> str:
+    compiled = CompiledQuestion(question, 'all_or_nothing')
+    answered = correct = 0
+    for attempt_id in attempts.attempts_for_question(question['id'])[-DIFFICULTY_SAMPLE:]:
+        attempt = attempts.load_attempt(attempt_id)
+        if attempt is None:
+            continue
+        for shown in attempt['questions']:
+            if shown['id'] != question['id']:
+                continue
+            answered += 1
+            correct += compiled.score(shown['user_answer']) == 1
+    if answered < MIN_DIFFICULTY_SAMPLE:
+        return 'unknown'
+    rate = correct / answered
+    return next(level for level, limit in DIFFICULTY_LEVELS if rate < limit)
+
+
+def _quotas(strata: Dict[Tuple[str, str], List[int]], count: int, total: int) -> Dict[Tuple[str, str], int]:
+    # Repartiment proporcional a la mida de cada estrat, per residus més grans
+    exact = {key: len(indices) * count / total for key, indices in strata.items()}
+    quotas = {key: int(value) for key, value in exact.items()}
+    remaining = count - sum(quotas.values())
+    for key in sorted(exact, key=lambda key: exact[key] - quotas[key], reverse=True)[:remaining]:
+        quotas[key] += 1
+    return quotas
+
+
+def generate_variants(bank: Bank, count: int, variants: int, max_overlap: int = VARIANT_MAX_OVERLAP,
+                      seed: int = None) -> Tuple[List[List[int]], Dict[str, Any]]:
+    """
+    Generate exam variants over a bank.
+
+    Every variant takes from each (topic, difficulty) stratum in proportion to
+    its size. Within a stratum the least used questions go first, and a question
+    is skipped while it would make the variant share more than max_overlap
+    percent of its questions with an earlier one; when nothing else is left,
+    the one that adds the least overlap is taken.
+
+    Args:
+    bank -- The compiled bank
+    count -- Questions per variant
+    variants -- Number of variants
+    max_overlap -- Maximum percentage of questions shared by any two variants
+    seed -- Seed of the generation, random by default
+
+    Returns:
+    The variants (lists of bank indices) and statistics about them
+    """
+    rng = random.Random(seed)
+    count = min(count, len(bank))
+    strata: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+    for index, question in enumerate(bank.questions):
+        strata[(question.get('topic', ''), question_difficulty(question))].append(index)
+    quotas = _quotas(strata, count, len(bank))
+    limit = max_overlap * count // 100
+
+    usage = [0] * len(bank)
+    holders: List[List[int]] = [[] for _ in range(len(bank))]
+    result: List[List[int]] = []
+    for number in range(variants):
+        overlap = [0] * number
+        variant = []
+        for key, indices in strata.items():
+            candidates = sorted(indices, key=lambda index: (usage[index], rng.random()))
+            for _ in range(quotas[key]):
+                shared = {index: max((overlap[other] for other in holders[index]), default=0) for index in candidates}
+                index = next((index for index in candidates if shared[index] < limit), None)
+                if index is None:
+                    index = min(candidates, key=shared.get)
+                candidates.remove(index)
+                for other in holders[index]:
+                    overlap[other] += 1
+                variant.append(index)
+        rng.shuffle(variant)
+        for index in variant:
+            usage[index] += 1
+            holders[index].append(number)
+        result.append(variant)
+
+    shared = [len(set(a) & set(b)) for i, a in enumerate(result) for b in result[:i]]
+    stats = {
+        'strata': {f"{topic}/{difficulty}": quotas[(topic, difficulty)] for topic, difficulty in strata},
+        'questions_used': sum(1 for used in usage if used),
+        'max_overlap': max(shared, default=0),
+        'mean_overlap': round(sum(shared) / len(shared), 2) if shared else 0,
+    }
+    return result, stats
+
+
+def build_pool(course: str, files: List[str], bank: Bank, count: int, variants: int) -> Dict[str, Any]:
+    """
+    Generate and persist the pool of variants for a course and file selection.
+
+    Returns:
+    The pool summary (without the variants)
+    """
+    orders, stats = generate_variants(bank, count, variants)
+    pool = {
+        'id': pool_id(course, files),
+        'course': course,
+        'files': sorted(files),
+        'version': bank.version,
+        'tenant': bank.tenant,
+        'count': min(count, len(bank)),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'stats': stats,
+        'variants': orders,
+    }
+    path = _pool_path(pool['id'])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(pool, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    mtime = os.stat(path).st_mtime_ns
+    with _lock:
+        _pools[pool['id']] = (mtime, pool)
+    print(f"Pool {pool['id']}: {variants} variants of {pool['count']} questions, max overlap {stats['max_overlap']}")
+    return {key: value for key, value in pool.items() if key != 'variants'}
+
+
+def load_pool(pid: str, version: str = None) -> Optional[Dict[str, Any]]:
+    """
+    The pool with an id, from memory or from its file.
+
+    Args:
+    pid -- Id of the pool
+    version -- Bank version the pool should be built over: a pool in memory for
+               another version is read again if its file changed (another worker rebuilt it)
+    """
+    with _lock:
+        cached = _pools.get(pid)
+    if cached is not None and (version is None or cached[1]['version'] == version):
+        return cached[1]
+    path = _pool_path(pid)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(path, 'r', encoding='utf-8') as f:
+            pool = json.load(f)
+    except FileNotFoundError:
+        with _lock:
+            _pools.pop(pid, None)
+        return None
+    with _lock:
+        _pools[pid] = (mtime, pool)
+    return pool
+
+
+def list_pools() -> List[Dict[str, Any]]:
+    folder = os.path.join(BANK_CACHE_FOLDER, 'pools')
+    if not os.path.isdir(folder):
+        return []
+    pools = (load_pool(name[:-5]) for name in sorted(os.listdir(folder)) if name.endswith('.json'))
+    return [{key: value for key, value in pool.items() if key != 'variants'} for pool in pools if pool]
+
+
+def hand_out_variant(course: str, files: List[str], bank: Bank) -> Optional[Dict[str, Any]]:
+    """
+    Exam descriptor for the next variant of the pool of a selection, in turn.
+
+    Returns:
+    The descriptor, or None if there is no pool or it was built over another version of the bank
+    """
+    pool = load_pool(pool_id(course, files), bank.version)
+    if pool is None or pool['version'] != bank.version or not pool['variants']:
+        return None
+    with _lock:
+        number = _next_variant.get(pool['id'], 0)
+        _next_variant[pool['id']] = number + 1
+    number %= len(pool['variants'])
+    return {
+        'version': bank.version,
+        'tenant': bank.tenant,
+        'seed': secrets.randbits(63),
+        'count': pool['count'],
+        'variant': f"{pool['id']}:{number}",
+        'order': pool['variants'][number],
+    }
@@ -0,0 +1,11 @@
+"""
+WSGI entry point for examinator: the Flask app, with its background work started.
+
+Run it with any WSGI server, e.g.:
+
+    gunicorn wsgi:app --workers 4
+"""
+# custom imports
+from examinator import app, start_background_tasks
+
+start_background_tasks()